@@ -1,6 +1,7 @@
 import logging
 import math
 import sys
+import time
 import ship
 from station import Station
 
@@ -32,8 +33,8 @@ class Calc(object):
     _, maxjumps = self.jump_count_range(a, b, prev_jcount, allow_long, cargo, jump_decay)
     return maxjumps
 
-  # Gets an estimated range of number of jumps required to jump from a to b
-  def jump_count_range(self, a, b, prev_jcount, allow_long = False, cargo = 0, jump_decay = 0.0):
+  # Gets the distance a single jump can cover after prev_jcount previous jumps
+  def jump_distance(self, prev_jcount, allow_long = False, cargo = 0, jump_decay = 0.0):
     if self.jump_range is not None:
       jumpdist = self.jump_range - (jump_decay * prev_jcount)
     elif self.ship is not None:
@@ -43,7 +44,11 @@ class Calc(object):
         jumpdist = self.ship.range(cargo = cargo * prev_jcount)
     else:
       raise Exception("Tried to calculate jump counts without either valid ship or jump range")
+    return jumpdist
 
+  # Gets an estimated range of number of jumps required to jump from a to b
+  def jump_count_range(self, a, b, prev_jcount, allow_long = False, cargo = 0, jump_decay = 0.0):
+    jumpdist = self.jump_distance(prev_jcount, allow_long, cargo, jump_decay)
     legdist = a.distance_to(b)
 
     minjumps = int(math.ceil(legdist / jumpdist))
@@ -78,6 +83,13 @@ class Calc(object):
     sc = self.sc_cost(b.distance if b.uses_sc else 0.0)
     return (hs_jumps + hs_jdist + sc)
 
+  # The cost to go from a to b using a fully-plotted route between them
+  def solve_cost_routed(self, a, b, leg):
+    hs_jumps = self.time_for_jumps(len(leg)-1) * 2
+    hs_jdist = self.route_dist(leg)
+    sc = self.sc_cost(b.distance if b.uses_sc else 0.0)
+    return (hs_jumps + hs_jdist + sc)
+
   # Gets the cumulative solve cost for a set of legs
   def solve_route_cost(self, route):
     cost = 0.0
@@ -89,7 +101,7 @@ class Calc(object):
   def route_cost(self, route):
     if self.route_strategy in ["trundle", "trunkle"]:
       return self.trundle_cost(route)
-    elif self.route_strategy == "astar":
+    elif self.route_strategy in ["astar", "ch"]:
       return self.astar_cost(route[0], route[-1], route)
     else:
       log.error("Invalid route strategy {0} provided".format(self.route_strategy))
@@ -185,7 +197,9 @@ class Calc(object):
     return (hs_t + sc_t + stn_t)
 
 
-def astar(stars, sys_from, sys_to, valid_neighbour_fn, cost_fn):
+# stars may either be a list of all candidate systems, or a function returning the candidates near a given system
+# If a deadline (as a time.time() value) is provided, gives up and returns None once it has passed
+def astar(stars, sys_from, sys_to, valid_neighbour_fn, cost_fn, deadline = None):
   closedset = set()          # The set of nodes already evaluated.
   openset = set([sys_from])  # The set of tentative nodes to be evaluated, initially containing the start node
   came_from = dict()
@@ -196,6 +210,9 @@ def astar(stars, sys_from, sys_to, valid_neighbour_fn, cost_fn):
   f_score[sys_from] = cost_fn(sys_from, sys_to, [sys_from])
 
   while len(openset) > 0:
+    if deadline is not None and time.time() > deadline:
+      log.debug("A* search ran out of time")
+      return None
     current = min(openset, key=f_score.get)  # the node in openset having the lowest f_score[] value
     if current == sys_to:
       return _astar_reconstruct_path(came_from, sys_to)
@@ -203,7 +220,8 @@ def astar(stars, sys_from, sys_to, valid_neighbour_fn, cost_fn):
     openset.remove(current)
     closedset.add(current)
 
-    neighbor_nodes = [n for n in stars if valid_neighbour_fn(n, current)]
+    candidates = stars(current) if callable(stars) else stars
+    neighbor_nodes = [n for n in candidates if valid_neighbour_fn(n, current)]
 
     path = _astar_reconstruct_path(came_from, current)
 
@@ -0,0 +1,140 @@
+import heapq
+import logging
+import math
+import env
+import sector
+import vector3
+
+log = logging.getLogger("coarseroute")
+
+default_mcode = 'e'
+# How many stars we'd like within jump range before treating a cell as "easy going"
+default_min_neighbours = 8.0
+# How many cells each refined hop should try to cover at once
+default_hop_cells = 3
+
+_neighbour_offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) != (0, 0, 0)]
+
+
+# Plans long trips across a coarse grid of boxels, weighted by how many stars each one holds
+# The result is a list of waypoint systems, one per boxel, for a fine-grained strategy to route between
+# Star counts are fetched lazily as the search expands, so cost scales with the distance travelled
+class CoarseRouter(object):
+  def __init__(self, mcode = default_mcode, min_neighbours = default_min_neighbours, hop_cells = default_hop_cells):
+    self._cell_size = sector.get_mcode_cube_width(mcode)
+    self._min_neighbours = min_neighbours
+    self._hop_cells = hop_cells
+    self._counts = {}
+    self.count_fetches = 0
+
+  @property
+  def cell_size(self):
+    return self._cell_size
+
+  @property
+  def hop_cells(self):
+    return self._hop_cells
+
+  # Cells are aligned to the PG boxel grid for the chosen mcode
+  def get_cell(self, pos):
+    rel = pos - sector.internal_origin_offset
+    return (int(math.floor(rel.x / self._cell_size)), int(math.floor(rel.y / self._cell_size)), int(math.floor(rel.z / self._cell_size)))
+
+  def get_cell_origin(self, cell):
+    return sector.internal_origin_offset + vector3.Vector3(cell[0], cell[1], cell[2]) * self._cell_size
+
+  def get_cell_centre(self, cell):
+    return self.get_cell_origin(cell) + vector3.Vector3(1, 1, 1) * (self._cell_size / 2)
+
+  def _get_count(self, envdata, cell):
+    if cell not in self._counts:
+      origin = self.get_cell_origin(cell)
+      self._counts[cell] = envdata.count_systems_by_aabb(origin, origin + vector3.Vector3(1, 1, 1) * self._cell_size)
+      self.count_fetches += 1
+    return self._counts[cell]
+
+  # Gets the estimated number of jumps needed to cross a cell, or None if it can't be crossed
+  def _get_cell_cost(self, envdata, cell, jump_range):
+    count = self._get_count(envdata, cell)
+    if count == 0:
+      # We can only get past an empty cell by jumping over it
+      return None if jump_range < self._cell_size else (self._cell_size / jump_range) * self._min_neighbours
+    neighbours = count * (4.0 / 3.0 * math.pi * jump_range**3) / self._cell_size**3
+    return (self._cell_size / jump_range) * max(1.0, self._min_neighbours / neighbours)
+
+  # Gets the list of cells between two positions, or None if no way through was found
+  def plan_cells(self, vec_from, vec_to, jump_range, max_expansions = 100000):
+    cell_from = self.get_cell(vec_from)
+    cell_to = self.get_cell(vec_to)
+    # Each cell costs at least cell_size / jump_range jumps to cross, so this never overestimates
+    min_cost_per_cell = 1.0 / jump_range
+    heuristic = lambda c: (self.get_cell_centre(c) - self.get_cell_centre(cell_to)).length * min_cost_per_cell
+
+    with env.use() as envdata:
+      def get_cost(cell):
+        cost = self._get_cell_cost(envdata, cell, jump_range)
+        # The start and end cells must be usable whatever they contain
+        if cost is None and cell in (cell_from, cell_to):
+          cost = (self._cell_size / jump_range) * self._min_neighbours
+        return cost
+
+      g_score = {cell_from: 0.0}
+      came_from = {}
+      openset = [(heuristic(cell_from), cell_from)]
+      closedset = set()
+      while openset:
+        _, current = heapq.heappop(openset)
+        if current == cell_to:
+          path = [current]
+          while current in came_from:
+            current = came_from[current]
+            path.append(current)
+          return list(reversed(path))
+        if current in closedset:
+          continue
+        closedset.add(current)
+        if len(closedset) > max_expansions:
+          log.debug("Coarse route search gave up after {} cells".format(max_expansions))
+          return None
+        current_cost = get_cost(current)
+        for (dx, dy, dz) in _neighbour_offsets:
+          neighbour = (current[0] + dx, current[1] + dy, current[2] + dz)
+          if neighbour in closedset:
+            continue
+          neighbour_cost = get_cost(neighbour)
+          if neighbour_cost is None:
+            continue
+          step = math.sqrt(dx*dx + dy*dy + dz*dz)
+          tentative = g_score[current] + step * (current_cost + neighbour_cost) / 2.0
+          if tentative < g_score.get(neighbour, float('inf')):
+            g_score[neighbour] = tentative
+            came_from[neighbour] = current
+            heapq.heappush(openset, (tentative + heuristic(neighbour), neighbour))
+    return None
+
+  # Gets a list of systems to route via between sys_from and sys_to, one per coarse cell, including both ends
+  def plan(self, sys_from, sys_to, jump_range):
+    cells = self.plan_cells(sys_from.position, sys_to.position, jump_range)
+    if cells is None:
+      return None
+    log.debug("Coarse route crosses {} cells ({} count fetches so far)".format(len(cells), self.count_fetches))
+    waypoints = [sys_from]
+    with env.use() as envdata:
+      for cell in cells[1:-1]:
+        waypoint = self._get_waypoint(envdata, cell, jump_range)
+        if waypoint is not None:
+          waypoints.append(waypoint)
+    waypoints.append(sys_to)
+    return waypoints
+
+  # Gets the star nearest the centre of a cell, looking in a small box first to avoid fetching the whole cell
+  def _get_waypoint(self, envdata, cell, jump_range):
+    centre = self.get_cell_centre(cell)
+    radius = min(jump_range, self._cell_size / 2)
+    while True:
+      stars = [s for s in envdata.find_systems_by_aabb(centre, centre, radius, radius) if self.get_cell(s.position) == cell]
+      if any(stars):
+        return min(stars, key=lambda s: (s.position - centre).length)
+      if radius >= self._cell_size / 2:
+        return None
+      radius = min(radius * 2, self._cell_size / 2)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import array
+import bisect
+import logging
+import os
+import struct
+import sys
+import time
+import env
+import jumpgraph
+import spatial
+import vector3
+
+app_name = "components"
+
+log = logging.getLogger(app_name)
+
+default_filename = 'components.bin'
+
+_file_magic = b'EDCC'
+_file_version = 1
+# magic, version, system count, range count, DB mtime, region centre x/y/z, region radius
+_header_format = '<4sIIIddddd'
+_header_size = struct.calcsize(_header_format)
+
+_u32 = jumpgraph._u32
+_u64 = jumpgraph._get_typecode('QL', 8)
+
+
+def get_default_path(path = env.default_path):
+  return os.path.join(os.path.dirname(env.get_db_path(path)), default_filename)
+
+
+# Finds connected components using union-find, with union by size and path halving
+class _UnionFind(object):
+  def __init__(self, count):
+    self._parent = list(range(count))
+    self._size = [1] * count
+
+  def find(self, i):
+    parent = self._parent
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+
+  def union(self, i, j):
+    i = self.find(i)
+    j = self.find(j)
+    if i == j:
+      return
+    if self._size[i] < self._size[j]:
+      i, j = j, i
+    self._parent[j] = i
+    self._size[i] += self._size[j]
+
+
+# The connected components of the jump graph at a set of jump ranges, keyed by system id64
+# If two systems are in different components at some range, no route between them exists at that range or less
+# When built for a region rather than the whole galaxy, components with members near the edge of the region
+# are "open" (they might connect outside it), so are never used to rule a route out
+class ComponentIndex(object):
+  def __init__(self, id64s, ranges, components, open_components, db_mtime = None, region = None):
+    self._id64s = id64s
+    self._rows = dict((id64, i) for i, id64 in enumerate(id64s))
+    self._ranges = ranges
+    self._components = components
+    self._open = [set(o) for o in open_components]
+    self.db_mtime = db_mtime
+    self.region = region
+
+  @property
+  def ranges(self):
+    return list(self._ranges)
+
+  @property
+  def system_count(self):
+    return len(self._id64s)
+
+  @classmethod
+  def build(cls, systems, ranges, db_mtime = None, region = None):
+    # Systems without an id64 can't be looked up, but can still join up the ones which can
+    systems = list(systems)
+    keyed = [i for i, s in enumerate(systems) if s.id64 is not None]
+    ranges = sorted(set(ranges))
+    components = []
+    open_components = []
+    for jump_range in ranges:
+      start = time.time()
+      grid = spatial.SpatialGrid(jump_range)
+      for i, s in enumerate(systems):
+        grid.insert(i, s.position)
+      uf = _UnionFind(len(systems))
+      for i, j, _ in grid.get_pairs(jump_range):
+        uf.union(i, j)
+      # Number components from 0 in order of first appearance
+      labels = {}
+      all_comps = [labels.setdefault(uf.find(i), len(labels)) for i in range(len(systems))]
+      components.append(array.array(_u32, [all_comps[i] for i in keyed]))
+      edge_comps = set()
+      if region is not None:
+        centre, radius = region
+        edge_comps = set(all_comps[i] for i, s in enumerate(systems) if (s.position - centre).length > radius - jump_range)
+      open_components.append(array.array(_u32, sorted(edge_comps)))
+      log.debug("{:.2f}Ly: {} components ({} open) in {:.2f}s".format(jump_range, len(labels), len(edge_comps), time.time() - start))
+    return cls(array.array(_u64, [systems[i].id64 for i in keyed]), array.array('d', ranges), components, open_components, db_mtime, region)
+
+  @classmethod
+  def build_region(cls, ranges, centre = None, radius = None):
+    with env.use() as envdata:
+      if centre is None:
+        systems = list(envdata.find_all_systems())
+        region = None
+      else:
+        centre = vector3.Vector3(centre[0], centre[1], centre[2])
+        systems = [s for s in envdata.find_systems_by_aabb(centre, centre, radius, radius) if s.distance_to(centre) <= radius]
+        region = (centre, radius)
+    return cls.build(systems, ranges, jumpgraph.get_db_mtime(), region)
+
+  def is_stale(self, db_mtime):
+    return (db_mtime is not None and self.db_mtime != db_mtime)
+
+  # Gets the index of the smallest stored range at least as long as jump_range, or None if there isn't one
+  def _get_range_index(self, jump_range):
+    idx = bisect.bisect_left(self._ranges, jump_range)
+    return idx if idx < len(self._ranges) else None
+
+  # Gets the component a system is in at the given range, or None if it isn't known
+  def get_component(self, sysobj, jump_range):
+    ridx = self._get_range_index(jump_range)
+    row = self._rows.get(sysobj.id64) if sysobj.id64 is not None else None
+    if ridx is None or row is None:
+      return None
+    return self._components[ridx][row]
+
+  # Returns False only if there is definitely no route between two systems at the given range
+  def can_connect(self, sys_from, sys_to, jump_range):
+    ridx = self._get_range_index(jump_range)
+    if ridx is None:
+      return True
+    row_from = self._rows.get(sys_from.id64) if sys_from.id64 is not None else None
+    row_to = self._rows.get(sys_to.id64) if sys_to.id64 is not None else None
+    if row_from is None or row_to is None:
+      return True
+    comp_from = self._components[ridx][row_from]
+    comp_to = self._components[ridx][row_to]
+    if comp_from == comp_to:
+      return True
+    # Only rule the route out if one end can't possibly escape the region
+    return (comp_from in self._open[ridx] and comp_to in self._open[ridx])
+
+  def save(self, filename):
+    centre, radius = self.region if self.region is not None else (vector3.Vector3(0, 0, 0), 0.0)
+    with open(filename, 'wb') as f:
+      f.write(struct.pack(_header_format, _file_magic, _file_version, len(self._id64s), len(self._ranges), self.db_mtime or 0.0, centre.x, centre.y, centre.z, radius))
+      jumpgraph._write_array(f, self._ranges)
+      jumpgraph._write_array(f, self._id64s)
+      for comps, opens in zip(self._components, self._open):
+        jumpgraph._write_array(f, comps)
+        f.write(struct.pack('<I', len(opens)))
+        jumpgraph._write_array(f, array.array(_u32, sorted(opens)))
+    log.debug("Component index saved to {}".format(filename))
+
+  @classmethod
+  def load(cls, filename):
+    if not os.path.isfile(filename):
+      return None
+    with open(filename, 'rb') as f:
+      magic, version, count, range_count, db_mtime, cx, cy, cz, radius = struct.unpack(_header_format, f.read(_header_size))
+      if magic != _file_magic or version != _file_version:
+        log.error("File {} is not a valid component index (version {})".format(filename, _file_version))
+        return None
+      ranges = jumpgraph._read_array(f, 'd', range_count)
+      id64s = jumpgraph._read_array(f, _u64, count)
+      components = []
+      open_components = []
+      for _ in range(range_count):
+        components.append(jumpgraph._read_array(f, _u32, count))
+        (open_count,) = struct.unpack('<I', f.read(4))
+        open_components.append(jumpgraph._read_array(f, _u32, open_count))
+    region = (vector3.Vector3(cx, cy, cz), radius) if radius > 0 else None
+    return cls(id64s, ranges, components, open_components, db_mtime if db_mtime else None, region)
+
+
+if __name__ == '__main__':
+  ap = argparse.ArgumentParser(description = "Find Connected Components", fromfile_prefix_chars="@", parents=[env.arg_parser], prog = app_name)
+  ap.add_argument("-r", "--ranges", type=float, nargs='+', required=True, help="The jump ranges, in Ly, to find components for")
+  ap.add_argument("-c", "--centre", type=str, default=None, help="The system or [x,y,z] coordinates at the centre of the region; defaults to the whole database")
+  ap.add_argument("-d", "--radius", type=float, default=None, help="The radius of the region, in Ly")
+  ap.add_argument("-o", "--output", type=str, default=None, help="The file to write the components to; defaults to alongside the database")
+  args = ap.parse_args(env.local_args)
+
+  start = time.time()
+  centre = None
+  if args.centre is not None:
+    if args.radius is None:
+      log.error("A radius must be provided along with a centre")
+      sys.exit(1)
+    with env.use() as envdata:
+      centre_obj = envdata.parse_system(args.centre)
+    if centre_obj is None:
+      log.error("Could not find centre system \"{}\"!".format(args.centre))
+      sys.exit(1)
+    centre = centre_obj.position
+
+  index = ComponentIndex.build_region(args.ranges, centre, args.radius)
+  output = args.output if args.output is not None else get_default_path()
+  index.save(output)
+  log.info("Wrote components of {} systems at {} ranges to {} in {:.2f}s".format(index.system_count, len(index.ranges), output, time.time() - start))
@@ -0,0 +1,115 @@
+import collections
+import logging
+import math
+import env
+
+log = logging.getLogger("corridor")
+
+default_tile_length = 250.0
+default_tiles_behind = 1
+default_max_tiles = 8
+
+
+# A cylinder of stars along a route, fetched lazily in tiles as a search moves along it
+# The route is split into segments of tile_length; each tile holds the stars whose projection onto
+# the route falls within its segment, and is fetched from the environment on first use
+# When the frontier moves on, tiles further than tiles_behind behind it are evicted; beyond that, the least
+# recently used tiles are evicted to keep to max_tiles, so a search which backtracks can still reuse old tiles
+# Stars are fetched from source (anything with find_systems_by_aabb, such as a TileCache) if provided
+class Corridor(object):
+  def __init__(self, vec_from, vec_to, buffer_ly, tile_length = default_tile_length, tiles_behind = default_tiles_behind, max_tiles = default_max_tiles, source = None):
+    self._from = vec_from
+    self._to = vec_to
+    self._buffer = buffer_ly
+    self._length = (vec_to - vec_from).length
+    self._dir = (vec_to - vec_from).get_normalised() if self._length > 0 else None
+    self._tile_length = tile_length
+    self._tile_count = max(1, int(math.ceil(self._length / tile_length)))
+    self._tiles_behind = tiles_behind
+    self._max_tiles = max(max_tiles, tiles_behind + 2)
+    self._tiles = collections.OrderedDict()
+    self._frontier = 0
+    self._source = source
+    self.fetch_count = 0
+
+  @property
+  def tile_count(self):
+    return self._tile_count
+
+  @property
+  def loaded_tiles(self):
+    return list(self._tiles.keys())
+
+  # Gets the distance along the route of the given position's projection onto it
+  def _project(self, pos):
+    if self._dir is None:
+      return 0.0
+    return (pos - self._from).dot(self._dir)
+
+  def _get_tile_index(self, dist):
+    return min(self._tile_count - 1, max(0, int(dist // self._tile_length)))
+
+  def _in_cylinder(self, pos):
+    if self._dir is None:
+      return ((pos - self._from).length < self._buffer)
+    offset = pos - self._from
+    along = offset.dot(self._dir)
+    return ((offset - self._dir * along).length < self._buffer)
+
+  def _get_tile(self, idx):
+    if idx in self._tiles:
+      # Mark as recently used
+      stars = self._tiles.pop(idx)
+      self._tiles[idx] = stars
+      return stars
+    seg_start = self._from + (self._dir * (idx * self._tile_length)) if self._dir is not None else self._from
+    seg_end = self._from + (self._dir * min(self._length, (idx + 1) * self._tile_length)) if self._dir is not None else self._to
+    if self._source is not None:
+      stars_tmp = self._source.find_systems_by_aabb(seg_start, seg_end, self._buffer, self._buffer)
+    else:
+      with env.use() as envdata:
+        stars_tmp = envdata.find_systems_by_aabb(seg_start, seg_end, self._buffer, self._buffer)
+    self.fetch_count += 1
+    # Neighbouring tiles' boxes overlap, so only keep the stars which belong to this segment
+    stars = [s for s in stars_tmp if self._get_tile_index(self._project(s.position)) == idx and self._in_cylinder(s.position)]
+    log.debug("Fetched corridor tile {0}/{1}: {2} stars".format(idx + 1, self._tile_count, len(stars)))
+    self._tiles[idx] = stars
+    # This tile was used last, so is never the one evicted
+    self._evict_oldest()
+    return stars
+
+  def _evict_behind(self):
+    for idx in [i for i in self._tiles if i < self._frontier - self._tiles_behind]:
+      del self._tiles[idx]
+
+  def _evict_oldest(self):
+    while len(self._tiles) > self._max_tiles:
+      self._tiles.popitem(last=False)
+
+  # Tells the corridor that the search has reached the given position
+  def advance(self, pos):
+    idx = self._get_tile_index(self._project(pos))
+    if idx > self._frontier:
+      self._frontier = idx
+      self._evict_behind()
+
+  def _get_stars_in_range(self, dist_min, dist_max):
+    result = []
+    for idx in range(self._get_tile_index(dist_min), self._get_tile_index(dist_max) + 1):
+      result += self._get_tile(idx)
+    return result
+
+  # Gets all corridor stars within radius of a position
+  def get_stars_near(self, pos, radius):
+    dist = self._project(pos)
+    return [s for s in self._get_stars_in_range(dist - radius, dist + radius) if (s.position - pos).length < radius]
+
+  # Gets all corridor stars within a cylinder of the given radius between two positions
+  def get_stars_between(self, vec_from, vec_to, radius):
+    dist_from = self._project(vec_from)
+    dist_to = self._project(vec_to)
+    stars = self._get_stars_in_range(min(dist_from, dist_to) - radius, max(dist_from, dist_to) + radius)
+    denominator = (vec_to - vec_from).length
+    if denominator == 0:
+      return [s for s in stars if (s.position - vec_from).length < radius]
+    return [s for s in stars if ((s.position - vec_from).cross(s.position - vec_to)).length / denominator < radius]
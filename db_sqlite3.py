@@ -261,6 +261,19 @@ class SQLite3DBConnection(eb.EnvBackend):
     log.debug("Done, {} results.".format(len(results)))
     return [_process_system_result(r) for r in results]
     
+  def count_systems_by_aabb(self, min_x, min_y, min_z, max_x, max_y, max_z, filters = None):
+    c = self._conn.cursor()
+    cmd, params = _construct_query(
+      ['systems'],
+      ['COUNT(*)'],
+      ['? <= systems.pos_x', 'systems.pos_x < ?', '? <= systems.pos_y', 'systems.pos_y < ?', '? <= systems.pos_z', 'systems.pos_z < ?'],
+      [],
+      [min_x, max_x, min_y, max_y, min_z, max_z],
+      filters)
+    log.debug("Executing: {}; params = {}".format(cmd, params))
+    c.execute(cmd, params)
+    return c.fetchone()[0]
+
   def find_systems_by_name(self, name, mode = eb.FIND_EXACT, filters = None):
     # return self.find_systems_by_name_safe(name, mode, filters)
     return self.find_systems_by_name_unsafe(name, mode, filters)
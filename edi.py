@@ -24,6 +24,7 @@ import distance
 import find
 import galmath
 import fuel_usage
+import reachable
 
 
 class EDI(cmd.Cmd):
@@ -109,6 +110,12 @@ class EDI(cmd.Cmd):
   def do_fuel_usage(self, args):
     return self.run_application(fuel_usage, args)
 
+  def help_reachable(self):
+    return self.run_help(reachable)
+
+  def do_reachable(self, args):
+    return self.run_application(reachable, args)
+
   def help_set_verbosity(self):
     print("usage: set_verbosity N")
     print("")
@@ -9,8 +9,12 @@ import env
 import calc as c
 import ship
 import routing as rx
+import components
+import jumpgraph
+import routeindex
 import util
 import solver
+import tilecache
 from station import Station
 from fsd import FSD
 
@@ -44,9 +48,17 @@ class Application(object):
     ap.add_argument("--jump-time", type=float, default=c.default_jump_time, help="Seconds taken per hyperspace jump")
     ap.add_argument("--diff-limit", type=float, default=1.5, help="The multiplier of the fastest route which a route must be over to be discounted")
     ap.add_argument("--slf", type=float, default=c.default_slf, help="The multiplier to apply to multi-jump legs to account for imperfect system positions")
-    ap.add_argument("--route-strategy", default=c.default_strategy, help="The strategy to use for route plotting. Valid options are 'trundle', 'trunkle' and 'astar'")
+    ap.add_argument("--route-strategy", default=c.default_strategy, help="The strategy to use for route plotting. Valid options are 'trundle', 'trunkle', 'astar' and 'ch' (requires --jump-graph)")
     ap.add_argument("--rbuffer", type=float, default=rx.default_rbuffer_ly, help="A minimum buffer distance, in Ly, used to search for valid stars for routing")
     ap.add_argument("--hbuffer", type=float, default=rx.default_hbuffer_ly, help="A minimum buffer distance, in Ly, used to search for valid next legs. Not used by the 'astar' strategy.")
+    ap.add_argument("--processes", type=int, default=None, help="The number of worker processes to plot route legs with; defaults to the number of CPUs")
+    ap.add_argument("--solve-routed", default=False, action='store_true', help="Whether the solver should use fully-plotted routes between stations rather than estimates (slow)")
+    ap.add_argument("--hierarchical", default=False, action='store_true', help="Whether to plan very long legs across coarse boxels first, then route between them with the chosen strategy")
+    ap.add_argument("--jump-graph", type=str, default=None, help="A precomputed jump graph file (see jumpgraph.py) to use for 'astar' and 'ch' routing, or 'default' to use the one alongside the database")
+    ap.add_argument("--tile-cache", default=False, action='store_true', help="Whether to keep the stars fetched for routing in memory, so overlapping legs only read each area once")
+    ap.add_argument("--components", type=str, default=None, help="A precomputed component index (see components.py) used to skip impossible legs, or 'default' to use the one alongside the database")
+    ap.add_argument("--solve-improve", type=float, default=None, help="Spend up to this many seconds improving the solver's result with local search")
+    ap.add_argument("--solve-seed", type=int, default=None, help="The random seed used by the clustered solver modes, for reproducible results")
     ap.add_argument("--solve-mode", type=str, default=solver.CLUSTERED, choices=solver.modes, help="The mode used by the travelling salesman solver")
     ap.add_argument("stations", metavar="system[/station]", nargs="*", help="A station to travel via, in the form 'system/station' or 'system'")
     self.args = ap.parse_args(arg)
@@ -73,6 +85,16 @@ class Application(object):
       else:
         self.ship = None
 
+  # Gets the (full, current) max jump ranges for the leg ending at route index i
+  def get_leg_ranges(self, i):
+    if self.args.jump_range is not None:
+      full_max_jump = self.args.jump_range - (self.args.jump_decay * (i-1))
+      cur_max_jump = full_max_jump
+    else:
+      full_max_jump = self.ship.range(cargo = self.args.cargo * (i-1))
+      cur_max_jump = self.ship.max_range(cargo = self.args.cargo * (i-1)) if self.args.long_jumps else full_max_jump
+    return (full_max_jump, cur_max_jump)
+
   def run(self):
     with env.use() as envdata:
       start = envdata.parse_station(self.args.start)
@@ -108,7 +130,35 @@ class Application(object):
 
     calc = c.Calc(ship=self.ship, jump_range=self.args.jump_range, witchspace_time=self.args.witchspace_time, route_strategy=self.args.route_strategy, slf=self.args.slf)
     r = rx.Routing(calc, self.args.rbuffer, self.args.hbuffer, self.args.route_strategy)
-    s = solver.Solver(calc, r, jump_range, self.args.diff_limit)
+    if self.args.hierarchical:
+      r.set_hierarchical()
+    if self.args.tile_cache:
+      r.set_tile_cache(tilecache.TileCache())
+    if self.args.jump_graph is not None:
+      graph_path = jumpgraph.get_default_path() if self.args.jump_graph == 'default' else self.args.jump_graph
+      if self.args.route_strategy == 'ch':
+        # This brings the graph and its index up to date with the database if necessary
+        index = routeindex.load_or_build(graph_path, jump_range, routeindex.get_jump_cost(calc))
+        r.set_route_index(index)
+        graph = index.graph if index is not None else None
+      else:
+        graph = jumpgraph.JumpGraph.load(graph_path)
+        if graph is not None and graph.is_stale(jumpgraph.get_db_mtime()):
+          log.warning("Warning: jump graph {0} was built from an older database and may be out of date.".format(graph_path))
+      if graph is None:
+        log.warning("Warning: jump graph {0} could not be loaded, ignoring it.".format(graph_path))
+      else:
+        r.set_jump_graph(graph)
+    if self.args.components is not None:
+      components_path = components.get_default_path() if self.args.components == 'default' else self.args.components
+      component_index = components.ComponentIndex.load(components_path)
+      if component_index is None:
+        log.warning("Warning: component index {0} could not be loaded, ignoring it.".format(components_path))
+      elif component_index.is_stale(jumpgraph.get_db_mtime()):
+        log.warning("Warning: component index {0} was built from an older database, ignoring it.".format(components_path))
+      else:
+        r.set_component_index(component_index)
+    s = solver.Solver(calc, r, jump_range, self.args.diff_limit, self.args.solve_routed, self.args.processes, self.args.solve_improve, self.args.solve_seed)
 
     if self.args.ordered:
       route = [start] + stations + [end]
@@ -133,24 +183,30 @@ class Application(object):
     if route is not None and len(route) > 0:
       output_data.append({'src': route[0].to_string()})
 
+      # The legs are independent once the order is fixed, so plot them all up front
+      leg_routes = [None] * len(route)
+      if self.args.route:
+        to_plot = []
+        for i in range(1, len(route)):
+          full_max_jump, cur_max_jump = self.get_leg_ranges(i)
+          _, jumpcount_max = calc.jump_count_range(route[i-1], route[i], i-1, self.args.long_jumps)
+          if route[i-1].system != route[i].system and jumpcount_max > 1:
+            log.debug("Doing route plot for {0} --> {1}".format(route[i-1].system_name, route[i].system_name))
+            to_plot.append((i, (route[i-1].system, route[i].system, cur_max_jump, full_max_jump)))
+          else:
+            leg_routes[i] = [route[i-1].system, route[i].system]
+        plotted = r.plot_many([leg for _, leg in to_plot], self.args.processes)
+        for (i, _), leg_route in zip(to_plot, plotted):
+          leg_routes[i] = leg_route
+
       for i in range(1, len(route)):
         cur_data = {'src': route[i-1], 'dst': route[i]}
 
-        if self.args.jump_range is not None:
-          full_max_jump = self.args.jump_range - (self.args.jump_decay * (i-1))
-          cur_max_jump = full_max_jump
-        else:
-          full_max_jump = self.ship.range(cargo = self.args.cargo * (i-1))
-          cur_max_jump = self.ship.max_range(cargo = self.args.cargo * (i-1)) if self.args.long_jumps else full_max_jump
+        full_max_jump, cur_max_jump = self.get_leg_ranges(i)
 
         cur_data['jumpcount_min'], cur_data['jumpcount_max'] = calc.jump_count_range(route[i-1], route[i], i-1, self.args.long_jumps)
+        leg_route = leg_routes[i]
         if self.args.route:
-          log.debug("Doing route plot for {0} --> {1}".format(route[i-1].system_name, route[i].system_name))
-          if route[i-1].system != route[i].system and cur_data['jumpcount_max'] > 1:
-            leg_route = r.plot(route[i-1].system, route[i].system, cur_max_jump, full_max_jump)
-          else:
-            leg_route = [route[i-1].system, route[i].system]
-
           if leg_route is not None:
             route_jcount = len(leg_route)-1
             # For hoppy routes, always use stats for the jumps reported (less confusing)
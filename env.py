@@ -36,8 +36,11 @@ def register_backend(name, fn):
 def unregister_backend(name):
   del _registered_backends[name]
 
+def get_db_path(path = default_path):
+  return os.path.join(os.path.normpath(path), os.path.normpath(global_args.db_file))
+
 def _get_default_backend(path):
-  db_path = os.path.join(os.path.normpath(path), os.path.normpath(global_args.db_file))
+  db_path = get_db_path(path)
   db_sqlite3.log_versions()
   if not os.path.isfile(db_path):
     log.error("Error: EDDB/Coriolis data not found. Please run update.py to download this data and create the local database.")
@@ -223,6 +226,16 @@ class Env(object):
     max_z = max(vec_from.z, vec_to.z) + buffer_to
     return [system.KnownSystem(s) for s in self._backend.find_systems_by_aabb(min_x, min_y, min_z, max_x, max_y, max_z, filters=self._get_as_filters(filters))]
  
+  def count_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0, filters = None):
+    vec_from = util.get_as_position(vec_from)
+    vec_to = util.get_as_position(vec_to)
+    if vec_from is None or vec_to is None:
+      raise ValueError("could not get a position from input AABB coords")
+    return self._backend.count_systems_by_aabb(
+      min(vec_from.x, vec_to.x) - buffer_from, min(vec_from.y, vec_to.y) - buffer_from, min(vec_from.z, vec_to.z) - buffer_from,
+      max(vec_from.x, vec_to.x) + buffer_to, max(vec_from.y, vec_to.y) + buffer_to, max(vec_from.z, vec_to.z) + buffer_to,
+      filters=self._get_as_filters(filters))
+
   def find_all_systems(self, filters = None, keep_data = False):
     for s in self._backend.find_all_systems(filters=self._get_as_filters(filters)):
       yield _make_known_system(s, keep_data=keep_data)
@@ -296,6 +309,8 @@ class EnvWrapper(object):
 
 
 _open_backends = {}
+# Backends inherited from a parent process; never used or closed, just kept alive
+_inherited_backends = {}
 
 def start(path = default_path, backend = default_backend_name):
   if backend not in _registered_backends:
@@ -326,6 +341,14 @@ def stop(path = default_path, backend = default_backend_name):
   return True
 
 
+def start_worker(path = default_path, backend = default_backend_name):
+  # Worker processes may have inherited the parent's connections, which are not safe to share
+  # Put them to one side and open a fresh environment for this process
+  _inherited_backends.update(_open_backends)
+  _open_backends.clear()
+  return start(path, backend)
+
+
 def use(path = default_path, backend = default_backend_name):
   return EnvWrapper(path, backend)
 
@@ -31,6 +31,9 @@ class EnvBackend(object):
   def find_systems_by_aabb(self, min_x, min_y, min_z, max_x, max_y, max_z, filter = None):
     raise NotImplementedError("Invalid use of base EnvBackend get_systems_by_aabb method")
 
+  def count_systems_by_aabb(self, min_x, min_y, min_z, max_x, max_y, max_z, filter = None):
+    raise NotImplementedError("Invalid use of base EnvBackend count_systems_by_aabb method")
+
   def find_systems_by_name(self, name, mode = FIND_EXACT, filter = None):
     raise NotImplementedError("Invalid use of base EnvBackend find_systems_by_name method")
 
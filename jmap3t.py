@@ -14,6 +14,7 @@ import math
 
 # From Alot's excellent edts suite.
 import pgnames
+import spatial
 
 # Wants, needs, options:
 ############
@@ -1712,10 +1713,18 @@ def radius_on_plane(z,r,z_target):
         r_return = 0
     return r_return
 
+# Put the sectors into a grid, so that membership checks only need to look at the ones nearby.
+def build_ha_sec_grid(sectors):
+    grid = spatial.SphereGrid(HA_GRID_SIZE)
+    for sector in sectors:
+        grid.insert(sector,(sector.x,sector.y,sector.z),sector.r)
+    return grid
+
 # Find which sectors are present at a given position.
 def current_member_of(x,y,z):
     current = []
-    for sector in ha_sec_list:
+    # Only sectors listed in the grid near this position can contain it; they come back in list order.
+    for sector in ha_sec_grid.get_candidates((x,y,z)):
         sx = sector.x
         sy = sector.y
         sz = sector.z
@@ -1729,7 +1738,8 @@ def current_member_of(x,y,z):
 # Find the single primary sector present at a given position.
 def single_member_of(x,y,z):
     current = []
-    for sector in ha_sec_list:
+    # Only sectors listed in the grid near this position can contain it; they come back in list order.
+    for sector in ha_sec_grid.get_candidates((x,y,z)):
         sx = sector.x
         sy = sector.y
         sz = sector.z
@@ -1889,6 +1899,7 @@ POISIZE = 2 # Size of POI markers.
 POI_Z_RANGE = 52 # Z range in which a POI marker will be drawn without a hat.
 PSRSIZE = 1 # Size of pulsar markers.
 PSR_Z_RANGE = 52 # Z range in which a Pulsar marker will be drawn without a hat.  Could make this much larger than the others?
+HA_GRID_SIZE = 200 # Cell size of the grid used to find which ha sectors a position is in.
 TOURISTSIZE = 1 # Size of Tourist markers.
 TOURIST_Z_RANGE = 52 # Z range in which a Tourist marker will be drawn without a hat.
 RARESIZE = 1 # Size of Rare Goods markers
@@ -1918,6 +1929,7 @@ S_MOVE_RATE = 2 # Scaling change.
 filename = 'seclist_ra.csv'
 ha_sec_list = read_sectors_file(filename)
 ha_sec_list.sort(key = lambda sector:sector.priority, reverse = True)
+ha_sec_grid = build_ha_sec_grid(ha_sec_list)
 
 # Compile a list of known ha sector names.
 known_ha_secs = []
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import array
+import logging
+import math
+import os
+import struct
+import sys
+import time
+import env
+import spatial
+import system_internal as system
+import vector3
+
+app_name = "jumpgraph"
+
+log = logging.getLogger(app_name)
+
+default_filename = 'jumpgraph.bin'
+
+_file_magic = b'EDJG'
+_file_version = 2
+# magic, version, node count, edge count, max range, DB mtime, region centre x/y/z, region radius
+_header_format = '<4sIIIdddddd'
+_header_size = struct.calcsize(_header_format)
+# Tolerance when comparing stored (single-precision) edge lengths against a jump range
+_length_tolerance = 0.001
+
+
+def _get_typecode(candidates, size):
+  for tc in candidates:
+    if array.array(tc).itemsize == size:
+      return tc
+  raise RuntimeError("no array typecode available with item size {}".format(size))
+
+_u32 = _get_typecode('IL', 4)
+
+
+def get_default_path(path = env.default_path):
+  return os.path.join(os.path.dirname(env.get_db_path(path)), default_filename)
+
+
+def get_db_mtime(path = env.default_path):
+  db_path = env.get_db_path(path)
+  return os.path.getmtime(db_path) if os.path.isfile(db_path) else None
+
+
+# A precomputed graph of all the jumps up to max_range between a fixed set of systems
+# Stored in CSR form: the edges of node i are targets/lengths[offsets[i]:offsets[i+1]], shortest first
+class JumpGraph(object):
+  def __init__(self, names, id64s, coords, offsets, targets, lengths, max_range, db_mtime = None, region = None):
+    self._names = names
+    self._id64s = id64s
+    self._coords = coords
+    self._offsets = offsets
+    self._targets = targets
+    self._lengths = lengths
+    self.max_range = max_range
+    self.db_mtime = db_mtime
+    # The (centre, radius) of the region the graph covers, if known
+    self.region = region
+    self._index = {}
+    for i, n in enumerate(names):
+      self._index.setdefault(n.lower(), []).append(i)
+    self._nodes = {}
+
+  # Nodes are created on demand in each process; don't copy them to worker processes
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_nodes'] = {}
+    return state
+
+  @classmethod
+  def build(cls, systems, max_range, db_mtime = None, region = None):
+    systems = list(systems)
+    log.debug("Building jump graph for {} systems at {:.2f}Ly...".format(len(systems), max_range))
+    grid = spatial.SpatialGrid(max_range)
+    for i, s in enumerate(systems):
+      grid.insert(i, s.position)
+    adjacency = [[] for _ in systems]
+    for i, j, dist in grid.get_pairs(max_range):
+      adjacency[i].append((dist, j))
+      adjacency[j].append((dist, i))
+
+    coords = array.array('d')
+    offsets = array.array(_u32, [0])
+    targets = array.array(_u32)
+    lengths = array.array('f')
+    for s, edges in zip(systems, adjacency):
+      coords.extend(s.position)
+      # Keep edges shortest-first, so shorter ranges can stop reading early
+      edges.sort()
+      for dist, j in edges:
+        targets.append(j)
+        lengths.append(dist)
+      offsets.append(len(targets))
+    log.debug("Done, {} edges.".format(len(targets)))
+    return cls([s.name for s in systems], [s.id64 for s in systems], coords, offsets, targets, lengths, max_range, db_mtime, region)
+
+  # Builds a graph of all the systems in the database within radius of centre
+  @classmethod
+  def build_region(cls, centre, radius, max_range):
+    centre = vector3.Vector3(centre[0], centre[1], centre[2])
+    with env.use() as envdata:
+      systems = [s for s in envdata.find_systems_by_aabb(centre, centre, radius, radius) if s.distance_to(centre) <= radius]
+    return cls.build(systems, max_range, get_db_mtime(), (centre, radius))
+
+  # Builds a new graph of the same region from the current database
+  def rebuild(self):
+    if self.region is None:
+      log.error("Cannot rebuild a jump graph with no stored region")
+      return None
+    return type(self).build_region(self.region[0], self.region[1], self.max_range)
+
+  @property
+  def node_count(self):
+    return len(self._names)
+
+  @property
+  def edge_count(self):
+    return len(self._targets)
+
+  # Whether the graph was built from a different version of the database to the one at db_mtime
+  def is_stale(self, db_mtime):
+    return (db_mtime is not None and self.db_mtime != db_mtime)
+
+  def get_node(self, idx):
+    if idx not in self._nodes:
+      self._nodes[idx] = system.KnownSystem({
+          'name': self._names[idx],
+          'x': self._coords[idx*3], 'y': self._coords[idx*3+1], 'z': self._coords[idx*3+2],
+          'id64': self._id64s[idx]})
+    return self._nodes[idx]
+
+  def index_of(self, sysobj):
+    if sysobj is None or sysobj.name is None:
+      return None
+    for idx in self._index.get(sysobj.name.lower(), []):
+      x, y, z = self._coords[idx*3 : idx*3+3]
+      pos = sysobj.position
+      if abs(x - pos.x) < 0.01 and abs(y - pos.y) < 0.01 and abs(z - pos.z) < 0.01:
+        return idx
+    return None
+
+  def __contains__(self, sysobj):
+    return (self.index_of(sysobj) is not None)
+
+  # Gets the exact (double-precision) distance between two nodes
+  def get_distance(self, idx1, idx2):
+    c = self._coords
+    dx = c[idx2*3] - c[idx1*3]
+    dy = c[idx2*3+1] - c[idx1*3+1]
+    dz = c[idx2*3+2] - c[idx1*3+2]
+    return math.sqrt(dx*dx + dy*dy + dz*dz)
+
+  # Gets the indexes and lengths of the edges from node idx which are no longer than jump_range
+  def get_edges(self, idx, jump_range = None):
+    limit = (jump_range if jump_range is not None else self.max_range) + _length_tolerance
+    for k in range(self._offsets[idx], self._offsets[idx+1]):
+      if self._lengths[k] > limit:
+        break
+      yield (self._targets[k], self._lengths[k])
+
+  def get_neighbours(self, sysobj, jump_range = None):
+    idx = self.index_of(sysobj)
+    if idx is None:
+      return []
+    return [self.get_node(j) for j, _ in self.get_edges(idx, jump_range)]
+
+  # Whether a route at the given range between these systems can be plotted on this graph
+  def can_route(self, sys_from, sys_to, jump_range):
+    return (jump_range <= self.max_range and sys_from in self and sys_to in self)
+
+  # Gets a function suitable for passing to calc.astar as its list of stars
+  def get_neighbour_fn(self, jump_range):
+    return lambda current: self.get_neighbours(current, jump_range)
+
+  def save(self, filename):
+    namedata = u'\n'.join([u'{0}\t{1}'.format(n, i if i is not None else '') for n, i in zip(self._names, self._id64s)]).encode('utf-8')
+    centre, radius = self.region if self.region is not None else (vector3.Vector3(0, 0, 0), 0.0)
+    with open(filename, 'wb') as f:
+      f.write(struct.pack(_header_format, _file_magic, _file_version, self.node_count, self.edge_count, self.max_range, self.db_mtime or 0.0, centre.x, centre.y, centre.z, radius))
+      f.write(struct.pack('<I', len(namedata)))
+      f.write(namedata)
+      for arr in [self._coords, self._offsets, self._targets, self._lengths]:
+        _write_array(f, arr)
+    log.debug("Jump graph saved to {}".format(filename))
+
+  @classmethod
+  def load(cls, filename):
+    if not os.path.isfile(filename):
+      return None
+    with open(filename, 'rb') as f:
+      magic, version, node_count, edge_count, max_range, db_mtime, cx, cy, cz, radius = struct.unpack(_header_format, f.read(_header_size))
+      if magic != _file_magic or version != _file_version:
+        log.error("File {} is not a valid jump graph (version {})".format(filename, _file_version))
+        return None
+      (namelen,) = struct.unpack('<I', f.read(4))
+      entries = [l.split(u'\t') for l in f.read(namelen).decode('utf-8').split(u'\n')] if node_count else []
+      coords = _read_array(f, 'd', node_count * 3)
+      offsets = _read_array(f, _u32, node_count + 1)
+      targets = _read_array(f, _u32, edge_count)
+      lengths = _read_array(f, 'f', edge_count)
+    names = [e[0] for e in entries]
+    id64s = [int(e[1]) if e[1] else None for e in entries]
+    log.debug("Loaded jump graph from {}: {} systems, {} edges".format(filename, node_count, edge_count))
+    region = (vector3.Vector3(cx, cy, cz), radius) if radius > 0 else None
+    return cls(names, id64s, coords, offsets, targets, lengths, max_range, db_mtime if db_mtime else None, region)
+
+
+# Graph files are always little-endian
+def _write_array(f, arr):
+  if sys.byteorder == 'big':
+    arr = array.array(arr.typecode, arr)
+    arr.byteswap()
+  arr.tofile(f)
+
+def _read_array(f, typecode, count):
+  arr = array.array(typecode)
+  arr.fromfile(f, count)
+  if sys.byteorder == 'big':
+    arr.byteswap()
+  return arr
+
+
+if __name__ == '__main__':
+  ap = argparse.ArgumentParser(description = "Build Jump Graph", fromfile_prefix_chars="@", parents=[env.arg_parser], prog = app_name)
+  ap.add_argument("-r", "--range", type=float, required=True, help="The longest jump, in Ly, to store in the graph")
+  ap.add_argument("-c", "--centre", type=str, default="Sol", help="The system or [x,y,z] coordinates at the centre of the region")
+  ap.add_argument("-d", "--radius", type=float, required=True, help="The radius of the region, in Ly")
+  ap.add_argument("-o", "--output", type=str, default=None, help="The file to write the graph to; defaults to alongside the database")
+  args = ap.parse_args(env.local_args)
+
+  start = time.time()
+  with env.use() as envdata:
+    centre = envdata.parse_system(args.centre)
+  if centre is None:
+    log.error("Could not find centre system \"{}\"!".format(args.centre))
+    sys.exit(1)
+
+  graph = JumpGraph.build_region(centre.position, args.radius, args.range)
+  output = args.output if args.output is not None else get_default_path()
+  graph.save(output)
+  log.info("Wrote jump graph of {} systems and {} jumps to {} in {:.2f}s".format(graph.node_count, graph.edge_count, output, time.time() - start))
@@ -7,6 +7,7 @@ import time
 
 import pgdata
 import sector
+import spatial
 import system_internal as system
 import util
 import vector3
@@ -54,16 +55,12 @@ def get_sector_name(pos, allow_ha=True, format_output=True):
     ha_name = _ha_get_name(pos)
     if ha_name is not None:
       return ha_name
-  offset = _c1_get_offset(pos)
-  if _get_c1_or_c2(offset) == 1:
-    output = _c1_get_name(pos)
-  else:
-    output = _c2_get_name(pos)
+  frags, name, _ = _get_pg_sector_info(_get_pg_index(pos))
   
   if format_output:
-    return format_sector_name(output)
+    return name
   else:
-    return output
+    return list(frags)
 
 
 """
@@ -86,19 +83,108 @@ def get_sector(input, allow_ha = True, get_name = True):
       if ha_name is not None:
         return pgdata.ha_sectors[ha_name.lower()]
     # If we're not checking HA or it's not in such a sector, do PG
-    x = (input.x - sector.base_coords.x) // sector.sector_size
-    y = (input.y - sector.base_coords.y) // sector.sector_size
-    z = (input.z - sector.base_coords.z) // sector.sector_size
+    x, y, z = _get_pg_index(input)
     # Get the name, if we are
-    frags = None
     if get_name:
-      frags = get_sector_name(input, allow_ha=allow_ha, format_output=False)
-    return sector.PGSector(int(x), int(y), int(z), format_sector_name(frags), _get_sector_class(frags))
+      _, name, sc = _get_pg_sector_info((x, y, z))
+      return sector.PGSector(x, y, z, name, sc)
+    return sector.PGSector(x, y, z, None, None)
   else:
     # Assume we have a string, call down to get it by name
     return _get_sector_from_name(input, allow_ha=allow_ha)
 
 
+"""
+Get the names of the sectors that many positions fall within, much faster than calling get_sector_name on each
+
+Args:
+  positions: A list of positions
+  allow_ha: Whether to include hand-authored sectors
+  format_output: Whether or not to format the names or return them as fragments
+
+Returns:
+  A tuple of three lists with one entry per position: the sector names, the sector classes (1, 2 or "ha"),
+  and the indices of the PG sectors containing them
+"""
+def get_sector_names(positions, allow_ha=True, format_output=True):
+  coords = []
+  indices = []
+  for p in positions:
+    pos = util.get_as_position(p)
+    if pos is None:
+      raise ValueError("could not get a position from input {}".format(p))
+    coords.append(tuple(pos))
+    indices.append(_get_pg_index(pos))
+
+  names = [None] * len(coords)
+  classes = [None] * len(coords)
+  if allow_ha:
+    _ha_get_names(coords, indices, names, classes)
+
+  # Each PG sector only needs looking up once, even if there are more than the cache holds
+  known = _get_pg_sector_infos(collections.OrderedDict.fromkeys(idx for i, idx in enumerate(indices) if names[i] is None))
+  for i, idx in enumerate(indices):
+    if names[i] is not None:
+      continue
+    frags, name, classes[i] = known[idx]
+    names[i] = name if format_output else list(frags)
+  return (names, classes, indices)
+
+
+"""
+Get statistics on the cache of PG sector names used by get_sector and get_sector_name
+
+Returns:
+  A dictionary containing keys of hits, misses, size and max_size
+"""
+def get_sector_cache_info():
+  return {'hits': _sector_cache_hits, 'misses': _sector_cache_misses, 'size': len(_sector_cache), 'max_size': _sector_cache_max_size}
+
+
+"""
+Empty the cache of PG sector names, optionally changing how many sectors it can hold
+
+Args:
+  max_size: Optional, the new maximum number of sectors to cache
+"""
+def clear_sector_cache(max_size = None):
+  global _sector_cache_hits, _sector_cache_misses, _sector_cache_max_size
+  _sector_cache.clear()
+  _sector_cache_hits = 0
+  _sector_cache_misses = 0
+  if max_size is not None:
+    _sector_cache_max_size = max_size
+
+
+"""
+Use a precomputed table of PG sector names (see sectortable.py) rather than calculating them
+By default, a table alongside the default database is used if one has been built
+
+Args:
+  table: A SectorTable, or None to go back to calculating names
+"""
+def set_sector_table(table):
+  global _sector_table, _sector_table_checked
+  _sector_table = table
+  _sector_table_checked = True
+
+
+"""
+Get the precomputed table of PG sector names in use, if any
+
+Returns:
+  A SectorTable, or None if names are being calculated
+"""
+def get_sector_table():
+  global _sector_table, _sector_table_checked
+  # Load the default table on first use rather than on import, as sectortable itself uses this module
+  if not _sector_table_checked:
+    _sector_table_checked = True
+    import sectortable
+    _sector_table = sectortable.SectorTable.load(sectortable.get_default_path())
+  return _sector_table
+
+
 """
 Get a system object based on its name or position
 
@@ -179,18 +265,25 @@ def get_sector_fragments(sector_name, allow_long = False):
   # Convert the string to Title Case, then remove spaces
   sector_name = sector_name.title().replace(' ', '')
   segments = []
-  current_str = sector_name
-  while len(current_str) > 0:
-    found = False
-    for frag in pgdata.cx_fragments:
-      if current_str[0:len(frag)] == frag:
-        segments.append(frag)
-        current_str = current_str[len(frag):]
-        found = True
+  start = 0
+  length = len(sector_name)
+  while start < length:
+    # Walk down the trie as far as the name allows, remembering the longest fragment passed
+    node = _fragment_trie
+    frag = None
+    i = start
+    while i < length:
+      node = node.get(sector_name[i])
+      if node is None:
         break
-    if not found:
+      i += 1
+      if None in node:
+        frag = node[None]
+    if frag is None:
       break
-  if len(current_str) == 0 and (allow_long or len(segments) <= _expected_fragment_limit):
+    segments.append(frag)
+    start += len(frag)
+  if start == length and (allow_long or len(segments) <= _expected_fragment_limit):
     return segments
   else:
     return None
@@ -273,6 +366,144 @@ def get_boxel_origin(position, mcode):
   return vector3.Vector3(x, y, z)
 
 
+"""
+Get the name prototypes of every boxel of a given mass code within a sector or region, one at a time
+
+Each boxel is named from the sector containing its centre, in the same way as get_system
+A system's full name is its boxel's prototype followed by its N2, and its id64 is the boxel's plus (N2 << the N2 shift)
+
+Args:
+  region: A sector object or name, or a pair of positions giving the opposite corners of a box
+  mcode: The mass code ('a'-'h') or cube side length
+  allow_ha: Whether to include hand-authored sectors
+
+Yields:
+  Tuples of (name prototype, id64 with an N2 of 0, (x, y, z) boxel centre); when a sector is given, only boxels
+  named from that sector are included, and when a box is given, all boxels whose centres lie within it
+"""
+def get_system_prototypes(region, mcode, allow_ha = True):
+  mc = ord(sector.get_mcode(mcode)) - ord('a')
+  mcode = sector.get_mcode(mcode)
+  cube_width = sector.get_mcode_cube_width(mcode)
+  half_width = cube_width / 2
+  per_sector = int(sector.sector_size // cube_width)
+  origin = tuple(sector.internal_origin_offset)
+  layout = system._id64_layouts[mc]
+
+  # Work out the boxels to walk (counted from the internal origin, as in id64s) and which sector must name them
+  target = region
+  if util.is_str(region):
+    target = get_sector(region, allow_ha=allow_ha)
+    if target is None:
+      raise ValueError("could not find sector {}".format(region))
+  if isinstance(target, sector.PGSector):
+    lo = [int((c - o) // cube_width) for c, o in zip(target.get_origin(), origin)]
+    ranges = [(l, l + per_sector) for l in lo]
+  else:
+    if isinstance(target, sector.Sector):
+      spheres = target.sectors if isinstance(target, sector.HASectorCluster) else [target]
+      box_from = [min(s.centre[i] - s.radius for s in spheres) for i in range(3)]
+      box_to = [max(s.centre[i] + s.radius for s in spheres) for i in range(3)]
+    else:
+      target = None
+      vec_from, vec_to = [util.get_as_position(v) for v in region]
+      if vec_from is None or vec_to is None:
+        raise ValueError("could not get a box from input {}".format(region))
+      box_from = [min(vec_from[i], vec_to[i]) for i in range(3)]
+      box_to = [max(vec_from[i], vec_to[i]) for i in range(3)]
+    ranges = [(int(math.ceil((f - o) / cube_width - 0.5)), int(math.floor((t - o) / cube_width - 0.5)) + 1) for f, t, o in zip(box_from, box_to, origin)]
+  is_pg_target = isinstance(target, sector.PGSector)
+  is_ha_target = (target is not None and not is_pg_target)
+
+  # The boxel at the origin of PG sector (0, 0, 0)
+  base = [int((b - o) // cube_width) for b, o in zip(sector.base_coords, origin)]
+  ha_origins = {}
+  letters = [string.ascii_uppercase[i % 26] + string.ascii_uppercase[(i // 26) % 26] + '-' + string.ascii_uppercase[i // _srp_divisor2] for i in range(_srp_divisor3)]
+  mcode_parts = {}
+
+  # Walk a PG sector at a time, so each only has to check the HA sectors which overlap it
+  sector_ranges = [range((r0 - b) // per_sector, (r1 - 1 - b) // per_sector + 1) for (r0, r1), b in zip(ranges, base)]
+  for psz in sector_ranges[2]:
+    for psy in sector_ranges[1]:
+      for psx in sector_ranges[0]:
+        pso = (base[0] + psx * per_sector, base[1] + psy * per_sector, base[2] + psz * per_sector)
+        crange = [(max(r0, so), min(r1, so + per_sector)) for (r0, r1), so in zip(ranges, pso)]
+        if any(c0 >= c1 for c0, c1 in crange):
+          continue
+        # The HA spheres overlapping this part of the region, in the order they're checked in
+        spheres = []
+        if allow_ha:
+          cfrom = [o + c0 * cube_width for o, (c0, _) in zip(origin, crange)]
+          cto = [o + c1 * cube_width for o, (_, c1) in zip(origin, crange)]
+          for s in pgdata.ha_sectors.values():
+            for sphere in (s.sectors if isinstance(s, sector.HASectorCluster) else [s]):
+              cx, cy, cz = sphere.centre
+              r = sphere.radius
+              if all(c + r >= f and c - r <= t for c, f, t in zip((cx, cy, cz), cfrom, cto)):
+                spheres.append((s, cx, cy, cz, r))
+        if is_ha_target and not any(s.name == target.name for s, _, _, _, _ in spheres):
+          continue
+        pg_name = None
+        for bz in range(*crange[2]):
+          z = origin[2] + bz * cube_width + half_width
+          zbits = ((bz & layout['z_mask']) << layout['z_shift']) | mc
+          for by in range(*crange[1]):
+            y = origin[1] + by * cube_width + half_width
+            yzbits = ((by & layout['y_mask']) << layout['y_shift']) | zbits
+            for bx in range(*crange[0]):
+              x = origin[0] + bx * cube_width + half_width
+              owner = None
+              for s, cx, cy, cz, r in spheres:
+                # Matches HASector.contains exactly
+                dx, dy, dz = cx - x, cy - y, cz - z
+                if math.sqrt(dx*dx + dy*dy + dz*dz) <= r:
+                  owner = s
+                  break
+              if owner is None:
+                if is_ha_target:
+                  continue
+                if pg_name is None:
+                  pg_name = _get_pg_sector_info((psx, psy, psz))[1] + ' '
+                name, so = pg_name, pso
+              else:
+                if is_pg_target or (is_ha_target and owner.name != target.name):
+                  continue
+                if id(owner) not in ha_origins:
+                  ha_origins[id(owner)] = (owner.name + ' ', [int((c - o) // cube_width) for c, o in zip(owner.get_origin(cube_width), origin)])
+                name, so = ha_origins[id(owner)]
+              n1, rem = divmod((bx - so[0]) + _srp_rowlength * (by - so[1]) + _srp_sidelength * (bz - so[2]), _srp_divisor3)
+              if n1 not in mcode_parts:
+                mcode_parts[n1] = ' ' + mcode + ('{}-'.format(n1) if n1 != 0 else '')
+              yield (name + letters[rem] + mcode_parts[n1], ((bx & layout['x_mask']) << layout['x_shift']) | yzbits, (x, y, z))
+
+
+"""
+Get the name prototypes of every boxel of a given mass code within a sector or region, all at once
+
+Args:
+  region: A sector object or name, or a pair of positions giving the opposite corners of a box
+  mcode: The mass code ('a'-'h') or cube side length
+  allow_ha: Whether to include hand-authored sectors
+
+Returns:
+  A tuple of lists with one entry per boxel, as from get_system_prototypes: the name prototypes, the id64s
+  with an N2 of 0, and the X, Y and Z coordinates of the boxel centres
+"""
+def get_system_prototype_lists(region, mcode, allow_ha = True):
+  names = []
+  id64s = []
+  xs = []
+  ys = []
+  zs = []
+  for name, id64, (x, y, z) in get_system_prototypes(region, mcode, allow_ha):
+    names.append(name)
+    id64s.append(id64)
+    xs.append(x)
+    ys.append(y)
+    zs.append(z)
+  return (names, id64s, xs, ys, zs)
+
+
 """
 Parse the given PG system name and return the canonical versions of its individual components
 
@@ -333,7 +564,13 @@ def get_ha_sectors(reference = None, max_distance = None):
     pos_reference = util.get_as_position(reference)
     if pos_reference is None:
       raise ValueError("if provided, reference must be a position, or a System/Sector-like object")
-    result = [(s.name, s) for s in pgdata.ha_sectors.values() if (max_distance is None or (pos_reference - s.centre).length < max_distance)]
+    if max_distance is not None:
+      # Only sectors centred nearby need checking; keep ties in priority order, as a stable sort would
+      nearby = [s for s, _ in _ha_centre_grid.get_near(pos_reference, max_distance + 1.0)]
+      nearby.sort(key=lambda s: _ha_priorities[id(s)])
+      result = [(s.name, s) for s in nearby if (pos_reference - s.centre).length < max_distance]
+    else:
+      result = [(s.name, s) for s in pgdata.ha_sectors.values()]
     result.sort(key=lambda s: (pos_reference - s[1].centre).length)
     return collections.OrderedDict(result)
   else:
@@ -353,6 +590,23 @@ _srp_rowlength = 128
 _srp_sidelength = _srp_rowlength**2
 _expected_fragment_limit = 4
 
+# PG sectors never change, so their names and classes are cached by sector index
+# Each entry takes roughly 500 bytes, so the default limit is around 16MB
+_sector_cache_max_size = 32768
+_sector_cache = collections.OrderedDict()
+_sector_cache_hits = 0
+_sector_cache_misses = 0
+
+# The precomputed table of PG sector names, if there is one
+_sector_table = None
+_sector_table_checked = False
+
+# HA sectors are indexed by their spheres (for containment) and their centres (for distance queries)
+_ha_grid_cell_size = 200.0
+_ha_sector_grid = None
+_ha_centre_grid = None
+_ha_priorities = {}
+
 
 # #
 # Internal functions: shared/HA
@@ -484,9 +738,14 @@ def _get_entry_from_offset(offset, keys, data):
 # Get the sector offset of a position
 def _get_offset_from_pos(pos, galsize):
   sect = get_sector(pos, allow_ha=False, get_name=False) if not isinstance(pos, sector.PGSector) else pos
-  offset  = sect.index[2] * galsize[1] * galsize[0]
-  offset += sect.index[1] * galsize[0]
-  offset += sect.index[0]
+  return _get_offset_from_index(sect, galsize)
+
+
+# Get the sector offset of a PG sector index, relative to the sector containing Sol
+def _get_offset_from_index(idx, galsize):
+  offset  = (idx[2] + sector.base_sector_index[2]) * galsize[1] * galsize[0]
+  offset += (idx[1] + sector.base_sector_index[1]) * galsize[0]
+  offset += (idx[0] + sector.base_sector_index[0])
   return offset
 
 
@@ -503,6 +762,87 @@ def _get_sector_pos_from_offset(offset, galsize):
   return [x, y, z]
 
 
+# Get the index of the PG sector containing a position, relative to the sector containing Sol
+def _get_pg_index(pos):
+  return (int((pos[0] - sector.base_coords.x) // sector.sector_size),
+          int((pos[1] - sector.base_coords.y) // sector.sector_size),
+          int((pos[2] - sector.base_coords.z) // sector.sector_size))
+
+
+# Get the (fragments, formatted name, class) of the PG sector with a given index, using the cache
+# Fragments are returned as a tuple, so copy them before handing them out
+def _get_pg_sector_info(idx):
+  global _sector_cache_hits, _sector_cache_misses
+  info = _sector_cache.pop(idx, None)
+  if info is not None:
+    _sector_cache_hits += 1
+  else:
+    _sector_cache_misses += 1
+    frags, sc = _get_pg_name_from_offset(_get_offset_from_index(idx, sector.galaxy_size))
+    info = (tuple(frags), format_sector_name(frags), sc)
+    while len(_sector_cache) >= _sector_cache_max_size and len(_sector_cache) > 0:
+      _sector_cache.popitem(last=False)
+  # Put it back at the most recently used end
+  _sector_cache[idx] = info
+  return info
+
+
+# Batch version of _get_pg_sector_info, returning a dictionary of index to info
+# Sectors which aren't cached are named together, so class 2 offsets are deinterleaved in one go
+def _get_pg_sector_infos(idxs):
+  global _sector_cache_hits, _sector_cache_misses
+  infos = {}
+  missing = []
+  for idx in idxs:
+    info = _sector_cache.pop(idx, None)
+    if info is not None:
+      _sector_cache_hits += 1
+      _sector_cache[idx] = info
+      infos[idx] = info
+    else:
+      missing.append(idx)
+  _sector_cache_misses += len(missing)
+  results = _get_pg_names_from_offsets([_get_offset_from_index(idx, sector.galaxy_size) for idx in missing])
+  for idx, (frags, sc) in zip(missing, results):
+    info = (tuple(frags), format_sector_name(frags), sc)
+    while len(_sector_cache) >= _sector_cache_max_size and len(_sector_cache) > 0:
+      _sector_cache.popitem(last=False)
+    _sector_cache[idx] = info
+    infos[idx] = info
+  return infos
+
+
+# Batch version of _get_pg_name_from_offset
+def _get_pg_names_from_offsets(offsets):
+  table = get_sector_table()
+  output = []
+  c2 = []
+  for offset in offsets:
+    result = table.get_name(offset) if table is not None else None
+    if result is None:
+      if _get_c1_or_c2(offset) == 1:
+        result = (_c1_get_name_from_offset(offset), 1)
+      else:
+        c2.append((len(output), offset))
+    output.append(result)
+  for (i, _), frags in zip(c2, _c2_get_names_from_offsets([offset for _, offset in c2])):
+    output[i] = (frags, 2)
+  return output
+
+
+# Get the name fragments and class of the PG sector at a given offset
+def _get_pg_name_from_offset(offset):
+  table = get_sector_table()
+  if table is not None:
+    result = table.get_name(offset)
+    if result is not None:
+      return result
+  if _get_c1_or_c2(offset) == 1:
+    return (_c1_get_name_from_offset(offset), 1)
+  else:
+    return (_c2_get_name_from_offset(offset), 2)
+
+
 # Determines whether a given sector should be C1 or C2
 def _get_c1_or_c2(key):
   # Use Jenkins hash
@@ -600,13 +940,41 @@ def _get_system_from_name(input, allow_ha = True):
 
 
 # Get which HA sector this position would be part of, if any
+# Only sectors listed in the position's grid cell can contain it; they come back in priority order
 def _ha_get_name(pos):
-  for (sname, s) in pgdata.ha_sectors.items():
+  for s in _ha_sector_grid.get_candidates(pos):
     if s.contains(pos):
       return s.name
   return None
 
 
+# Fill in the names of the HA sectors that many positions are part of, if any
+# Rather than checking every position against every sector, positions are grouped by the PG sector
+# they're in, and each HA sector only checks the groups its sphere overlaps
+def _ha_get_names(coords, indices, names, classes):
+  groups = collections.defaultdict(list)
+  for i, idx in enumerate(indices):
+    groups[idx].append(i)
+  # Sectors are checked in the same order as _ha_get_name, so the first to contain a position wins
+  for s in pgdata.ha_sectors.values():
+    for sphere in (s.sectors if isinstance(s, sector.HASectorCluster) else [s]):
+      cx, cy, cz = sphere.centre
+      r = sphere.radius
+      lo = [int((c - r - b) // sector.sector_size) for c, b in zip((cx, cy, cz), sector.base_coords)]
+      hi = [int((c + r - b) // sector.sector_size) for c, b in zip((cx, cy, cz), sector.base_coords)]
+      for ix in range(lo[0], hi[0] + 1):
+        for iy in range(lo[1], hi[1] + 1):
+          for iz in range(lo[2], hi[2] + 1):
+            for i in groups.get((ix, iy, iz), []):
+              if names[i] is None:
+                x, y, z = coords[i]
+                # Matches HASector.contains exactly
+                dx, dy, dz = cx - x, cy - y, cz - z
+                if math.sqrt(dx*dx + dy*dy + dz*dz) <= r:
+                  names[i] = s.name
+                  classes[i] = "ha"
+
+
 # #
 # Internal functions: c1-specific
 # #
@@ -655,10 +1023,15 @@ def _c1_get_offset(input):
   else:
     return _c1_get_offset_from_name(input)
 
-def _c1_get_offset_from_name(input):
+def _c1_get_offset_from_name(input, use_table = True):
   frags = get_sector_fragments(input) if util.is_str(input) else input
   if frags is None:
     return None
+  table = get_sector_table() if use_table else None
+  if table is not None:
+    offset = table.get_offset(frags, 1)
+    if offset is not None:
+      return offset
 
   sufs = _get_suffixes(frags[0:-1], True)
   suf_len = len(sufs)
@@ -749,8 +1122,10 @@ def _c1_get_sector(input):
 def _c1_get_name(pos):
   if pos is None:
     return None
-  offset = _c1_get_offset(pos)
+  return _c1_get_name_from_offset(_c1_get_offset(pos))
 
+
+def _c1_get_name_from_offset(offset):
   # Get the current prefix run we're on, and keep the remaining offset
   prefix_cnt, cur_offset = divmod(offset, pgdata.cx_prefix_total_run_length)
   # Work out which prefix we're currently within
@@ -832,7 +1207,19 @@ def _c2_get_sector(input):
 def _c2_get_name_from_offset(offset, format_output=False):
   # Deinterleave the two offsets from the single big one
   cur_idx0, cur_idx1 = util.deinterleave(offset, 32)  # No idea what length this actually is
-  
+  output = _c2_get_name_from_idxs(cur_idx0, cur_idx1)
+  if format_output:
+    output = format_sector_name(output)
+  return output
+
+
+# Batch version of _c2_get_name_from_offset, deinterleaving all the offsets in one go
+def _c2_get_names_from_offsets(offsets):
+  idx0s, idx1s = util.deinterleave_many(offsets, 32)
+  return [_c2_get_name_from_idxs(cur_idx0, cur_idx1) for cur_idx0, cur_idx1 in zip(idx0s, idx1s)]
+
+
+def _c2_get_name_from_idxs(cur_idx0, cur_idx1):
   # Get prefixes/suffixes from the individual offsets
   p0 = _get_entry_from_offset(cur_idx0, _prefix_offsets, _prefix_offsets)
   p1 = _get_entry_from_offset(cur_idx1, _prefix_offsets, _prefix_offsets)
@@ -840,17 +1227,48 @@ def _c2_get_name_from_offset(offset, format_output=False):
   s1 = _get_suffixes(p1)[cur_idx1 - _prefix_offsets[p1][0]]
   
   # Done!
-  output = [p0, s0, p1, s1]
-  if format_output:
-    output = format_sector_name(output)
-  return output
+  return [p0, s0, p1, s1]
 
 
-def _c2_get_offset_from_name(input):
+def _c2_get_offset_from_name(input, use_table = True):
   frags = get_sector_fragments(input) if util.is_str(input) else input
   if frags is None:
     return
+  table = get_sector_table() if use_table else None
+  if table is not None:
+    offset = table.get_offset(frags, 2)
+    if offset is not None:
+      return offset
   
+  idxs = _c2_get_idxs_from_name(frags)
+  if idxs is None:
+    return None
+  # Interleave the individual offsets into one big offset
+  return util.interleave(idxs[0], idxs[1], 32)  # Again, length is anyone's guess
+
+
+# Batch version of _c2_get_offset_from_name, interleaving all the offsets in one go
+# Returns a list with one entry per input, which is None for any name which couldn't be looked up
+def _c2_get_offsets_from_names(inputs, use_table = True):
+  table = get_sector_table() if use_table else None
+  output = []
+  pending = []
+  for input in inputs:
+    frags = get_sector_fragments(input) if util.is_str(input) else input
+    offset = table.get_offset(frags, 2) if (table is not None and frags is not None) else None
+    if offset is None and frags is not None:
+      idxs = _c2_get_idxs_from_name(frags)
+      if idxs is not None:
+        pending.append((len(output), idxs[0], idxs[1]))
+    output.append(offset)
+  offsets = util.interleave_many([p[1] for p in pending], [p[2] for p in pending], 32)
+  for (i, _, _), offset in zip(pending, offsets):
+    output[i] = offset
+  return output
+
+
+# Get the indexes of a class 2 sector's two prefix/suffix pairs within the prefix runs, or None for a bad name
+def _c2_get_idxs_from_name(frags):
   try:
     # Get the current indexes within prefix runs (3037)
     cur_idx0 = _prefix_offsets[frags[0]][0] + _get_suffixes(frags[0]).index(frags[1])
@@ -859,9 +1277,7 @@ def _c2_get_offset_from_name(input):
     # Either the prefix or suffix lookup failed, likely a dodgy name
     log.warning("Failed to look up prefixes/suffixes in _c2_get_offset_from_name; bad sector name?")
     return None
-  
-  # Interleave the individual offsets into one big offset
-  return util.interleave(cur_idx0, cur_idx1, 32)  # Again, length is anyone's guess
+  return (cur_idx0, cur_idx1)
 
   
 # #
@@ -890,10 +1306,38 @@ def _construct_offsets():
     cnt += ilen
 
 
+# Build a trie of all fragments, so names can be split up without trying every fragment at every point
+# Each node is a dict of the next characters, and nodes which complete a fragment store it under None
+_fragment_trie = {}
+def _construct_fragment_trie():
+  global _fragment_trie
+  _fragment_trie = {}
+  for frag in pgdata.cx_fragments:
+    node = _fragment_trie
+    for c in frag:
+      node = node.setdefault(c, {})
+    node[None] = frag
+
+
+# Build the spatial indexes of HA sectors, remembering the order they're checked in
+def _construct_ha_grids():
+  global _ha_sector_grid, _ha_centre_grid, _ha_priorities
+  _ha_sector_grid = spatial.SphereGrid(_ha_grid_cell_size)
+  _ha_centre_grid = spatial.SpatialGrid(_ha_grid_cell_size)
+  _ha_priorities = {}
+  for i, s in enumerate(pgdata.ha_sectors.values()):
+    for sphere in (s.sectors if isinstance(s, sector.HASectorCluster) else [s]):
+      _ha_sector_grid.insert(s, sphere.centre, sphere.radius)
+    _ha_centre_grid.insert(s, s.centre)
+    _ha_priorities[id(s)] = i
+
+
 # #
 # Initialisation
 # #
 
 _init_start = time.clock()
 _construct_offsets()
+_construct_fragment_trie()
+_construct_ha_grids()
 _init_time = time.clock() - _init_start
@@ -275,6 +275,40 @@ if __name__ == '__main__':
 
       log.info("Checked {} sectors, OK: {}, bad: {}".format(len(sectors), ok, bad))
 
+    elif sys.argv[1] == "fragtest":
+      # Compares the fragment parser against the old linear scan over every PG sector name
+      limit = int(sys.argv[2]) if len(sys.argv) > 2 else sector.galaxy_size[0] * sector.galaxy_size[1] * sector.galaxy_size[2]
+
+      def linear_get_fragments(sector_name):
+        sector_name = sector_name.title().replace(' ', '')
+        segments = []
+        current_str = sector_name
+        while len(current_str) > 0:
+          found = False
+          for frag in pgdata.cx_fragments:
+            if current_str[0:len(frag)] == frag:
+              segments.append(frag)
+              current_str = current_str[len(frag):]
+              found = True
+              break
+          if not found:
+            break
+        return segments if len(current_str) == 0 else None
+
+      names = sorted(set(pgnames.format_sector_name(pgnames._get_pg_name_from_offset(offset)[0]) for offset in range(limit)))
+      print("Parsing {0} sector names".format(len(names)))
+
+      start = time.clock()
+      linear = [linear_get_fragments(n) for n in names]
+      linear_time = time.clock() - start
+
+      start = time.clock()
+      trie = [pgnames.get_sector_fragments(n, allow_long=True) for n in names]
+      trie_time = time.clock() - start
+
+      bad = sum(1 for a, b in zip(linear, trie) if a != b)
+      print("Linear: {0:.3f}s, trie: {1:.3f}s ({2:.1f}x), mismatches: {3}".format(linear_time, trie_time, linear_time / trie_time, bad))
+
     elif sys.argv[1] == "eddbspaff":
       with open("edsm_data.txt") as f:
         edsm_sectors = [s.strip() for s in f.readlines() if len(s) > 1]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import env
+import calc as c
+import jumpgraph
+import logging
+import routing as rx
+import sys
+
+app_name = "reachable"
+
+log = logging.getLogger(app_name)
+
+
+class Application(object):
+
+  def __init__(self, arg, hosted, state = {}):
+    ap_parents = [env.arg_parser] if not hosted else []
+    ap = argparse.ArgumentParser(description = "Find Reachable Systems", fromfile_prefix_chars="@", parents = ap_parents, prog = app_name)
+    ap.add_argument("-j", "--jump-range", type=float, required=False, help="The jump range to use; defaults to the current ship's range")
+    ap.add_argument("-n", "--num-jumps", type=int, required=True, help="The maximum number of jumps to make")
+    ap.add_argument("-r", "--max-radius", type=float, required=False, help="Only consider systems within this distance of the start system")
+    ap.add_argument("-l", "--limit", type=int, required=False, default=100000, help="Stop searching after finding this many systems")
+    ap.add_argument("-s", "--summary", default=False, action='store_true', help="Only show the number of systems reachable in each number of jumps")
+    ap.add_argument("--jump-graph", type=str, default=None, help="A precomputed jump graph file (see jumpgraph.py) to search, or 'default' to use the one alongside the database")
+    ap.add_argument("system", metavar="system", type=str, nargs=1, help="The system to start from")
+    self.args = ap.parse_args(arg)
+
+    if self.args.jump_range is None:
+      if 'ship' in state:
+        self.args.jump_range = state['ship'].range()
+      else:
+        log.error("Error: You must specify --jump-range or set a ship.")
+        sys.exit(1)
+
+  def run(self):
+    with env.use() as envdata:
+      start = envdata.parse_system(self.args.system[0])
+    if start is None:
+      log.error("Could not find start system \"{0}\"!".format(self.args.system[0]))
+      return
+
+    r = rx.Routing(c.Calc(), rx.default_rbuffer_ly, rx.default_hbuffer_ly, c.default_strategy)
+    if self.args.jump_graph is not None:
+      graph_path = jumpgraph.get_default_path() if self.args.jump_graph == 'default' else self.args.jump_graph
+      graph = jumpgraph.JumpGraph.load(graph_path)
+      if graph is None:
+        log.warning("Warning: jump graph {0} could not be loaded, ignoring it.".format(graph_path))
+      else:
+        r.set_jump_graph(graph)
+
+    print("")
+    print("Systems reachable from {0} at {1:.2f}Ly:".format(start.name, self.args.jump_range))
+    print("")
+    total = 0
+    for jumps, layer in r.find_reachable(start, self.args.jump_range, self.args.num_jumps, self.args.max_radius, self.args.limit):
+      if jumps == 0:
+        continue
+      total += len(layer)
+      print("  {0} jump{1}: {2} system{3}".format(jumps, '' if jumps == 1 else 's', len(layer), '' if len(layer) == 1 else 's'))
+      if not self.args.summary:
+        layer.sort(key=lambda s: s.distance_to(start))
+        for s in layer:
+          print("    {0} ({1:.2f}Ly)".format(s.name, s.distance_to(start)))
+        print("")
+    if self.args.summary:
+      print("")
+    print("  {0} system{1} reachable in total".format(total, '' if total == 1 else 's'))
+    print("")
+
+
+if __name__ == '__main__':
+  env.start()
+  a = Application(env.local_args, False)
+  a.run()
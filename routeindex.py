@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import array
+import heapq
+import logging
+import os
+import struct
+import sys
+import time
+import env
+import jumpgraph
+
+app_name = "routeindex"
+
+log = logging.getLogger(app_name)
+
+_file_magic = b'EDCH'
+_file_version = 1
+# magic, version, node count, edge count, jump range, jump cost, DB mtime
+_header_format = '<4sIIIddd'
+_header_size = struct.calcsize(_header_format)
+
+_i32 = jumpgraph._get_typecode('il', 4)
+_u32 = jumpgraph._u32
+
+
+def get_default_path(graph_path, jump_range):
+  return '{0}.{1:.2f}.ch'.format(os.path.splitext(graph_path)[0], jump_range)
+
+
+# The cost of a single extra jump, used as the static per-edge weight alongside its distance
+def get_jump_cost(calc):
+  return calc.time_for_jumps(2) - calc.time_for_jumps(1)
+
+
+# A contraction hierarchy over a jump graph for one fixed jump range
+# Each node only stores its edges to higher-ranked nodes (including shortcuts past lower-ranked ones),
+# so a query is a pair of small upward searches from each end which meet at the top of the route
+class RouteIndex(object):
+  def __init__(self, graph, offsets, targets, weights, middles, jump_range, jump_cost, db_mtime = None):
+    self._graph = graph
+    self._offsets = offsets
+    self._targets = targets
+    self._weights = weights
+    # For shortcuts, the node skipped over; -1 for real jumps
+    self._middles = middles
+    self.jump_range = jump_range
+    self.jump_cost = jump_cost
+    self.db_mtime = db_mtime
+
+  @property
+  def graph(self):
+    return self._graph
+
+  @property
+  def edge_count(self):
+    return len(self._targets)
+
+  @classmethod
+  def build(cls, graph, jump_range, jump_cost):
+    start = time.time()
+    n = graph.node_count
+    # The current edges of each uncontracted node, as {neighbour: (weight, middle)}
+    adj = [{} for _ in range(n)]
+    for i in range(n):
+      for j, _ in graph.get_edges(i, jump_range):
+        dist = graph.get_distance(i, j)
+        if dist < jump_range:
+          adj[i][j] = (jump_cost + dist, -1)
+    up = [None] * n
+    deleted = [0] * n
+
+    def get_priority(v):
+      shortcuts = _get_shortcuts(adj, v)
+      return (len(shortcuts) - len(adj[v]) + deleted[v], shortcuts)
+
+    queue = [(len(adj[v]), v) for v in range(n)]
+    heapq.heapify(queue)
+    contracted = 0
+    while queue:
+      _, v = heapq.heappop(queue)
+      # Priorities go stale as neighbours are contracted, so recheck before committing to this node
+      priority, shortcuts = get_priority(v)
+      if queue and priority > queue[0][0]:
+        heapq.heappush(queue, (priority, v))
+        continue
+      up[v] = [(u, w, m) for u, (w, m) in adj[v].items()]
+      for u in adj[v]:
+        del adj[u][v]
+        deleted[u] += 1
+      for a, b, cost in shortcuts:
+        if b not in adj[a] or adj[a][b][0] > cost:
+          adj[a][b] = (cost, v)
+          adj[b][a] = (cost, v)
+      adj[v] = None
+      contracted += 1
+      if contracted % 1000 == 0:
+        log.debug("Contracted {}/{} nodes".format(contracted, n))
+
+    offsets = array.array(_u32, [0])
+    targets = array.array(_u32)
+    weights = array.array('d')
+    middles = array.array(_i32)
+    for edges in up:
+      for u, w, m in edges:
+        targets.append(u)
+        weights.append(w)
+        middles.append(m)
+      offsets.append(len(targets))
+    log.debug("Built route index for {} nodes with {} upward edges in {:.2f}s".format(n, len(targets), time.time() - start))
+    return cls(graph, offsets, targets, weights, middles, jump_range, jump_cost, graph.db_mtime)
+
+  # Whether this index was built from the given graph with the given settings
+  def matches(self, graph, jump_range, jump_cost):
+    return (self.db_mtime == graph.db_mtime
+        and len(self._offsets) == graph.node_count + 1
+        and abs(self.jump_range - jump_range) < 0.001
+        and abs(self.jump_cost - jump_cost) < 0.001)
+
+  # Routes from the index are valid for any range at least as long as the one it was built for
+  def can_route(self, sys_from, sys_to, jump_range):
+    return (self.jump_range <= jump_range and sys_from in self._graph and sys_to in self._graph)
+
+  # Gets the (cost, list of node indexes) of the best route between two nodes, or (None, None)
+  def query(self, src, dst):
+    if src == dst:
+      return (0.0, [src])
+    dist = [{src: 0.0}, {dst: 0.0}]
+    parent = [{src: None}, {dst: None}]
+    queues = [[(0.0, src)], [(0.0, dst)]]
+    best = float('inf')
+    meet = None
+    while queues[0] or queues[1]:
+      for side in (0, 1):
+        if not queues[side]:
+          continue
+        d, u = heapq.heappop(queues[side])
+        if d > dist[side][u]:
+          continue
+        if d >= best:
+          # Nothing further on this side can improve on what we've got
+          queues[side] = []
+          continue
+        other = dist[1 - side].get(u)
+        if other is not None and d + other < best:
+          best = d + other
+          meet = u
+        for k in range(self._offsets[u], self._offsets[u+1]):
+          w = self._targets[k]
+          nd = d + self._weights[k]
+          if nd < dist[side].get(w, float('inf')):
+            dist[side][w] = nd
+            parent[side][w] = (u, self._middles[k])
+            heapq.heappush(queues[side], (nd, w))
+    if meet is None:
+      return (None, None)
+
+    path = [meet]
+    node = meet
+    while parent[0][node] is not None:
+      prev, middle = parent[0][node]
+      path = self._unpack(prev, node, middle)[:-1] + path
+      node = prev
+    node = meet
+    while parent[1][node] is not None:
+      prev, middle = parent[1][node]
+      path = path + self._unpack(node, prev, middle)[1:]
+      node = prev
+    return (best, path)
+
+  # Expands an edge into the real jumps it represents, including both ends
+  def _unpack(self, a, b, middle):
+    if middle < 0:
+      return [a, b]
+    return self._unpack(a, middle, self._get_middle(middle, a))[:-1] + self._unpack(middle, b, self._get_middle(middle, b))
+
+  # Gets the middle of the edge up from node to target
+  def _get_middle(self, node, target):
+    for k in range(self._offsets[node], self._offsets[node+1]):
+      if self._targets[k] == target:
+        return self._middles[k]
+    raise ValueError("route index is missing an edge from {} to {}".format(node, target))
+
+  def get_route(self, sys_from, sys_to):
+    src = self._graph.index_of(sys_from)
+    dst = self._graph.index_of(sys_to)
+    if src is None or dst is None:
+      return None
+    _, path = self.query(src, dst)
+    if path is None:
+      return None
+    # Hand back the caller's own objects for the ends
+    return [sys_from] + [self._graph.get_node(i) for i in path[1:-1]] + [sys_to] if len(path) > 1 else [sys_from]
+
+  def save(self, filename):
+    with open(filename, 'wb') as f:
+      f.write(struct.pack(_header_format, _file_magic, _file_version, len(self._offsets) - 1, self.edge_count, self.jump_range, self.jump_cost, self.db_mtime or 0.0))
+      for arr in [self._offsets, self._targets, self._weights, self._middles]:
+        jumpgraph._write_array(f, arr)
+    log.debug("Route index saved to {}".format(filename))
+
+  @classmethod
+  def load(cls, filename, graph):
+    if not os.path.isfile(filename):
+      return None
+    with open(filename, 'rb') as f:
+      magic, version, node_count, edge_count, jump_range, jump_cost, db_mtime = struct.unpack(_header_format, f.read(_header_size))
+      if magic != _file_magic or version != _file_version:
+        log.warning("File {} is not a valid route index (version {})".format(filename, _file_version))
+        return None
+      offsets = jumpgraph._read_array(f, _u32, node_count + 1)
+      targets = jumpgraph._read_array(f, _u32, edge_count)
+      weights = jumpgraph._read_array(f, 'd', edge_count)
+      middles = jumpgraph._read_array(f, _i32, edge_count)
+    return cls(graph, offsets, targets, weights, middles, jump_range, jump_cost, db_mtime if db_mtime else None)
+
+
+# Finds the shortcuts needed to contract node v without lengthening any route between its neighbours
+# Witnesses are only looked for up to two jumps long; missing one just costs an unnecessary shortcut
+def _get_shortcuts(adj, v):
+  shortcuts = []
+  nbrs = list(adj[v].items())
+  for i, (a, (wa, _)) in enumerate(nbrs):
+    adj_a = adj[a]
+    for b, (wb, _) in nbrs[i+1:]:
+      cost = wa + wb
+      direct = adj_a.get(b)
+      if direct is not None and direct[0] <= cost:
+        continue
+      adj_b = adj[b]
+      small, large = (adj_a, adj_b) if len(adj_a) < len(adj_b) else (adj_b, adj_a)
+      witnessed = False
+      for x, (wx, _) in small.items():
+        other = large.get(x)
+        if other is not None and x != v and wx + other[0] <= cost:
+          witnessed = True
+          break
+      if not witnessed:
+        shortcuts.append((a, b, cost))
+  return shortcuts
+
+
+# Loads the route index for a jump graph, rebuilding the graph and/or index if the database has changed
+def load_or_build(graph_path, jump_range, jump_cost, index_path = None):
+  graph = jumpgraph.JumpGraph.load(graph_path)
+  if graph is None:
+    log.error("Could not load jump graph {}".format(graph_path))
+    return None
+  if graph.is_stale(jumpgraph.get_db_mtime()):
+    log.info("Database has changed since jump graph {} was built, rebuilding it...".format(graph_path))
+    new_graph = graph.rebuild()
+    if new_graph is not None:
+      graph = new_graph
+      graph.save(graph_path)
+  if index_path is None:
+    index_path = get_default_path(graph_path, jump_range)
+  index = RouteIndex.load(index_path, graph)
+  if index is None or not index.matches(graph, jump_range, jump_cost):
+    log.info("Building route index for {:.2f}Ly, this may take a while...".format(jump_range))
+    index = RouteIndex.build(graph, jump_range, jump_cost)
+    index.save(index_path)
+  return index
+
+
+if __name__ == '__main__':
+  import calc as c
+  ap = argparse.ArgumentParser(description = "Build Route Index", fromfile_prefix_chars="@", parents=[env.arg_parser], prog = app_name)
+  ap.add_argument("-r", "--range", type=float, required=True, help="The jump range, in Ly, to build the index for")
+  ap.add_argument("-g", "--graph", type=str, default=None, help="The jump graph to index; defaults to the one alongside the database")
+  ap.add_argument("-o", "--output", type=str, default=None, help="The file to write the index to; defaults to alongside the jump graph")
+  ap.add_argument("-w", "--witchspace-time", type=int, default=c.default_ws_time, help="Time in seconds spent in hyperspace jump")
+  args = ap.parse_args(env.local_args)
+
+  graph_path = args.graph if args.graph is not None else jumpgraph.get_default_path()
+  index = load_or_build(graph_path, args.range, get_jump_cost(c.Calc(witchspace_time=args.witchspace_time)), args.output)
+  if index is None:
+    sys.exit(1)
+  log.info("Route index for {:.2f}Ly has {} upward edges".format(index.jump_range, index.edge_count))
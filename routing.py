@@ -1,8 +1,15 @@
+import collections
 import logging
 import calc
+import coarseroute
+import corridor
 import env
 import math
+import multiprocessing
+import spatial
 import sys
+import time
+import vector3
 
 log = logging.getLogger("route")
 
@@ -10,6 +17,16 @@ default_rbuffer_ly = 40.0
 default_hbuffer_ly = 10.0
 hbuffer_relax_increment = 5.0
 hbuffer_relax_max = 31.0
+# Legs longer than this fetch their stars lazily in tiles, rather than all at once
+default_corridor_min_length = 1000.0
+# When hierarchical routing is on, legs longer than this are planned across coarse boxels first
+default_hierarchical_min_length = 2000.0
+# Below this many legs (or groups of legs), plot_many plots them in this process, as starting a pool costs more
+default_parallel_min_legs = 4
+
+
+class _TimeBudgetExceeded(Exception):
+  pass
 
 
 class Routing(object):
@@ -28,6 +45,32 @@ class Routing(object):
     self._trunkle_leg_size = 5.0
     self._trunkle_search_radius = 10.0
     self._trunkle_search_radius_relax_mul = 0.01
+    self._corridor_min_length = default_corridor_min_length
+    self._corridor_tile_length = corridor.default_tile_length
+    self._jump_graph = None
+    self._route_index = None
+    self._coarse = None
+    self._tile_cache = None
+    self._components = None
+    self._hierarchical_min_length = default_hierarchical_min_length
+    # Anytime mode state, only used while inside plot_anytime
+    self._deadline = None
+    self._anytime_active = False
+    self._anytime_bound = None
+    self._anytime_callback = None
+    self._incumbent = None
+    self._incumbent_cost = None
+
+  # Only the settings are needed by worker processes; anytime state belongs to a call in progress here
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_deadline'] = None
+    state['_anytime_active'] = False
+    state['_anytime_bound'] = None
+    state['_anytime_callback'] = None
+    state['_incumbent'] = None
+    state['_incumbent_cost'] = None
+    return state
 
   def lerp(self, in_min, in_max, out_min, out_max, value):
     if in_max == in_min:
@@ -54,41 +97,365 @@ class Routing(object):
 
     return candidates
 
-  def plot(self, sys_from, sys_to, jump_range, full_range = None):
+  def plot(self, sys_from, sys_to, jump_range, full_range = None, starcache = None):
     if full_range is None:
       full_range = jump_range
 
+    if not self._can_connect(sys_from, sys_to, jump_range):
+      return None
+    return self._plot_strategy(sys_from, sys_to, jump_range, full_range, starcache)
+
+  def _can_connect(self, sys_from, sys_to, jump_range):
+    if self._components is not None and not self._components.can_connect(sys_from, sys_to, jump_range):
+      log.debug("{0} and {1} are not connected at {2:.2f}Ly, not searching".format(sys_from.name, sys_to.name, jump_range))
+      return False
+    return True
+
+  def _plot_strategy(self, sys_from, sys_to, jump_range, full_range, starcache = None):
+    if self._coarse is not None and starcache is None and sys_from.distance_to(sys_to) >= self._hierarchical_min_length:
+      return self.plot_hierarchical(sys_from, sys_to, jump_range, full_range)
+    return self._plot_fine(sys_from, sys_to, jump_range, full_range, starcache)
+
+  def _plot_fine(self, sys_from, sys_to, jump_range, full_range, starcache = None):
     if self._route_strategy == "trundle":
       # My algorithm - slower but pinpoint
-      return self.plot_trundle(sys_from, sys_to, jump_range, full_range)
+      return self.plot_trundle(sys_from, sys_to, jump_range, full_range, starcache = starcache)
     elif self._route_strategy == "trunkle":
-      return self.plot_trunkle(sys_from, sys_to, jump_range, full_range)
+      return self.plot_trunkle(sys_from, sys_to, jump_range, full_range, starcache = starcache)
     elif self._route_strategy == "astar":
       # A* search - faster but worse fuel efficiency
-      return self.plot_astar(sys_from, sys_to, jump_range, full_range)
+      return self.plot_astar(sys_from, sys_to, jump_range, full_range, starcache = starcache)
+    elif self._route_strategy == "ch":
+      # Precomputed contraction hierarchy - near-instant, but only within the indexed region
+      return self.plot_ch(sys_from, sys_to, jump_range, full_range, starcache = starcache)
     else:
       log.error("Tried to use invalid route strategy {0}".format(self._route_strategy))
       return None
 
-  def plot_astar(self, sys_from, sys_to, jump_range, full_range):
+  # Plots a route, giving up searching once time_budget seconds have passed
+  # Returns a tuple of (route, gap) using the best complete route found so far, or (None, None) if none was
+  # The gap is how far the route's jump count is above the straight-line lower bound, as a fraction of
+  # that bound; a gap of 0.0 means the route cannot be beaten on jump count
+  # If provided, callback(route, gap) is called every time a better route is found
+  def plot_anytime(self, sys_from, sys_to, jump_range, full_range = None, starcache = None, time_budget = None, callback = None):
+    if full_range is None:
+      full_range = jump_range
+
+    if not self._can_connect(sys_from, sys_to, jump_range):
+      return (None, None)
+
+    self._anytime_active = True
+    self._anytime_bound = max(1, self.best_jump_count(sys_from, sys_to, jump_range))
+    self._anytime_callback = callback
+    self._incumbent = None
+    self._incumbent_cost = None
+    self._deadline = (time.time() + time_budget) if time_budget is not None else None
+    try:
+      # Get something quick and dirty in the bag first, then try to improve on it
+      self._offer_route(self.plot_greedy(sys_from, sys_to, jump_range, starcache))
+      if self._get_gap(self._incumbent) != 0.0:
+        self._offer_route(self._plot_strategy(sys_from, sys_to, jump_range, full_range, starcache))
+    except _TimeBudgetExceeded:
+      log.debug("Time budget exceeded, using best route found so far")
+    finally:
+      route = self._incumbent
+      gap = self._get_gap(route)
+      self._anytime_active = False
+      self._anytime_callback = None
+      self._incumbent = None
+      self._incumbent_cost = None
+      self._deadline = None
+    return (route, gap)
+
+  def _check_deadline(self):
+    if self._deadline is not None and time.time() > self._deadline:
+      raise _TimeBudgetExceeded()
+
+  def _get_gap(self, route):
+    if route is None:
+      return None
+    return max(0.0, float(len(route) - 1 - self._anytime_bound) / self._anytime_bound)
+
+  # Records a complete route if it's better than the best one found so far in anytime mode
+  def _offer_route(self, route):
+    if not self._anytime_active or route is None:
+      return
+    cost = self._calc.trundle_cost(route)
+    if self._incumbent_cost is None or cost < self._incumbent_cost:
+      self._incumbent = route
+      self._incumbent_cost = cost
+      log.debug("New best route: {0} jumps, cost {1:.2f}".format(len(route)-1, cost))
+      if self._anytime_callback is not None:
+        self._anytime_callback(route, self._get_gap(route))
+
+  # Plots a route by always jumping to the star in range which is closest to the destination
+  # Very fast, but gives up if it ever fails to make progress
+  # If provided, cor is a corridor already covering the route, which is used instead of fetching stars
+  def plot_greedy(self, sys_from, sys_to, jump_range, starcache = None, cor = None):
     rbuffer_ly = self._rbuffer_base
+    if cor is None and self._use_corridor(sys_from, sys_to, starcache):
+      cor = self._get_corridor(sys_from, sys_to)
+    elif cor is None:
+      if starcache is not None:
+        stars_tmp = starcache
+      else:
+        stars_tmp = self._find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
+      stars = self.cylinder(stars_tmp, sys_from.position, sys_to.position, rbuffer_ly) if sys_from != sys_to else stars_tmp
+
+    route = [sys_from]
+    sys_cur = sys_from
+    while sys_cur.distance_to(sys_to) >= jump_range:
+      self._check_deadline()
+      if cor is not None:
+        cor.advance(sys_cur.position)
+        candidates = cor.get_stars_near(sys_cur.position, jump_range)
+      else:
+        candidates = self.circle(stars, sys_cur.position, jump_range)
+      cur_dist = sys_cur.distance_to(sys_to)
+      best = None
+      best_dist = cur_dist
+      for s in candidates:
+        dist = s.distance_to(sys_to)
+        if dist < best_dist:
+          best = s
+          best_dist = dist
+      if best is None:
+        log.debug("Greedy route got stuck at {0}".format(sys_cur.name))
+        return None
+      route.append(best)
+      sys_cur = best
+    if sys_cur != sys_to:
+      route.append(sys_to)
+    return route
+
+  # Plots a set of independent legs, each a tuple of (sys_from, sys_to, jump_range, full_range)
+  # Legs are farmed out to a pool of worker processes, each with its own environment
+  # If share_stars is set, legs from the same origin whose search areas overlap are plotted
+  # together using a single star fetch
+  # Only a few legs are plotted in this process instead, as starting the pool would take longer than plotting them
+  # Results are returned in the same order as the input legs
+  def plot_many(self, legs, processes = None, share_stars = False):
+    legs = list(legs)
+    groups = self._group_legs(legs) if share_stars else [[i] for i in range(len(legs))]
+    if processes is None:
+      processes = multiprocessing.cpu_count()
+    processes = min(processes, len(groups))
+
+    results = [None] * len(legs)
+    if processes <= 1 or len(groups) < default_parallel_min_legs:
+      for group in groups:
+        for idx, route in self._plot_group([(i, legs[i]) for i in group]):
+          results[idx] = route
+      return results
+
+    # Start the longest legs first, so one slow leg doesn't get left until the end
+    groups.sort(key=lambda g: max(legs[i][0].distance_to(legs[i][1]) for i in g), reverse=True)
+    log.debug("Plotting {0} legs in {1} groups using {2} processes".format(len(legs), len(groups), processes))
+    pool = multiprocessing.Pool(processes, initializer=_plot_worker_init, initargs=(self, env.default_path, env.default_backend_name))
+    try:
+      for group_result in pool.imap_unordered(_plot_worker, [[(i, legs[i]) for i in g] for g in groups]):
+        for idx, route in group_result:
+          results[idx] = route
+    finally:
+      pool.close()
+      pool.join()
+    return results
+
+  # Groups leg indexes by origin, keeping only legs whose search boxes overlap enough to be worth sharing
+  # Legs long enough for the hierarchical or corridor routers are left alone, as a shared star fetch would stop them being used
+  def _group_legs(self, legs):
+    by_origin = collections.OrderedDict()
+    groups = []
+    for i, leg in enumerate(legs):
+      if self._is_long_leg(leg[0], leg[1]):
+        groups.append([i])
+      else:
+        by_origin.setdefault((leg[0], leg[2], leg[3]), []).append(i)
+    for idxs in by_origin.values():
+      if len(idxs) > 1:
+        # Only share if the combined box is no bigger than the separate boxes would have been
+        separate = sum(_aabb_volume(*self._get_leg_aabb([legs[i]])) for i in idxs)
+        combined = _aabb_volume(*self._get_leg_aabb([legs[i] for i in idxs]))
+        if combined <= separate:
+          groups.append(idxs)
+          continue
+      groups += [[i] for i in idxs]
+    return groups
+
+  def _get_leg_aabb(self, legs):
+    rbuffer_ly = self._rbuffer_base
+    positions = [leg[0].position for leg in legs] + [leg[1].position for leg in legs]
+    vec_min = vector3.Vector3(min(p.x for p in positions), min(p.y for p in positions), min(p.z for p in positions))
+    vec_max = vector3.Vector3(max(p.x for p in positions), max(p.y for p in positions), max(p.z for p in positions))
+    return (vec_min - (rbuffer_ly, rbuffer_ly, rbuffer_ly), vec_max + (rbuffer_ly, rbuffer_ly, rbuffer_ly))
+
+  def _plot_group(self, indexed_legs):
+    starcache = None
+    if len(indexed_legs) > 1:
+      vec_from, vec_to = self._get_leg_aabb([leg for _, leg in indexed_legs])
+      starcache = self._find_systems_by_aabb(vec_from, vec_to)
+    return [(idx, self.plot(*leg, starcache = starcache)) for idx, leg in indexed_legs]
+
+  def _use_corridor(self, sys_from, sys_to, starcache):
+    return (starcache is None and self._corridor_min_length is not None and sys_from.distance_to(sys_to) > self._corridor_min_length)
+
+  # Whether a leg would be plotted hierarchically or through a corridor, given no starcache
+  def _is_long_leg(self, sys_from, sys_to):
+    if self._coarse is not None and sys_from.distance_to(sys_to) >= self._hierarchical_min_length:
+      return True
+    return self._use_corridor(sys_from, sys_to, None)
+
+  def _get_corridor(self, sys_from, sys_to):
+    log.debug("Using tiled corridor for {0} --> {1}".format(sys_from.name, sys_to.name))
+    return corridor.Corridor(sys_from.position, sys_to.position, self._rbuffer_base, self._corridor_tile_length, source = self._tile_cache)
+
+  # Route star fetches through a TileCache, or straight to the database if cache is None (the default)
+  def set_tile_cache(self, cache):
+    self._tile_cache = cache
+
+  def _find_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    if self._tile_cache is not None:
+      return self._tile_cache.find_systems_by_aabb(vec_from, vec_to, buffer_from, buffer_to)
     with env.use() as envdata:
-      stars_tmp = envdata.find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
-    stars = self.cylinder(stars_tmp, sys_from.position, sys_to.position, rbuffer_ly)
-    # Ensure the target system is present, in case it's a "fake" system not in the main list
-    if sys_to not in stars:
-      stars.append(sys_to)
+      return envdata.find_systems_by_aabb(vec_from, vec_to, buffer_from, buffer_to)
+
+  # Plan legs of at least min_length in two levels: first across coarse boxels, then fine-grained between them
+  # Pass min_length = None to turn this off again
+  def set_hierarchical(self, min_length = default_hierarchical_min_length, mcode = coarseroute.default_mcode):
+    self._coarse = coarseroute.CoarseRouter(mcode) if min_length is not None else None
+    self._hierarchical_min_length = min_length
+
+  def plot_hierarchical(self, sys_from, sys_to, jump_range, full_range):
+    waypoints = self._coarse.plan(sys_from, sys_to, jump_range)
+    if waypoints is None:
+      log.debug("Coarse planning failed for {0} -> {1}, plotting directly".format(sys_from.name, sys_to.name))
+      return self._plot_fine(sys_from, sys_to, jump_range, full_range)
+    route = [sys_from]
+    idx = 0
+    while idx < len(waypoints)-1:
+      nxt = min(idx + self._coarse.hop_cells, len(waypoints)-1)
+      hop = self._plot_fine(waypoints[idx], waypoints[nxt], jump_range, full_range)
+      # If a hop across several cells fails, try again with shorter ones following the coarse route more closely
+      while hop is None and nxt > idx + 1:
+        nxt = idx + (nxt - idx) // 2
+        hop = self._plot_fine(waypoints[idx], waypoints[nxt], jump_range, full_range)
+      if hop is None:
+        log.debug("Failed to refine coarse hop {0} -> {1}".format(waypoints[idx].name, waypoints[nxt].name))
+        return None
+      route += hop[1:]
+      idx = nxt
+    return route
+
+  # Finds the systems reachable from sys_from in up to max_jumps jumps, yielding one jump layer at a time
+  # Each layer is a tuple of (jump count, list of systems first reachable in that many jumps)
+  # The search is limited to systems within max_radius of sys_from, and stops early if more than
+  # max_systems have been found, to bound its memory use
+  def find_reachable(self, sys_from, jump_range, max_jumps, max_radius = None, max_systems = None):
+    if max_radius is None:
+      max_radius = max_jumps * jump_range
+    use_graph = (self._jump_graph is not None and jump_range <= self._jump_graph.max_range and sys_from in self._jump_graph)
+    visited = set([sys_from])
+    frontier = [sys_from]
+    yield (0, frontier)
+    for jumps in range(1, max_jumps + 1):
+      layer = []
+      if use_graph:
+        for cur in frontier:
+          for s in self._jump_graph.get_neighbours(cur, jump_range):
+            if s not in visited and s.distance_to(cur) < jump_range and s.distance_to(sys_from) <= max_radius:
+              visited.add(s)
+              layer.append(s)
+      else:
+        # Gather the frontier into blocks, so each block's surroundings can be fetched in one go
+        blocks = spatial.SpatialGrid(max(4 * jump_range, self._tile_cache.tile_size if self._tile_cache is not None else 0.0))
+        for cur in frontier:
+          blocks.insert(cur, cur.position)
+        for _, entries in blocks.cells():
+          vec_min = vector3.Vector3(min(e[1] for e in entries), min(e[2] for e in entries), min(e[3] for e in entries))
+          vec_max = vector3.Vector3(max(e[1] for e in entries), max(e[2] for e in entries), max(e[3] for e in entries))
+          nearby = spatial.SpatialGrid(jump_range)
+          for s in self._find_systems_by_aabb(vec_min, vec_max, jump_range, jump_range):
+            if s not in visited and s.distance_to(sys_from) <= max_radius:
+              nearby.insert(s, s.position)
+          for (cur, _, _, _) in entries:
+            for s, _ in nearby.get_near(cur.position, jump_range):
+              if s not in visited:
+                visited.add(s)
+                layer.append(s)
+      if not layer:
+        return
+      yield (jumps, layer)
+      if max_systems is not None and len(visited) >= max_systems:
+        log.warning("Stopped searching after finding {0} systems".format(len(visited)))
+        return
+      frontier = layer
+
+  # Use a precomputed component index (see components.py) to reject impossible legs without searching
+  def set_component_index(self, index):
+    self._components = index
+
+  # Use a precomputed jump graph (see jumpgraph.py) for astar legs which it covers
+  def set_jump_graph(self, graph):
+    self._jump_graph = graph
+
+  # Use a precomputed route index (see routeindex.py) for the "ch" strategy
+  def set_route_index(self, index):
+    self._route_index = index
+
+  def plot_ch(self, sys_from, sys_to, jump_range, full_range, starcache = None):
+    if self._route_index is not None and self._route_index.can_route(sys_from, sys_to, jump_range):
+      route = self._route_index.get_route(sys_from, sys_to)
+      if route is not None:
+        return route
+      # A stale or partial index can miss routes which do exist
+      log.debug("Route index has no route for {0} -> {1}, falling back to astar".format(sys_from.name, sys_to.name))
+    else:
+      # Not covered by the index, so do it the slow way
+      log.debug("Route index does not cover {0} -> {1}, falling back to astar".format(sys_from.name, sys_to.name))
+    return self.plot_astar(sys_from, sys_to, jump_range, full_range, starcache)
+
+  def plot_astar(self, sys_from, sys_to, jump_range, full_range, starcache = None):
+    rbuffer_ly = self._rbuffer_base
+    if self._jump_graph is not None and self._jump_graph.can_route(sys_from, sys_to, jump_range):
+      # Neighbours come straight from the graph's stored edges
+      stars = self._jump_graph.get_neighbour_fn(jump_range)
+    elif self._use_corridor(sys_from, sys_to, starcache):
+      # Fetch stars as the search frontier reaches them, rather than the whole cylinder up front
+      cor = self._get_corridor(sys_from, sys_to)
+      def stars(current):
+        cor.advance(current.position)
+        result = cor.get_stars_near(current.position, jump_range)
+        # Ensure the target system is present, in case it's a "fake" system not in the main list
+        if sys_to not in result and current.distance_to(sys_to) < jump_range:
+          result.append(sys_to)
+        return result
+    else:
+      if starcache is not None:
+        stars_tmp = starcache
+      else:
+        stars_tmp = self._find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
+      stars = self.cylinder(stars_tmp, sys_from.position, sys_to.position, rbuffer_ly)
+      # Ensure the target system is present, in case it's a "fake" system not in the main list
+      if sys_to not in stars:
+        stars.append(sys_to)
 
     valid_neighbour_fn = lambda n, current: n != current and n.distance_to(current) < jump_range
     cost_fn = lambda cur, neighbour, path: self._calc.astar_cost(cur, neighbour, path, full_range)
-    return calc.astar(stars, sys_from, sys_to, valid_neighbour_fn, cost_fn)
+    return calc.astar(stars, sys_from, sys_to, valid_neighbour_fn, cost_fn, self._deadline)
 
-  def plot_trunkle(self, sys_from, sys_to, jump_range, full_range):
+  def plot_trunkle(self, sys_from, sys_to, jump_range, full_range, starcache = None):
     rbuffer_ly = self._rbuffer_base
-    # Get full cylinder to work from
-    with env.use() as envdata:
-      stars_tmp = envdata.find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
-    stars = self.cylinder(stars_tmp, sys_from.position, sys_to.position, rbuffer_ly)
+    cor = None
+    if self._use_corridor(sys_from, sys_to, starcache):
+      # Fetch stars in tiles as we progress along the route, rather than the whole cylinder up front
+      cor = self._get_corridor(sys_from, sys_to)
+    else:
+      # Get full cylinder to work from
+      if starcache is not None:
+        stars_tmp = starcache
+      else:
+        stars_tmp = self._find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
+      stars = self.cylinder(stars_tmp, sys_from.position, sys_to.position, rbuffer_ly)
 
     best_jump_count = int(math.ceil(sys_from.distance_to(sys_to) / jump_range))
 
@@ -111,6 +478,7 @@ class Routing(object):
     route = [sys_from]
     # While we haven't hit our limit to bomb out...
     while optimistic_count - best_jump_count <= (self._trunkle_max_addjumps_mul * best_jump_count):
+      self._check_deadline()
       # If this isn't our final leg...
       if next_stars is None or len(next_stars) == 0:
         if force_intermediate or self.best_jump_count(sys_cur, sys_to, jump_range) > trunc_jcount:
@@ -118,7 +486,7 @@ class Routing(object):
           # Work out the next position to get a circle of stars from
           next_pos = sys_cur.position + (sys_to.position - sys_cur.position).get_normalised() * factor
           # Get a circle of stars around the estimate
-          c_next_stars = self.circle(stars, next_pos, search_radius)
+          c_next_stars = cor.get_stars_near(next_pos, search_radius) if cor is not None else self.circle(stars, next_pos, search_radius)
           # Limit them to only ones where it's possible we'll get a valid route
           c_next_stars = [s for s in c_next_stars if self.best_jump_count(sys_cur, s, jump_range) <= trunc_jcount and s not in failed_attempts]
           c_next_stars.sort(key=lambda t: t.distance_to(sys_to))
@@ -140,7 +508,8 @@ class Routing(object):
       # This prevents getting stuck if we think we can get to sys_to in N, but actually need N+1
       jlimit = max(0, trunc_jcount - best_jcount) if next_star != sys_to else None
       # Use trundle to try and calculate a route
-      next_route = self.plot_trundle(sys_cur, next_star, jump_range, full_range, jlimit, starcache = stars_tmp)
+      leg_stars = cor.get_stars_between(sys_cur.position, next_star.position, rbuffer_ly) if cor is not None else stars_tmp
+      next_route = self.plot_trundle(sys_cur, next_star, jump_range, full_range, jlimit, starcache = leg_stars)
       # If our route was invalid or too long, check the next star
       if next_route is None or (next_star != sys_to and len(next_route)-1 > trunc_jcount):
         next_stars = next_stars[1:]
@@ -158,6 +527,8 @@ class Routing(object):
       # We have a valid route of the correct length, add it to the main route
       route += next_route[1:]
       sys_cur = next_star
+      if cor is not None:
+        cor.advance(sys_cur.position)
       force_intermediate = False
       search_radius = self._trunkle_search_radius
       next_stars = []
@@ -174,6 +545,12 @@ class Routing(object):
         return route
 
       log.debug("Plotted {0} jumps to {1}, continuing".format(len(next_route)-1, next_star.to_string()))
+      # In anytime mode, see whether finishing greedily from here gives a better route than we have
+      if self._anytime_active:
+        # Reuse the stars we already have for this leg, so as not to spend the time budget fetching them again
+        remainder = self.plot_greedy(sys_cur, sys_to, jump_range, starcache = (stars if cor is None else None), cor = cor)
+        if remainder is not None:
+          self._offer_route(route + remainder[1:])
 
     log.debug("No full-route found")
     return None
@@ -187,8 +564,7 @@ class Routing(object):
     if starcache is not None:
       stars_tmp = starcache
     else:
-      with env.use() as envdata:
-        stars_tmp = envdata.find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
+      stars_tmp = self._find_systems_by_aabb(sys_from.position, sys_to.position, rbuffer_ly, rbuffer_ly)
     stars = self.cylinder(stars_tmp, sys_from.position, sys_to.position, rbuffer_ly)
 
     log.debug("{0} --> {1}: systems to search from: {2}".format(sys_from.name, sys_to.name, len(stars)))
@@ -201,6 +577,7 @@ class Routing(object):
 
     while best is None and add_jumps <= self._trundle_max_addjumps and (addj_limit is None or add_jumps <= addj_limit):
       while best is None and (hbuffer_ly < hbuffer_relax_max or hbuffer_ly == self._hbuffer_base):
+        self._check_deadline()
         log.debug("Attempt %d at hbuffer %.1f, jump count: %d, calculating...", add_jumps, hbuffer_ly, best_jump_count + add_jumps)
         vr = self.trundle_get_viable_routes([sys_from], stars, sys_to, jump_range, add_jumps, hbuffer_ly)
         log.debug("Attempt %d at hbuffer %.1f, jump count: %d, viable routes: %d", add_jumps, hbuffer_ly, best_jump_count + add_jumps, len(vr))
@@ -229,6 +606,7 @@ class Routing(object):
     return self._trundle_gvr_internal(route, stars, sys_to, jump_range, add_jumps, best_jcount, vec_mult, hbuffer_ly)
 
   def _trundle_gvr_internal(self, route, stars, sys_to, jump_range, add_jumps, best_jcount, vec_mult, hbuffer_ly):
+    self._check_deadline()
     cur_dist = route[-1].distance_to(sys_to)
     if cur_dist > jump_range:
       # dir(current_pos --> sys_to) * jump_range
@@ -260,3 +638,22 @@ class Routing(object):
     else:
       route.append(sys_to)
       return [route]
+
+
+#
+# Worker process functions
+#
+_worker_routing = None
+
+def _plot_worker_init(routing, path, backend):
+  global _worker_routing
+  _worker_routing = routing
+  env.start_worker(path, backend)
+
+def _plot_worker(indexed_legs):
+  return _worker_routing._plot_group(indexed_legs)
+
+
+def _aabb_volume(vec_from, vec_to):
+  size = vec_to - vec_from
+  return abs(size.x * size.y * size.z)
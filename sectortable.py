@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import defs
+import pgdata
+import pgnames
+import sector
+
+app_name = "sectortable"
+
+log = logging.getLogger(app_name)
+
+default_filename = 'sectors.bin'
+
+_file_magic = b'EDST'
+_file_version = 2
+# magic, version, galaxy size x/y/z, fragment count, index slot count
+_header_format = '<4sIIIIII'
+_header_size = struct.calcsize(_header_format)
+
+# Each sector is stored as four 16-bit fragment numbers (plus one, so 0 is "no fragment")
+# The top bit of the first one is set for class 2 sectors
+_record_format = '<4H'
+_record_size = struct.calcsize(_record_format)
+_class2_flag = 0x8000
+_slot_size = 4
+# How many sectors to name at a time while building
+_build_chunk_size = 4096
+
+_u16 = 'H'
+_u32 = 'I' if array.array('I').itemsize == 4 else 'L'
+
+
+# The table lives alongside the default database; this deliberately doesn't use env, as pgnames loads it on import
+def get_default_path():
+  return os.path.join(os.path.dirname(defs.default_db_path), default_filename)
+
+
+# Fibonacci hashing of a packed record into the reverse index
+def _get_slot(key, slot_bits):
+  return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - slot_bits)
+
+
+def _get_key(record):
+  return record[0] | (record[1] << 16) | (record[2] << 32) | (record[3] << 48)
+
+
+# A memory-mapped table of the names of every PG sector in the galaxy, indexed by sector offset
+# The forward direction is a fixed-size record per offset; the reverse direction is an open-addressed
+# hash index (at most half full) from record to offset, so both lookups take constant time
+# Only names which calculating the offset from gives back the same sector are in the reverse index, so
+# a lookup either agrees with the calculation or misses and leaves it to the calculation
+class SectorTable(object):
+  def __init__(self, f, mm, galaxy_size, fragments, slot_count, records_start):
+    self._file = f
+    self._mm = mm
+    self._galaxy_size = galaxy_size
+    self._count = galaxy_size[0] * galaxy_size[1] * galaxy_size[2]
+    self._fragments = fragments
+    self._fragment_numbers = dict((frag, i + 1) for i, frag in enumerate(fragments))
+    self._slot_bits = slot_count.bit_length() - 1
+    self._slot_mask = slot_count - 1
+    self._records_start = records_start
+    self._slots_start = records_start + self._count * _record_size
+
+  @property
+  def sector_count(self):
+    return self._count
+
+  def close(self):
+    if self._mm is not None:
+      self._mm.close()
+      self._file.close()
+      self._mm = None
+      self._file = None
+
+  def _get_record(self, offset):
+    return struct.unpack_from(_record_format, self._mm, self._records_start + offset * _record_size)
+
+  # Gets the (fragments, class) of the sector at the given offset, or None if it's out of range or has no name
+  def get_name(self, offset):
+    if offset < 0 or offset >= self._count:
+      return None
+    record = self._get_record(offset)
+    if record[0] == 0:
+      return None
+    frags = [self._fragments[(record[0] & ~_class2_flag) - 1]] + [self._fragments[n - 1] for n in record[1:] if n]
+    return (frags, 2 if record[0] & _class2_flag else 1)
+
+  # Gets the offset of the sector of the given class (1 or 2) with the given name fragments, or None if it isn't in the index
+  def get_offset(self, frags, sector_class):
+    if frags is None or len(frags) < 3 or len(frags) > 4:
+      return None
+    numbers = [self._fragment_numbers.get(f, 0) for f in frags]
+    if 0 in numbers:
+      return None
+    numbers += [0] * (4 - len(numbers))
+    slot = _get_slot(_get_key(numbers), self._slot_bits)
+    if sector_class == 2:
+      numbers[0] |= _class2_flag
+    record = tuple(numbers)
+    while True:
+      (entry,) = struct.unpack_from('<I', self._mm, self._slots_start + slot * _slot_size)
+      if entry == 0:
+        return None
+      if self._get_record(entry - 1) == record:
+        return entry - 1
+      slot = (slot + 1) & self._slot_mask
+
+  @classmethod
+  def build(cls, filename, galaxy_size = sector.galaxy_size):
+    count = galaxy_size[0] * galaxy_size[1] * galaxy_size[2]
+    fragments = list(pgdata.cx_fragments)
+    numbers = dict((frag, i + 1) for i, frag in enumerate(fragments))
+    slot_count = 1
+    while slot_count < count * 2:
+      slot_count *= 2
+    slot_bits = slot_count.bit_length() - 1
+    slot_mask = slot_count - 1
+
+    start = time.time()
+    records = array.array(_u16)
+    slots = array.array(_u32, [0]) * slot_count
+    unindexed = 0
+    unnamed = 0
+    for chunk_start in range(0, count, _build_chunk_size):
+      offsets = range(chunk_start, min(count, chunk_start + _build_chunk_size))
+      # Always generate names the slow way, rather than from any table which is already loaded
+      # Class 2 sectors are named and checked a chunk at a time, so their offsets are (de)interleaved in one go
+      c2_offsets = [offset for offset in offsets if pgnames._get_c1_or_c2(offset) == 2]
+      c2_names = pgnames._c2_get_names_from_offsets(c2_offsets)
+      c2 = dict(zip(c2_offsets, zip(c2_names, pgnames._c2_get_offsets_from_names(c2_names, use_table=False))))
+      for offset in offsets:
+        if offset in c2:
+          (frags, reverse), flag = c2[offset], _class2_flag
+        else:
+          try:
+            frags, flag = pgnames._c1_get_name_from_offset(offset), 0
+          except IndexError:
+            # Some class 1 sectors near the far edge run off the end of the suffix lists; leave them empty
+            records.extend([0, 0, 0, 0])
+            unnamed += 1
+            continue
+          try:
+            reverse = pgnames._c1_get_offset_from_name(frags, use_table=False)
+          except (IndexError, ValueError):
+            reverse = None
+        record = [numbers[f] for f in frags] + [0] * (4 - len(frags))
+        # A few names don't lead back to the same sector; leave them out of the index, so looking them up
+        # gives the same answer whether there's a table or not
+        if reverse == offset:
+          # Hash by the name alone, which is all the fragments are known to be when looking up
+          slot = _get_slot(_get_key(record), slot_bits)
+          while slots[slot] != 0:
+            slot = (slot + 1) & slot_mask
+          slots[slot] = offset + 1
+        else:
+          unindexed += 1
+        record[0] |= flag
+        records.extend(record)
+    log.debug("Generated {} sector names ({} could not be named, {} left out of the index) in {:.2f}s".format(count - unnamed, unnamed, unindexed, time.time() - start))
+
+    fragdata = u'\n'.join(fragments).encode('utf-8')
+    with open(filename, 'wb') as f:
+      f.write(struct.pack(_header_format, _file_magic, _file_version, galaxy_size[0], galaxy_size[1], galaxy_size[2], len(fragments), slot_count))
+      f.write(struct.pack('<I', len(fragdata)))
+      f.write(fragdata)
+      for arr in [records, slots]:
+        # Table files are always little-endian
+        if sys.byteorder == 'big':
+          arr.byteswap()
+        arr.tofile(f)
+    log.debug("Sector table saved to {}".format(filename))
+
+  @classmethod
+  def load(cls, filename, galaxy_size = sector.galaxy_size):
+    if not os.path.isfile(filename):
+      return None
+    f = open(filename, 'rb')
+    try:
+      magic, version, gx, gy, gz, frag_count, slot_count = struct.unpack(_header_format, f.read(_header_size))
+      if magic != _file_magic or version != _file_version:
+        log.error("File {} is not a valid sector table (version {})".format(filename, _file_version))
+        f.close()
+        return None
+      (fraglen,) = struct.unpack('<I', f.read(4))
+      fragments = f.read(fraglen).decode('utf-8').split(u'\n')
+      if fragments != list(pgdata.cx_fragments) or [gx, gy, gz] != list(galaxy_size):
+        log.warning("Sector table {} was built from different PG data, ignoring it; run {}.py to rebuild it".format(filename, app_name))
+        f.close()
+        return None
+      mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (struct.error, ValueError, EnvironmentError) as ex:
+      log.error("Failed to load sector table {}: {}".format(filename, ex))
+      f.close()
+      return None
+    table = cls(f, mm, [gx, gy, gz], fragments, slot_count, _header_size + 4 + fraglen)
+    if len(mm) < table._slots_start + slot_count * _slot_size:
+      log.error("Sector table {} is truncated, ignoring it".format(filename))
+      table.close()
+      return None
+    log.debug("Loaded sector table from {}: {} sectors".format(filename, table.sector_count))
+    return table
+
+
+if __name__ == '__main__':
+  import env
+  ap = argparse.ArgumentParser(description = "Build Sector Name Table", fromfile_prefix_chars="@", parents=[env.arg_parser], prog = app_name)
+  ap.add_argument("-o", "--output", type=str, default=None, help="The file to write the table to; defaults to the data directory, where pgnames uses it automatically")
+  args = ap.parse_args(env.local_args)
+
+  start = time.time()
+  output = args.output if args.output is not None else get_default_path()
+  SectorTable.build(output)
+  log.info("Wrote names of {} sectors to {} in {:.2f}s".format(sector.galaxy_size[0] * sector.galaxy_size[1] * sector.galaxy_size[2], output, time.time() - start))
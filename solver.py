@@ -1,12 +1,27 @@
+import array
+import collections
+import heapq
+import itertools
 import logging
 import math
+import multiprocessing
+import operator
 import random
 import sys
+import time
 import vector3
 
 log = logging.getLogger("solver")
 
 max_single_solve_size = 12
+# Held-Karp takes time and memory of order 2^n, so above this we fall back to clustering
+max_held_karp_size = 18
+# Above Held-Karp's limit, branch and bound can still prove routes optimal, though it may need stopping early
+max_branch_bound_size = 30
+branch_bound_time_limit = 10.0
+branch_bound_penalty_iterations = 200
+# Gaps this small are rounding error, not a chance of a better route
+branch_bound_gap_tolerance = 1e-9
 cluster_size_max = 8
 cluster_size_min = 1
 cluster_divisor = 10
@@ -14,13 +29,23 @@ cluster_iteration_limit = 50
 cluster_repeat_limit = 100
 cluster_route_search_limit = 4
 supercluster_size_max = 8
+# K-means stops once no centre moves further than this (in Ly) in an iteration
+kmeans_tolerance = 0.01
+kmeans_iteration_limit = 100
+# The large mode's local search only tries joining each station to this many of its nearest neighbours
+large_neighbour_count = 10
+# Bits per axis of the Hilbert curve used to order stations in the large mode
+large_curve_bits = 10
 
 
 CLUSTERED         = "clustered"
 CLUSTERED_REPEAT  = "clustered-repeat"
 BASIC             = "basic"
 NEAREST_NEIGHBOUR = "nearest-neighbour"
-modes = [CLUSTERED, CLUSTERED_REPEAT, BASIC, NEAREST_NEIGHBOUR]
+HELD_KARP         = "held-karp"
+LARGE             = "large"
+BRANCH_BOUND      = "branch-bound"
+modes = [CLUSTERED, CLUSTERED_REPEAT, BASIC, NEAREST_NEIGHBOUR, HELD_KARP, LARGE, BRANCH_BOUND]
 
 
 class _Cluster(object):
@@ -52,16 +77,124 @@ class _Cluster(object):
     return "Cluster(size={}, pos={})".format(len(self.systems), self.position)
 
 
+# The solve cost between every pair of a set of points, calculated once up front
+# A hop's cost is its hyperspace part, which only depends on the pair, plus the supercruise time at its destination
+# Real plotted costs can be supplied as nested dicts (as from Solver._get_route_legs) to override the estimates
+class CostMatrix(object):
+  def __init__(self, calc, points, routed_costs = None):
+    self._points = []
+    self._index = {}
+    for p in points:
+      if p not in self._index:
+        self._index[p] = len(self._points)
+        self._points.append(p)
+    n = len(self._points)
+    xs = array.array('d', [p.position.x for p in self._points])
+    ys = array.array('d', [p.position.y for p in self._points])
+    zs = array.array('d', [p.position.z for p in self._points])
+    sc = [calc.sc_cost(p.distance if p.uses_sc else 0.0) for p in self._points]
+    jumpdist = calc.jump_distance(0)
+    jumpdist_multi = jumpdist * calc.slf
+    jump_time = calc.time_for_jumps
+
+    self._sc = array.array('d', sc)
+    self._hs = []
+    for i in range(n):
+      xi, yi, zi = xs[i], ys[i], zs[i]
+      dists = [math.sqrt((x-xi)*(x-xi) + (y-yi)*(y-yi) + (z-zi)*(z-zi)) for x, y, z in zip(xs, ys, zs)]
+      # Matches Calc.solve_cost: the straight-line factor only applies to multi-jump hops
+      self._hs.append(array.array('d', [jump_time(int(math.ceil(d / (jumpdist_multi if d > jumpdist else jumpdist)))) * 2 + d for d in dists]))
+
+    if routed_costs:
+      for a, dests in routed_costs.items():
+        for b, cost in dests.items():
+          if cost is not None and a in self._index and b in self._index:
+            self._hs[self._index[a]][self._index[b]] = cost - self._sc[self._index[b]]
+
+    self._rows = [array.array('d', map(operator.add, hs, self._sc)) for hs in self._hs]
+
+  def __len__(self):
+    return len(self._points)
+
+  def __contains__(self, p):
+    return p in self._index
+
+  @property
+  def points(self):
+    return list(self._points)
+
+  def get_index(self, p):
+    return self._index.get(p)
+
+  # Gets the costs from point index i to every other point, by index
+  def get_row(self, i):
+    return self._rows[i]
+
+  # Gets the hyperspace part of the costs from point index i, which is the same in either direction
+  def get_hs_row(self, i):
+    return self._hs[i]
+
+  # Gets the supercruise part of the cost of any hop arriving at point index i
+  def get_sc(self, i):
+    return self._sc[i]
+
+  def cost(self, a, b):
+    return self._rows[self._index[a]][self._index[b]]
+
+  def route_cost(self, route):
+    idxs = [self._index[p] for p in route]
+    return sum(self._rows[idxs[i]][idxs[i+1]] for i in range(len(idxs)-1))
+
+
 class Solver(object):
-  def __init__(self, calc, route, jump_range, diff_limit):
+  def __init__(self, calc, route, jump_range, diff_limit, routed = False, processes = None, improve_time = None, seed = None):
     self._calc = calc
     self._route = route
     self._diff_limit = diff_limit
     self._jump_range = jump_range
+    self._routed = routed
+    self._processes = processes
+    self._leg_cache = {}
+    self._routed_costs = {}
+    self._costs = None
+    # If set, results get up to this many seconds of local search afterwards
+    self._improve_time = improve_time
+    # The base seed for clustered-repeat iterations; random if not set
+    self._seed = seed
 
 
   def solve(self, stations, start, end, maxstops, preferred_mode = CLUSTERED):
     log.debug("Solving set using preferred mode '{}'".format(preferred_mode))
+    if self._routed:
+      _, _, self._routed_costs = self._get_route_legs([start, end] + list(stations))
+    self._costs = CostMatrix(self._calc, [start, end] + list(stations), self._routed_costs)
+    route, is_definitive = self._solve_mode(stations, start, end, maxstops, preferred_mode)
+    if self._improve_time is not None and route is not None:
+      spare = list(stations)
+      for s in route[1:-1]:
+        if s in spare:
+          spare.remove(s)
+      route, _ = self.improve_route(route, spare, self._improve_time)
+    return route, is_definitive
+
+
+  def _solve_mode(self, stations, start, end, maxstops, preferred_mode):
+    if preferred_mode in [CLUSTERED, CLUSTERED_REPEAT, HELD_KARP] and max_single_solve_size < len(stations) <= max_held_karp_size:
+      # Medium-sized problems can still be solved exactly
+      return self.solve_held_karp(stations, start, end, maxstops), True
+    if preferred_mode in [CLUSTERED, CLUSTERED_REPEAT, BRANCH_BOUND] and max_single_solve_size < len(stations) <= max_branch_bound_size and len(stations) + 2 <= maxstops:
+      route, _, gap = self.solve_branch_bound_with_cost(stations, start, end, maxstops)
+      return route, (gap <= branch_bound_gap_tolerance)
+    if preferred_mode == HELD_KARP:
+      if len(stations) > max_held_karp_size:
+        log.warning("Too many stations for held-karp mode, falling back to clustering")
+        return self.solve_clustered(stations, start, end, maxstops), False
+      return self.solve_held_karp(stations, start, end, maxstops), True
+    if preferred_mode == BRANCH_BOUND:
+      if len(stations) <= max_single_solve_size:
+        return self.solve_basic(stations, start, end, maxstops), True
+      log.warning("Too many stations for branch-bound mode, or not visiting them all, falling back to clustering")
+      return self.solve_clustered(stations, start, end, maxstops), False
     if preferred_mode == CLUSTERED_REPEAT and len(stations) > max_single_solve_size:
       return self.solve_clustered_repeat(stations, start, end, maxstops), False
     if preferred_mode == CLUSTERED and len(stations) > max_single_solve_size:
@@ -70,6 +203,8 @@ class Solver(object):
       return self.solve_basic(stations, start, end, maxstops), True
     elif preferred_mode == NEAREST_NEIGHBOUR:
       return self.solve_nearest_neighbour(stations, start, end, maxstops), True
+    elif preferred_mode == LARGE:
+      return self.solve_large(stations, start, end, maxstops), False
     else:
       raise ValueError("invalid preferred_mode flag passed to solve")
 
@@ -84,7 +219,7 @@ class Solver(object):
       if start == end:
         return [start], 0.0
       else:
-        return [start, end], self._calc.solve_cost(start, end, 0)
+        return [start, end], self._solve_cost(start, end, 0)
 
     log.debug("Calculating viable routes...")
     vr = self._get_viable_routes([start], stations, end, maxstops)
@@ -97,9 +232,9 @@ class Solver(object):
 
     for route in vr:
       count += 1
-      cost_normal = self._calc.solve_route_cost(route)
+      cost_normal = self._solve_route_cost(route)
       route_reversed = [route[0]] + list(reversed(route[1:-1])) + [route[-1]]
-      cost_reversed = self._calc.solve_route_cost(route_reversed)
+      cost_reversed = self._solve_route_cost(route_reversed)
 
       cost = cost_normal if (cost_normal <= cost_reversed) else cost_reversed
       route = route if (cost_normal <= cost_reversed) else route_reversed
@@ -113,6 +248,307 @@ class Solver(object):
     return minroute, mincost
 
 
+  def solve_held_karp(self, stations, start, end, maxstops):
+    result, _ = self.solve_held_karp_with_cost(stations, start, end, maxstops)
+    return result
+
+  # Exact solution by dynamic programming over subsets of stations
+  # best[mask][j] is the cheapest way to leave start, visit exactly the stations in mask and finish at j
+  def solve_held_karp_with_cost(self, stations, start, end, maxstops):
+    count = min(len(stations), maxstops - 2)
+    if count <= 0:
+      return self.solve_basic_with_cost([], start, end, maxstops)
+
+    n = len(stations)
+    inf = float('inf')
+    prev_jcount = count + 1
+    from_start = [self._solve_cost(start, s, prev_jcount) for s in stations]
+    to_end = [self._solve_cost(s, end, prev_jcount) for s in stations]
+    # Stored by destination, so each DP step is a single pass over a row
+    costs_to = [[self._solve_cost(stations[i], stations[j], prev_jcount) if i != j else inf for i in range(n)] for j in range(n)]
+
+    log.debug("Calculating Held-Karp table for {0} stations, {1} stops...".format(n, count))
+    best = {}
+    empty = array.array('d', [inf]) * n
+    for j in range(n):
+      row = array.array('d', empty)
+      row[j] = from_start[j]
+      best[1 << j] = row
+    for size in range(2, count + 1):
+      for combo in itertools.combinations(range(n), size):
+        mask = sum(1 << j for j in combo)
+        row = array.array('d', empty)
+        for j in combo:
+          row[j] = min(map(operator.add, best[mask ^ (1 << j)], costs_to[j]))
+        best[mask] = row
+
+    mincost = inf
+    minmask = None
+    minlast = None
+    for combo in itertools.combinations(range(n), count):
+      mask = sum(1 << j for j in combo)
+      totals = list(map(operator.add, best[mask], to_end))
+      cost = min(totals)
+      if cost < mincost:
+        mincost = cost
+        minmask = mask
+        minlast = totals.index(cost)
+
+    # Walk back through the table to recover the route
+    route = [stations[minlast]]
+    mask = minmask
+    j = minlast
+    while mask != (1 << j):
+      prev = mask ^ (1 << j)
+      totals = list(map(operator.add, best[prev], costs_to[j]))
+      j = totals.index(min(totals))
+      route.append(stations[j])
+      mask = prev
+    route = [start] + list(reversed(route)) + [end]
+    return route, mincost
+
+
+  # Improves a route with local search, keeping its start, end and number of stops
+  # Uses 2-opt (reversing a stretch of the route), Or-opt (moving a run of up to three stops elsewhere,
+  # either way round) and, if any spare stations are given, swapping a stop for a station not yet visited
+  # Stops at a local optimum, or after time_budget seconds; returns (route, cost)
+  def improve_route(self, route, spare = [], time_budget = None):
+    costs = self._get_cost_matrix(list(route) + list(spare))
+    tour = [costs.get_index(p) for p in route]
+    spares = [costs.get_index(p) for p in spare]
+    hs = [costs.get_hs_row(i) for i in range(len(costs))]
+    sc = [costs.get_sc(i) for i in range(len(costs))]
+    deadline = (time.time() + time_budget) if time_budget is not None else None
+    eps = 1e-9
+
+    improved = True
+    passes = 0
+    while improved and (deadline is None or time.time() < deadline):
+      improved = False
+      passes += 1
+      n = len(tour)
+      # 2-opt: since hyperspace costs are symmetric and the set of destinations doesn't change,
+      # only the two edges at the ends of the reversed stretch matter
+      for i in range(1, n-2):
+        a, b = tour[i-1], tour[i]
+        hs_a = hs[a]
+        for j in range(i+1, n-1):
+          c, d = tour[j], tour[j+1]
+          if hs_a[c] + hs[b][d] < hs_a[b] + hs[c][d] - eps:
+            tour[i:j+1] = reversed(tour[i:j+1])
+            a, b = tour[i-1], tour[i]
+            hs_a = hs[a]
+            improved = True
+        if deadline is not None and time.time() >= deadline:
+          break
+
+      # Or-opt
+      for seglen in (1, 2, 3):
+        i = 1
+        while i + seglen < n:
+          seg = tour[i:i+seglen]
+          prev, nxt = tour[i-1], tour[i+seglen]
+          removed = hs[prev][seg[0]] + hs[seg[-1]][nxt] - hs[prev][nxt]
+          best = None
+          rest = tour[:i] + tour[i+seglen:]
+          for k in range(0, len(rest)-1):
+            p, q = rest[k], rest[k+1]
+            fwd = hs[p][seg[0]] + hs[seg[-1]][q] - hs[p][q]
+            rev = hs[p][seg[-1]] + hs[seg[0]][q] - hs[p][q]
+            gain = removed - min(fwd, rev)
+            if gain > eps and (best is None or gain > best[0]):
+              best = (gain, k, rev < fwd)
+          if best is not None:
+            _, k, reverse = best
+            tour = rest[:k+1] + (list(reversed(seg)) if reverse else seg) + rest[k+1:]
+            improved = True
+          i += 1
+        if deadline is not None and time.time() >= deadline:
+          break
+
+      # Exchange a visited stop for a spare station
+      for i in range(1, n-1):
+        a, b, c = tour[i-1], tour[i], tour[i+1]
+        current = hs[a][b] + hs[b][c] + sc[b]
+        for si, s in enumerate(spares):
+          if hs[a][s] + hs[s][c] + sc[s] < current - eps:
+            tour[i], spares[si] = s, b
+            b = s
+            current = hs[a][b] + hs[b][c] + sc[b]
+            improved = True
+
+    points = costs.points
+    result = [route[0]] + [points[i] for i in tour[1:-1]] + [route[-1]]
+    cost = costs.route_cost(result)
+    log.debug("Local search finished after {0} passes, cost {1:.2f}".format(passes, cost))
+    return result, cost
+
+
+  def solve_large(self, stations, start, end, maxstops, time_budget = None):
+    result, _ = self.solve_large_with_cost(stations, start, end, maxstops, time_budget)
+    return result
+
+  # Heuristic for problems far too big to cluster: orders the stations along a Hilbert curve, cuts the loop
+  # where it best fits the start and end, then runs 2-opt and Or-opt limited to each station's nearest neighbours
+  # Takes around O(n^2) time and memory for the cost matrix, and close to O(n) per pass of local search
+  def solve_large_with_cost(self, stations, start, end, maxstops, time_budget = None):
+    count = min(len(stations), maxstops - 2)
+    if count <= 0:
+      return self.solve_basic_with_cost([], start, end, maxstops)
+    costs = self._get_cost_matrix([start, end] + list(stations))
+    hs = [costs.get_hs_row(i) for i in range(len(costs))]
+    first = costs.get_index(start)
+    last = costs.get_index(end)
+    nodes = []
+    for s in stations:
+      i = costs.get_index(s)
+      if i != first and i != last and i not in nodes:
+        nodes.append(i)
+    deadline = (time.time() + time_budget) if time_budget is not None else None
+
+    log.debug("Ordering {0} stations along a Hilbert curve...".format(len(nodes)))
+    points = costs.points
+    order = _get_curve_order(nodes, [points[i].position for i in nodes])
+    # Treat the curve as a loop and open it up at the best place, either way round
+    bestcut = None
+    for k in range(len(order)):
+      a, b = order[k-1], order[k]
+      fwd = hs[first][b] + hs[a][last] - hs[a][b]
+      rev = hs[first][a] + hs[b][last] - hs[a][b]
+      if bestcut is None or min(fwd, rev) < bestcut[0]:
+        bestcut = (min(fwd, rev), k, rev < fwd)
+    _, k, reverse = bestcut
+    order = order[k:] + order[:k]
+    if reverse:
+      order = list(reversed(order))
+    tour = [first] + order[:count] + [last]
+
+    log.debug("Improving route with {0}-nearest-neighbour local search...".format(large_neighbour_count))
+    interior = tour[1:-1]
+    neighbours = {}
+    for i in interior:
+      row = hs[i]
+      neighbours[i] = heapq.nsmallest(large_neighbour_count + 1, interior, key=row.__getitem__)
+      if i in neighbours[i]:
+        neighbours[i].remove(i)
+    tour = _improve_tour(tour, hs, neighbours, deadline)
+
+    route = [start] + [points[i] for i in tour[1:-1]] + [end]
+    return route, costs.route_cost(route)
+
+
+  def solve_branch_bound(self, stations, start, end, maxstops, time_limit = branch_bound_time_limit):
+    result, _, _ = self.solve_branch_bound_with_cost(stations, start, end, maxstops, time_limit)
+    return result
+
+  # Exact solution by best-first branch and bound, for routes which visit every station
+  # Each partial route is bounded below by its cost so far plus the minimum spanning tree of the stations left,
+  # its last stop and the end, since any way of finishing the route is one such spanning tree
+  # The trees are built over penalised weights (see _get_penalties), which makes the bound much tighter
+  # Returns (route, cost, gap), where gap is how far the route could be above optimal as a fraction of its cost;
+  # this is 0 unless the time limit was hit first
+  def solve_branch_bound_with_cost(self, stations, start, end, maxstops, time_limit = branch_bound_time_limit):
+    # Start from a good route, so plenty of branches can be cut straight away
+    incumbent, _ = self.solve_large_with_cost(stations, start, end, maxstops)
+    incumbent, bestcost = self.improve_route(incumbent)
+    costs = self._get_cost_matrix(incumbent)
+    # Local indexes: 0 is the start, 1 the end, and the rest are the stations
+    points = [costs.get_index(start), costs.get_index(end)]
+    for s in incumbent[1:-1]:
+      points.append(costs.get_index(s))
+    n = len(points) - 2
+    if n > maxstops - 2:
+      raise ValueError("branch and bound can only solve routes visiting every station")
+    hs = [[costs.get_hs_row(i)[j] for j in points] for i in points]
+    # Routed costs might not be the same both ways, so spanning trees use the cheaper direction
+    sym = [[min(hs[i][j], hs[j][i]) for j in range(n+2)] for i in range(n+2)]
+    # With every station visited, the supercruise part of the cost is the same whatever the order
+    sc_total = sum(costs.get_sc(i) for i in points[1:])
+    best = bestcost - sc_total
+    bestpath = None
+    full = (1 << n) - 1
+    eps = 1e-9
+
+    pi, _ = _get_penalties(sym, best)
+    penalised = [[sym[i][j] + pi[i] + pi[j] for j in range(n+2)] for i in range(n+2)]
+    mst_cache = {}
+    def get_bound(last, mask):
+      key = (last, mask)
+      if key not in mst_cache:
+        rest = [j + 2 for j in range(n) if not mask & (1 << j)]
+        mst_cache[key] = _get_mst_cost([last, 1] + rest, penalised) - 2 * sum(pi[j] for j in rest) - pi[last] - pi[1]
+      return mst_cache[key]
+
+    log.debug("Running branch and bound over {0} stations...".format(n))
+    deadline = time.time() + time_limit if time_limit is not None else None
+    # Entries are (bound, -depth, sequence, cost, last, mask, path); paths are linked as (node, parent)
+    queue = [(get_bound(0, 0), 0, 0, 0.0, 0, 0, (0, None))]
+    seen = {}
+    sequence = 0
+    expanded = 0
+    timed_out = False
+    while queue:
+      bound, depth, _, cost, last, mask, path = queue[0]
+      if bound >= best - eps:
+        break
+      if deadline is not None and expanded % 256 == 0 and time.time() >= deadline:
+        timed_out = True
+        break
+      heapq.heappop(queue)
+      expanded += 1
+      row = hs[last]
+      for j in range(n):
+        bit = 1 << j
+        if mask & bit:
+          continue
+        node = j + 2
+        ncost = cost + row[node]
+        nmask = mask | bit
+        if nmask == full:
+          total = ncost + hs[node][1]
+          if total < best - eps:
+            best = total
+            bestpath = (node, path)
+          continue
+        # Any other partial route through the same stations to the same place that's no dearer beats this one
+        key = (node, nmask)
+        if seen.get(key, float('inf')) <= ncost + eps:
+          continue
+        seen[key] = ncost
+        nbound = ncost + get_bound(node, nmask)
+        if nbound < best - eps:
+          sequence += 1
+          heapq.heappush(queue, (nbound, depth - 1, sequence, ncost, node, nmask, (node, path)))
+
+    # Unless time ran out, nothing left in the queue can beat the best route, so it's optimal
+    if timed_out:
+      lower = min(queue[0][0], best)
+      gap = (best - lower) / (best + sc_total) if best > 0 else 0.0
+    else:
+      gap = 0.0
+    if gap > 0.0:
+      log.debug("Branch and bound stopped after {0} nodes with a gap of {1:.2%}".format(expanded, gap))
+    else:
+      log.debug("Branch and bound proved route optimal after {0} nodes".format(expanded))
+
+    if bestpath is None:
+      return incumbent, bestcost, gap
+    order = []
+    while bestpath is not None:
+      order.append(bestpath[0])
+      bestpath = bestpath[1]
+    allpoints = costs.points
+    route = [start] + [allpoints[points[i]] for i in reversed(order[:-1])] + [end]
+    return route, costs.route_cost(route), gap
+
+
+  # Gets the cost matrix from the current solve if it covers all the given points, or makes a new one
+  def _get_cost_matrix(self, points):
+    if self._costs is not None and all(p in self._costs for p in points):
+      return self._costs
+    return CostMatrix(self._calc, points, self._routed_costs)
+
+
   def solve_nearest_neighbour(self, stations, start, end, maxstops):
     result, _ = self.solve_nearest_neighbour_with_cost(stations, start, end, maxstops)
     return result
@@ -125,7 +561,7 @@ class Solver(object):
       cur_cost = sys.maxsize
       cur_stop = None
       for s in remaining:
-        cost = self._calc.solve_cost(route[-1], s, len(route)-1)
+        cost = self._solve_cost(route[-1], s, len(route)-1)
         if cost < cur_cost:
           cur_stop = s
           cur_cost = cost
@@ -141,11 +577,11 @@ class Solver(object):
     result, _ = self.solve_clustered_with_cost(stations, start, end, maxstops)
     return result
 
-  def solve_clustered_with_cost(self, stations, start, end, maxstops):
+  def solve_clustered_with_cost(self, stations, start, end, maxstops, rng = None):
     cluster_count = int(math.ceil(float(len(stations) + 2) / cluster_divisor))
     log.debug("Splitting problem into {0} clusters...".format(cluster_count))
-    clusters = find_centers(stations, cluster_count)
-    clusters = self._resolve_cluster_sizes(clusters)
+    clusters = find_centers(stations, cluster_count, rng)
+    clusters = self._resolve_cluster_sizes(clusters, rng)
 
     sclusters = self._get_best_supercluster_route(clusters, start, end)
 
@@ -178,33 +614,66 @@ class Solver(object):
     return route, cost
 
 
-  def solve_clustered_repeat(self, stations, start, end, maxstops, iterations = cluster_repeat_limit):
-    result, _ = self.solve_clustered_repeat_with_cost(stations, start, end, maxstops, iterations)
+  def solve_clustered_repeat(self, stations, start, end, maxstops, iterations = cluster_repeat_limit, target_cost = None):
+    result, _ = self.solve_clustered_repeat_with_cost(stations, start, end, maxstops, iterations, target_cost)
     return result
 
-  def solve_clustered_repeat_with_cost(self, stations, start, end, maxstops, iterations = cluster_repeat_limit):
-    minroute = None
-    mincost = sys.float_info.max
-    for i in range(0, iterations):
-      route, cost = self.solve_clustered_with_cost(stations, start, end, maxstops)
-      if cost < mincost:
-        mincost = cost
-        minroute = route
-    return minroute, mincost
+  # Runs the clustered solver repeatedly with different seeds, spread over a pool of processes
+  # Iteration i uses seed (self._seed + i), and the cheapest result wins, ties going to the lowest seed,
+  # so the result is the same however many processes are used
+  # If target_cost is given, stops as soon as any iteration gets a route at least that cheap
+  def solve_clustered_repeat_with_cost(self, stations, start, end, maxstops, iterations = cluster_repeat_limit, target_cost = None):
+    base_seed = self._seed if self._seed is not None else random.randrange(0, 2**31)
+    seeds = [base_seed + i for i in range(iterations)]
+    points = [start, end] + list(stations)
+    processes = self._processes if self._processes is not None else multiprocessing.cpu_count()
+
+    results = []
+    if processes > 1 and iterations > 1:
+      log.debug("Running {0} clustered iterations over {1} processes".format(iterations, processes))
+      pool = multiprocessing.Pool(processes, initializer=_repeat_worker_init, initargs=(self, points, maxstops))
+      try:
+        chunksize = max(1, iterations // (processes * 4))
+        for result in pool.imap_unordered(_repeat_worker, seeds, chunksize):
+          results.append(result)
+          if target_cost is not None and result[0] <= target_cost:
+            log.debug("Reached target cost with seed {0}, cancelling remaining iterations".format(result[1]))
+            break
+      finally:
+        pool.terminate()
+        pool.join()
+    else:
+      for seed in seeds:
+        results.append(self._solve_clustered_seeded(points, maxstops, seed))
+        if target_cost is not None and results[-1][0] <= target_cost:
+          break
 
+    mincost, _, minroute = min(results)
+    return [points[i] for i in minroute], mincost
 
-  def _resolve_cluster_sizes(self, pclusters):
+  # Runs one seeded clustered solve, returning (cost, seed, route as indexes into points)
+  def _solve_clustered_seeded(self, points, maxstops, seed):
+    route, _ = self.solve_clustered_with_cost(points[2:], points[0], points[1], maxstops, random.Random(seed))
+    # Compare whole routes, including the hops between clusters
+    cost = self._solve_route_cost(route)
+    index = {}
+    for i, p in enumerate(points):
+      index.setdefault(p, i)
+    return (cost, seed, [index[p] for p in route])
+
+
+  def _resolve_cluster_sizes(self, pclusters, rng = None):
     clusters = list(pclusters)
     iterations = 0
     while iterations < cluster_iteration_limit:
       iterations += 1
       for i,c in enumerate(clusters):
         if c.is_supercluster:
-          c.systems = self._resolve_cluster_sizes(c.systems)
+          c.systems = self._resolve_cluster_sizes(c.systems, rng)
         if len(c.systems) > cluster_size_max:
           log.debug("Splitting oversized cluster {} into two".format(c))
           del clusters[i]
-          newclusters = find_centers(c.systems, 2)
+          newclusters = find_centers(c.systems, 2, rng)
           clusters += newclusters
           break
       lengths = [len(c.systems) for c in clusters]
@@ -216,7 +685,7 @@ class Solver(object):
           # Too many clusters, consolidate
           subdiv = int(math.ceil(float(len(clusters)) / supercluster_size_max))
           log.debug("Consolidating from {} to {} superclusters".format(len(clusters), subdiv))
-          clusters = find_centers(clusters, subdiv)
+          clusters = find_centers(clusters, subdiv, rng)
           lengths = [len(c.systems) for c in clusters]
           # If everything is now valid...
           if min(lengths) >= cluster_size_min and max(lengths) <= cluster_size_max and len(clusters) <= supercluster_size_max:
@@ -225,21 +694,69 @@ class Solver(object):
     return clusters
 
 
+  # Gets the cost of a hop, from the current cost matrix if it covers it, or the real plotted route if we have one
+  # prev_jcount makes no difference to solve costs (the solver doesn't model range decay), so the matrix ignores it
+  def _solve_cost(self, a, b, prev_jcount):
+    if self._costs is not None and a in self._costs and b in self._costs:
+      return self._costs.cost(a, b)
+    cost = self._routed_costs.get(a, {}).get(b)
+    if cost is not None:
+      return cost
+    return self._calc.solve_cost(a, b, prev_jcount)
+
+  def _solve_route_cost(self, route):
+    if self._costs is not None and all(p in self._costs for p in route):
+      return self._costs.route_cost(route)
+    cost = 0.0
+    for i in range(0, len(route)-1):
+      cost += self._solve_cost(route[i], route[i+1], len(route)-1)
+    return cost
+
+
+  # Plots every pair of stations, returning matrices (as nested dicts) of legs, jump counts and costs
+  # Pairs are plotted in parallel, and legs are cached between calls
   def _get_route_legs(self, stations):
     legs = {}
+    jumps = {}
+    costs = {}
     for h in stations:
       legs[h] = {}
+      jumps[h] = {}
+      costs[h] = {}
+
+    # Keyed by leg, so each is only plotted once; the values are unused
+    to_plot = collections.OrderedDict()
+    for i, s in enumerate(stations):
+      for t in stations[i+1:]:
+        key = (_get_system(s), _get_system(t))
+        if key[0] == key[1] or key in to_plot or (key[1], key[0]) in to_plot:
+          continue
+        if key not in self._leg_cache and (key[1], key[0]) not in self._leg_cache:
+          to_plot[key] = None
+    if to_plot:
+      log.debug("Calculating {0} legs...".format(len(to_plot)))
+      plotted = self._route.plot_many([(s, t, self._jump_range, self._jump_range) for s, t in to_plot], self._processes, share_stars=True)
+      for key, leg in zip(to_plot, plotted):
+        if leg is None:
+          log.warning("Hop route could not be calculated: {0} -> {1}".format(key[0].name, key[1].name))
+        self._leg_cache[key] = leg
+
     for s in stations:
       for t in stations:
-        if s.to_string() != t.to_string() and t not in legs[s]:
-          log.debug("Calculating leg: {0} -> {1}".format(s.name, t.name))
-          leg = self._route.plot(s, t, self._jump_range)
-          if leg is None:
-            log.warning("Hop route could not be calculated: {0} -> {1}".format(s.name, t.name))
-          legs[s][t] = leg
-          legs[t][s] = leg
+        ssys = _get_system(s)
+        tsys = _get_system(t)
+        if ssys == tsys:
+          continue
+        if (ssys, tsys) in self._leg_cache:
+          leg = self._leg_cache[(ssys, tsys)]
+        else:
+          leg = self._leg_cache[(tsys, ssys)]
+          leg = list(reversed(leg)) if leg is not None else None
+        legs[s][t] = leg
+        jumps[s][t] = (len(leg) - 1) if leg is not None else None
+        costs[s][t] = self._calc.solve_cost_routed(s, t, leg) if leg is not None else None
 
-    return legs
+    return legs, jumps, costs
 
   def _get_viable_routes(self, route, stations, end, maxstops):
     # If we have more non-end stops to go...
@@ -256,7 +773,7 @@ class Solver(object):
           if route_matches >= stn_matches:
             continue
 
-        dist = self._calc.solve_cost(route[-1], stn, len(route)-1)
+        dist = self._solve_cost(route[-1], stn, len(route)-1)
         nexts[stn] = dist
 
       mindist = min(nexts.values())
@@ -334,44 +851,272 @@ class Solver(object):
       for n2 in cluster2:
         if n2 in disallowed and len(cluster2) > 1: # If len(cluster) is 1, start == end so allow it
           continue
-        cost = self._calc.solve_cost(n1, n2, 1)
+        cost = self._solve_cost(n1, n2, 1)
         if best is None or cost < bestcost:
           best = (n1, n2)
           bestcost = cost
     return best
 
 
+# State for clustered-repeat worker processes
+_worker_solver = None
+_worker_problem = None
+
+def _repeat_worker_init(solver, points, maxstops):
+  global _worker_solver, _worker_problem
+  _worker_solver = solver
+  _worker_problem = (points, maxstops)
+
+def _repeat_worker(seed):
+  return _worker_solver._solve_clustered_seeded(_worker_problem[0], _worker_problem[1], seed)
+
+
+# Gets the total weight of the minimum spanning tree of some nodes, using Prim's algorithm
+# If a list of degrees is given, each node's degree in the tree is added to it
+def _get_mst_cost(nodes, weights, degrees = None):
+  if len(nodes) < 2:
+    return 0.0
+  row = weights[nodes[0]]
+  rest = nodes[1:]
+  dists = [row[m] for m in rest]
+  parents = [nodes[0]] * len(rest)
+  total = 0.0
+  while rest:
+    k = min(range(len(rest)), key=dists.__getitem__)
+    total += dists[k]
+    node = rest[k]
+    if degrees is not None:
+      degrees[node] += 1
+      degrees[parents[k]] += 1
+    row = weights[node]
+    del rest[k]
+    del dists[k]
+    del parents[k]
+    for i, m in enumerate(rest):
+      if row[m] < dists[i]:
+        dists[i] = row[m]
+        parents[i] = node
+  return total
+
+
+# Finds node penalties which tighten spanning tree bounds on a route's cost (the Held-Karp 1-tree bound)
+# Adding pi[i] + pi[j] to the weight of every edge (i, j) adds the same to every route, but not to every tree,
+# so subgradient steps push the tree towards being a route by penalising nodes with too many branches
+# Node 0 and 1 are the route's ends; returns (penalties, lower bound)
+def _get_penalties(weights, upper, iterations = branch_bound_penalty_iterations):
+  m = len(weights)
+  target = [1, 1] + [2] * (m - 2)
+  pi = [0.0] * m
+  best = (list(pi), float('-inf'))
+  scale = 2.0
+  for _ in range(iterations):
+    w = [[weights[i][j] + pi[i] + pi[j] for j in range(m)] for i in range(m)]
+    degrees = [0] * m
+    lower = _get_mst_cost(list(range(m)), w, degrees) - sum(t * p for t, p in zip(target, pi))
+    if lower > best[1]:
+      best = (list(pi), lower)
+    grad = [d - t for d, t in zip(degrees, target)]
+    norm = sum(g * g for g in grad)
+    if norm == 0 or lower >= upper:
+      # The tree is itself a route, so it's optimal
+      break
+    step = scale * (upper - lower) / norm
+    pi = [p + step * g for p, g in zip(pi, grad)]
+    scale *= 0.95
+  return best
+
+
+# Gets the distance along a 3D Hilbert curve of integer coordinates with the given number of bits each
+# This is Skilling's method: transform the coordinates in place, then interleave their bits
+def _get_hilbert_index(coords, bits):
+  x = list(coords)
+  q = 1 << (bits - 1)
+  while q > 1:
+    p = q - 1
+    for i in range(3):
+      if x[i] & q:
+        x[0] ^= p
+      else:
+        t = (x[0] ^ x[i]) & p
+        x[0] ^= t
+        x[i] ^= t
+    q >>= 1
+  x[1] ^= x[0]
+  x[2] ^= x[1]
+  t = 0
+  q = 1 << (bits - 1)
+  while q > 1:
+    if x[2] & q:
+      t ^= q - 1
+    q >>= 1
+  h = 0
+  for b in range(bits - 1, -1, -1):
+    for i in range(3):
+      h = (h << 1) | (((x[i] ^ t) >> b) & 1)
+  return h
+
+
+# Sorts items by where their positions fall along a Hilbert curve through their bounding box
+def _get_curve_order(items, positions):
+  if not items:
+    return []
+  lo = [min(p[i] for p in positions) for i in range(3)]
+  hi = [max(p[i] for p in positions) for i in range(3)]
+  scale = ((1 << large_curve_bits) - 1) / max(max(hi[i] - lo[i] for i in range(3)), 1.0)
+  keys = [_get_hilbert_index([int((p[i] - lo[i]) * scale) for i in range(3)], large_curve_bits) for p in positions]
+  return [item for _, item in sorted(zip(keys, items), key=operator.itemgetter(0))]
+
+
+# Local search over a route of cost matrix indexes whose ends stay fixed, only trying moves which
+# join a station to one of its listed neighbours; stops at a local optimum or the deadline
+def _improve_tour(tour, hs, neighbours, deadline = None):
+  tour = list(tour)
+  n = len(tour)
+  pos = dict((node, k) for k, node in enumerate(tour) if 0 < k < n-1)
+  eps = 1e-9
+
+  improved = True
+  while improved and (deadline is None or time.time() < deadline):
+    improved = False
+    # 2-opt: replace edges (a, b) and (c, d) with (a, c) and (b, d), where c is near a
+    # b and d are either both successors or both predecessors along the route
+    for a in tour[1:-1]:
+      for c in neighbours[a]:
+        i, j = pos[a], pos[c]
+        b, d = tour[i+1], tour[j+1]
+        if hs[a][b] + hs[c][d] - hs[a][c] - hs[b][d] > eps:
+          lo, hi = min(i, j) + 1, max(i, j)
+          tour[lo:hi+1] = reversed(tour[lo:hi+1])
+          for k in range(lo, hi+1):
+            pos[tour[k]] = k
+          improved = True
+          continue
+        b, d = tour[i-1], tour[j-1]
+        if hs[a][b] + hs[c][d] - hs[a][c] - hs[b][d] > eps:
+          lo, hi = min(i, j), max(i, j) - 1
+          tour[lo:hi+1] = reversed(tour[lo:hi+1])
+          for k in range(lo, hi+1):
+            pos[tour[k]] = k
+          improved = True
+
+    # Or-opt: move a run of up to three stations, either way round, next to a neighbour of one of its ends
+    for seglen in (1, 2, 3):
+      i = 1
+      while i + seglen < n:
+        seg = tour[i:i+seglen]
+        s0, s1 = seg[0], seg[-1]
+        prev, nxt = tour[i-1], tour[i+seglen]
+        removed = hs[prev][s0] + hs[s1][nxt] - hs[prev][nxt]
+        best = None
+        for c in set(neighbours[s0] + neighbours[s1]):
+          j = pos[c]
+          if i <= j < i + seglen:
+            continue
+          for u, v in ((tour[j-1], c), (c, tour[j+1])):
+            if u in seg or v in seg:
+              continue
+            fwd = hs[u][s0] + hs[s1][v] - hs[u][v]
+            rev = hs[u][s1] + hs[s0][v] - hs[u][v]
+            gain = removed - min(fwd, rev)
+            if gain > eps and (best is None or gain > best[0]):
+              best = (gain, u, v, rev < fwd)
+        if best is not None:
+          _, u, v, reverse = best
+          rest = tour[:i] + tour[i+seglen:]
+          k = 0 if u == rest[0] else rest.index(u)
+          tour = rest[:k+1] + (list(reversed(seg)) if reverse else seg) + rest[k+1:]
+          for k in range(1, n-1):
+            pos[tour[k]] = k
+          improved = True
+        i += 1
+      if deadline is not None and time.time() >= deadline:
+        break
+  return tour
+
+
+# Stations are routed between using their systems; plain systems are used as-is
+def _get_system(s):
+  return s.system if hasattr(s, 'system') else s
+
+
 #
 # K-means clustering
 #
-def _cluster_points(X, mu):
-  clusters = [[] for i in range(len(mu))]
-  for x in X:
-    bestmukey = min([(i[0], (x.position - mu[i[0]]).length) for i in enumerate(mu)], key=lambda t: t[1])[0]
-    clusters[bestmukey].append(x)
-  return clusters
-
-
-def _reevaluate_centers(mu, clusters):
-  newmu = []
-  for c in clusters:
-    newmu.append(vector3.mean([x.position for x in c]))
-  return newmu
-
-
-def _has_converged(mu, oldmu):
-  return (set(mu) == set(oldmu))
-
-
-def find_centers(X, K):
-  # Initialize to K random centers
-  oldmu = random.sample([x.position for x in X], K)
-  mu = random.sample([x.position for x in X], K)
-  clusters = _cluster_points(X, mu)
-  while not _has_converged(mu, oldmu):
-    oldmu = mu
-    # Assign all points in X to clusters
-    clusters = _cluster_points(X, mu)
-    # Reevaluate centers
-    mu = _reevaluate_centers(oldmu, clusters)
-  return [_Cluster(clusters[i], mu[i]) for i in range(len(mu))]
+# Points are handled as plain (x, y, z) tuples here, which is much quicker than going through Vector3
+def _get_sqdist(a, b):
+  dx = a[0] - b[0]
+  dy = a[1] - b[1]
+  dz = a[2] - b[2]
+  return dx*dx + dy*dy + dz*dz
+
+
+# Gets the index of the nearest centre to each point
+def _cluster_points(points, mu):
+  labels = []
+  for p in points:
+    px, py, pz = p
+    best = 0
+    bestdist = float('inf')
+    for i, (mx, my, mz) in enumerate(mu):
+      d = (px-mx)*(px-mx) + (py-my)*(py-my) + (pz-mz)*(pz-mz)
+      if d < bestdist:
+        best = i
+        bestdist = d
+    labels.append(best)
+  return labels
+
+
+# Gets the mean of each cluster's points; a cluster left empty keeps its old centre
+def _reevaluate_centers(points, labels, mu):
+  sums = [[0.0, 0.0, 0.0, 0] for _ in mu]
+  for p, l in zip(points, labels):
+    s = sums[l]
+    s[0] += p[0]
+    s[1] += p[1]
+    s[2] += p[2]
+    s[3] += 1
+  return [(s[0] / s[3], s[1] / s[3], s[2] / s[3]) if s[3] else m for s, m in zip(sums, mu)]
+
+
+# Picks K starting centres spread out across the points (k-means++)
+# Each new centre is chosen with probability proportional to its squared distance from the nearest existing one
+def _get_initial_centers(points, K, rng):
+  mu = [points[rng.randrange(len(points))]]
+  sqdists = [_get_sqdist(p, mu[0]) for p in points]
+  while len(mu) < K:
+    total = sum(sqdists)
+    if total <= 0.0:
+      # Every point is on top of an existing centre; any of them will do
+      mu.append(points[rng.randrange(len(points))])
+      continue
+    target = rng.random() * total
+    chosen = len(points) - 1
+    for i, d in enumerate(sqdists):
+      target -= d
+      if target < 0.0:
+        chosen = i
+        break
+    mu.append(points[chosen])
+    sqdists = [min(d, _get_sqdist(p, points[chosen])) for p, d in zip(points, sqdists)]
+  return mu
+
+
+# Splits X into K clusters, stopping once no centre moves more than tolerance Ly or after max_iterations rounds
+def find_centers(X, K, rng = None, tolerance = kmeans_tolerance, max_iterations = kmeans_iteration_limit):
+  if rng is None:
+    rng = random
+  points = [(x.position.x, x.position.y, x.position.z) for x in X]
+  mu = _get_initial_centers(points, K, rng)
+  labels = _cluster_points(points, mu)
+  sqtolerance = tolerance * tolerance
+  for _ in range(max_iterations):
+    newmu = _reevaluate_centers(points, labels, mu)
+    shift = max(_get_sqdist(a, b) for a, b in zip(mu, newmu))
+    mu = newmu
+    labels = _cluster_points(points, mu)
+    if shift <= sqtolerance:
+      break
+  clusters = [[] for _ in mu]
+  for x, l in zip(X, labels):
+    clusters[l].append(x)
+  return [_Cluster(clusters[i], vector3.Vector3(mu[i][0], mu[i][1], mu[i][2])) for i in range(len(mu))]
@@ -0,0 +1,84 @@
+from __future__ import print_function
+import io
+import multiprocessing
+import sys
+import time
+import calc
+import solver
+import system_internal as system
+
+default_filename = 'tourist_3.csv'
+default_modes = [solver.NEAREST_NEIGHBOUR, solver.CLUSTERED, solver.LARGE]
+default_timeout = 60.0
+
+
+# Reads the tourist beacons file as systems, keeping one per system name
+def read_tourist_systems(filename):
+  systems = {}
+  with io.open(filename, 'r', encoding='cp1252', errors='replace') as f:
+    for line in f:
+      values = line.split(',')
+      try:
+        name = values[2]
+        x, y, z = float(values[3]), float(values[4]), float(values[5])
+      except (IndexError, ValueError):
+        continue
+      if name.lower() not in systems:
+        systems[name.lower()] = system.KnownSystem({'name': name, 'x': x, 'y': y, 'z': z, 'id64': None})
+  return list(systems.values())
+
+
+def get_length(route):
+  return sum((route[i+1].position - route[i].position).length for i in range(len(route)-1))
+
+
+def solve(systems, mode, jump_range):
+  c = calc.Calc(jump_range = jump_range)
+  s = solver.Solver(c, None, jump_range, 1.5, processes = 1, seed = 1)
+  start = systems[0]
+  teststart = time.time()
+  route, _ = s.solve(systems[1:], start, start, len(systems) + 1, mode)
+  duration = time.time() - teststart
+  if route is None or len(route) != len(systems) + 1:
+    return None
+  return (get_length(route), c.solve_route_cost(route), duration)
+
+
+# Each mode runs in its own process so that any which blow up on big problems can be given up on
+def run_test(systems, modes, jump_range, timeout = default_timeout):
+  print("Solving a round trip from {0} via {1} systems at {2:.2f}Ly".format(systems[0].name, len(systems) - 1, jump_range))
+  print("")
+  for mode in modes:
+    pool = multiprocessing.Pool(1)
+    try:
+      result = pool.apply_async(solve, (systems, mode, jump_range)).get(timeout)
+    except multiprocessing.TimeoutError:
+      print("{0:>18}: gave up after {1:.0f}s".format(mode, timeout))
+      continue
+    finally:
+      pool.terminate()
+      pool.join()
+    if result is None:
+      print("{0:>18}: no complete route found".format(mode))
+    else:
+      print("{0:>18}: length {1:10.1f}Ly, cost {2:10.0f}, time {3:.3f}s".format(mode, *result))
+
+
+# Test modes
+if __name__ == '__main__':
+  if len(sys.argv) >= 2:
+    if sys.argv[1] == "tourist":
+      # solver_test.py tourist [filename] [mode ...]
+      filename = sys.argv[2] if len(sys.argv) > 2 else default_filename
+      modes = sys.argv[3:] if len(sys.argv) > 3 else default_modes
+      run_test(read_tourist_systems(filename), modes, 50.0)
+
+    elif sys.argv[1] == "random":
+      # solver_test.py random count [mode ...]
+      import random
+      random.seed(1)
+      count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+      modes = sys.argv[3:] if len(sys.argv) > 3 else [solver.NEAREST_NEIGHBOUR, solver.LARGE]
+      systems = [system.KnownSystem({'name': 'Test {0}'.format(i), 'x': random.uniform(-5000, 5000), 'y': random.uniform(-1000, 1000), 'z': random.uniform(-5000, 30000), 'id64': None}) for i in range(count)]
+      run_test(systems, modes, 50.0)
+
@@ -0,0 +1,153 @@
+import math
+
+
+# A uniform grid of points, for fast "what's near here?" queries
+# Each entry is stored alongside its coordinates, so queries don't need to touch the objects themselves
+class SpatialGrid(object):
+  def __init__(self, cell_size):
+    self._cell_size = float(cell_size)
+    self._cells = {}
+    self._count = 0
+
+  def __len__(self):
+    return self._count
+
+  @property
+  def cell_size(self):
+    return self._cell_size
+
+  def get_cell(self, pos):
+    cs = self._cell_size
+    return (int(math.floor(pos[0] / cs)), int(math.floor(pos[1] / cs)), int(math.floor(pos[2] / cs)))
+
+  def insert(self, obj, pos):
+    cell = self.get_cell(pos)
+    if cell not in self._cells:
+      self._cells[cell] = []
+    self._cells[cell].append((obj, pos[0], pos[1], pos[2]))
+    self._count += 1
+
+  def cells(self):
+    return self._cells.items()
+
+  def get_cell_entries(self, cell):
+    return self._cells.get(cell, [])
+
+  # Gets the entries within radius of pos, as tuples of (obj, distance)
+  def get_near(self, pos, radius):
+    x, y, z = pos[0], pos[1], pos[2]
+    rsq = radius * radius
+    cmin = self.get_cell((x - radius, y - radius, z - radius))
+    cmax = self.get_cell((x + radius, y + radius, z + radius))
+    span = (cmax[0] - cmin[0] + 1) * (cmax[1] - cmin[1] + 1) * (cmax[2] - cmin[2] + 1)
+    if span > len(self._cells):
+      # Big queries over sparse grids are quicker checking the cells that exist than the ones that might
+      cells = [entries for cell, entries in self._cells.items() if all(cmin[i] <= cell[i] <= cmax[i] for i in range(3))]
+    else:
+      cells = [self._cells.get((cx, cy, cz), []) for cx in range(cmin[0], cmax[0] + 1) for cy in range(cmin[1], cmax[1] + 1) for cz in range(cmin[2], cmax[2] + 1)]
+    result = []
+    for entries in cells:
+      for (obj, ox, oy, oz) in entries:
+        dx = ox - x
+        dy = oy - y
+        dz = oz - z
+        dsq = dx*dx + dy*dy + dz*dz
+        if dsq < rsq:
+          result.append((obj, math.sqrt(dsq)))
+    return result
+
+  # Gets every pair of entries closer than radius to each other, as tuples of (obj1, obj2, distance)
+  # radius must be no larger than the cell size
+  def get_pairs(self, radius):
+    if radius > self._cell_size:
+      raise ValueError("get_pairs radius cannot be larger than the grid's cell size")
+    rsq = radius * radius
+    # Only look "forwards" at half of the neighbouring cells, so each pair is only found once
+    offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+    for (cx, cy, cz), entries in self._cells.items():
+      for i, (obj1, x1, y1, z1) in enumerate(entries):
+        for (obj2, x2, y2, z2) in entries[i+1:]:
+          dx = x2 - x1
+          dy = y2 - y1
+          dz = z2 - z1
+          dsq = dx*dx + dy*dy + dz*dz
+          if dsq < rsq:
+            yield (obj1, obj2, math.sqrt(dsq))
+      for (ox, oy, oz) in offsets:
+        others = self._cells.get((cx + ox, cy + oy, cz + oz))
+        if not others:
+          continue
+        for (obj1, x1, y1, z1) in entries:
+          for (obj2, x2, y2, z2) in others:
+            dx = x2 - x1
+            dy = y2 - y1
+            dz = z2 - z1
+            dsq = dx*dx + dy*dy + dz*dz
+            if dsq < rsq:
+              yield (obj1, obj2, math.sqrt(dsq))
+
+
+# A uniform grid of spheres, for fast "which of these contain this point?" queries
+# Each sphere is listed in every cell its bounding box touches, and results come back in the order the spheres
+# were inserted, so callers can use insertion order as a priority
+# Several spheres can be inserted for the same object (e.g. a cluster); it's only returned once
+class SphereGrid(object):
+  # Bounding boxes are grown a touch so rounding can never leave a sphere out of a cell it reaches
+  _padding = 0.01
+
+  def __init__(self, cell_size):
+    self._cell_size = float(cell_size)
+    self._cells = {}
+    self._entries = []
+
+  def __len__(self):
+    return len(self._entries)
+
+  @property
+  def cell_size(self):
+    return self._cell_size
+
+  def get_cell(self, pos):
+    cs = self._cell_size
+    return (int(math.floor(pos[0] / cs)), int(math.floor(pos[1] / cs)), int(math.floor(pos[2] / cs)))
+
+  def insert(self, obj, centre, radius):
+    idx = len(self._entries)
+    x, y, z = centre[0], centre[1], centre[2]
+    self._entries.append((obj, x, y, z, radius))
+    pad = radius + self._padding
+    cmin = self.get_cell((x - pad, y - pad, z - pad))
+    cmax = self.get_cell((x + pad, y + pad, z + pad))
+    for cx in range(cmin[0], cmax[0] + 1):
+      for cy in range(cmin[1], cmax[1] + 1):
+        for cz in range(cmin[2], cmax[2] + 1):
+          if (cx, cy, cz) not in self._cells:
+            self._cells[(cx, cy, cz)] = []
+          self._cells[(cx, cy, cz)].append(idx)
+
+  # Gets the objects with a sphere which might contain pos, for the caller to check
+  def get_candidates(self, pos):
+    return self._get_objects(self._cells.get(self.get_cell(pos), []))
+
+  # Gets the objects with a sphere which contains pos, including its surface
+  def get_containing(self, pos):
+    x, y, z = pos[0], pos[1], pos[2]
+    idxs = []
+    for idx in self._cells.get(self.get_cell(pos), []):
+      _, ox, oy, oz, radius = self._entries[idx]
+      dx = ox - x
+      dy = oy - y
+      dz = oz - z
+      if math.sqrt(dx*dx + dy*dy + dz*dz) <= radius:
+        idxs.append(idx)
+    return self._get_objects(idxs)
+
+  def _get_objects(self, idxs):
+    result = []
+    seen = set()
+    for idx in idxs:
+      obj = self._entries[idx][0]
+      if id(obj) not in seen:
+        seen.add(id(obj))
+        result.append(obj)
+    return result
@@ -1,7 +1,7 @@
 import env
 import pgnames
 import util
-from system_internal import System, KnownSystem, PGSystem, PGSystemPrototype, calculate_from_id64, mask_id64_as_system, mask_id64_as_body
+from system_internal import System, KnownSystem, PGSystem, PGSystemPrototype, calculate_from_id64, calculate_from_id64s, calculate_id64s, mask_id64_as_system, mask_id64_as_body
 
 
 def from_id64(id, allow_ha = True, allow_known = True):
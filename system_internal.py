@@ -190,3 +190,80 @@ def calculate_id64(pos, mcode, n2):
   output = util.pack_and_shift(output, mc, 3)
   return output
 
+
+# The bit layout of an id64 for each mass code (0-7 for a-h), as used by the batch functions below
+# Each axis is stored as a sector coordinate with (7 - mc) bits of boxel coordinate below it, so can be
+# pulled out as one field; N2 takes up whatever is left below the body ID
+def _get_id64_layout(mc):
+  boxel_bits = 7 - mc
+  boxel_size = 10 * (2**mc)
+  return {
+    'boxel_size': boxel_size,
+    'half_size': boxel_size / 2,
+    'z_shift': 3, 'z_mask': 2**(7 + boxel_bits) - 1,
+    'y_shift': 10 + boxel_bits, 'y_mask': 2**(6 + boxel_bits) - 1,
+    'x_shift': 16 + 2*boxel_bits, 'x_mask': 2**(7 + boxel_bits) - 1,
+    'n2_shift': 23 + 3*boxel_bits, 'n2_mask': 2**(55 - (23 + 3*boxel_bits)) - 1,
+  }
+
+_id64_layouts = [_get_id64_layout(mc) for mc in range(8)]
+
+
+# Batch version of calculate_from_id64, giving the same results without building a Vector3 for each one
+# Returns a tuple of lists: X, Y and Z coordinates, boxel sizes, N2 values and body IDs
+def calculate_from_id64s(inputs):
+  ox, oy, oz = sector.internal_origin_offset
+  xs = []
+  ys = []
+  zs = []
+  boxel_sizes = []
+  n2s = []
+  body_ids = []
+  for input in inputs:
+    # If input is a string, assume hex
+    if util.is_str(input):
+      input = int(input, 16)
+    layout = _id64_layouts[input & 7]
+    size = layout['boxel_size']
+    half = layout['half_size']
+    # Each axis is (sector * sector_size) + (boxel * boxel_size), which is always a whole number of boxels
+    xs.append(float(((input >> layout['x_shift']) & layout['x_mask']) * size) + half + ox)
+    ys.append(float(((input >> layout['y_shift']) & layout['y_mask']) * size) + half + oy)
+    zs.append(float(((input >> layout['z_shift']) & layout['z_mask']) * size) + half + oz)
+    boxel_sizes.append(size)
+    n2s.append((input >> layout['n2_shift']) & layout['n2_mask'])
+    body_ids.append((input >> 55) & (2**9 - 1))
+  return (xs, ys, zs, boxel_sizes, n2s, body_ids)
+
+
+# Batch version of calculate_id64; mcodes and n2s can be lists with one entry per position, or a single value for all
+def calculate_id64s(positions, mcodes, n2s):
+  positions = list(positions)
+  if util.is_str(mcodes) or not hasattr(mcodes, '__iter__'):
+    mcodes = [mcodes] * len(positions)
+  if not hasattr(n2s, '__iter__'):
+    n2s = [n2s] * len(positions)
+  ox, oy, oz = sector.internal_origin_offset
+  # Only work out each mass code's details once
+  mcode_info = {}
+  output = []
+  for pos, mcode, n2 in zip(positions, mcodes, n2s):
+    if mcode not in mcode_info:
+      mc = ord(sector.get_mcode(mcode)) - ord('a')
+      boxel_bits = 7 - mc
+      mcode_info[mcode] = (mc & 7, sector.get_mcode_cube_width(mcode), boxel_bits, 2**(7 + boxel_bits) - 1, 2**(6 + boxel_bits) - 1)
+    mc, cube_width, boxel_bits, xz_mask, y_mask = mcode_info[mcode]
+    p = util.get_as_position(pos)
+    if p is None:
+      raise ValueError("could not get a position from input {}".format(pos))
+    x, y, z = float(p.x), float(p.y), float(p.z)
+    # Boxel origin relative to the internal origin, in boxels
+    bx = int(((x - ((x - ox) % cube_width)) - ox) / cube_width)
+    by = int(((y - ((y - oy) % cube_width)) - oy) / cube_width)
+    bz = int(((z - ((z - oz) % cube_width)) - oz) / cube_width)
+    output.append(((int(n2) & 0xFFFF) << (23 + 3*boxel_bits))
+                  | ((bx & xz_mask) << (16 + 2*boxel_bits))
+                  | ((by & y_mask) << (10 + boxel_bits))
+                  | ((bz & xz_mask) << 3)
+                  | mc)
+  return output
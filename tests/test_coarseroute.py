@@ -0,0 +1,129 @@
+import contextlib
+import heapq
+import math
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coarseroute
+import env
+import system_internal as system
+import vector3
+
+_jump_range = 50.0
+
+
+# Stars are kept in buckets, so counting a cell doesn't look at every star
+class _Env(object):
+  def __init__(self, stars, bucket_size):
+    self._bucket_size = bucket_size
+    self._buckets = {}
+    for s in stars:
+      self._buckets.setdefault(self._get_bucket(s.position), []).append(s)
+
+  def _get_bucket(self, pos):
+    return tuple(int(math.floor(pos[i] / self._bucket_size)) for i in range(3))
+
+  def find_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    lo = [min(vec_from[i], vec_to[i]) - buffer_from for i in range(3)]
+    hi = [max(vec_from[i], vec_to[i]) + buffer_to for i in range(3)]
+    blo = self._get_bucket(lo)
+    bhi = self._get_bucket(hi)
+    result = []
+    for x in range(blo[0], bhi[0] + 1):
+      for y in range(blo[1], bhi[1] + 1):
+        for z in range(blo[2], bhi[2] + 1):
+          result += [s for s in self._buckets.get((x, y, z), []) if all(lo[i] <= s.position[i] < hi[i] for i in range(3))]
+    return result
+
+  def count_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    return len(self.find_systems_by_aabb(vec_from, vec_to, buffer_from, buffer_to))
+
+
+class CoarseRouterTest(unittest.TestCase):
+  def setUp(self):
+    self.router = coarseroute.CoarseRouter()
+    self.old_use = env.use
+
+  def tearDown(self):
+    env.use = self.old_use
+
+  # Fills a block of cells with random numbers of stars, leaving some empty to route around
+  def _set_stars(self, seed, size):
+    rng = random.Random(seed)
+    stars = []
+    cs = self.router.cell_size
+    for x in range(size[0]):
+      for y in range(size[1]):
+        for z in range(size[2]):
+          if (x, y, z) not in [(0, 0, 0), tuple(c - 1 for c in size)] and rng.random() < 0.25:
+            continue
+          origin = self.router.get_cell_origin((x, y, z))
+          for i in range(rng.choice([1, 20, 80, 200])):
+            pos = origin + vector3.Vector3(rng.uniform(0, cs), rng.uniform(0, cs), rng.uniform(0, cs))
+            stars.append(system.System(pos.x, pos.y, pos.z, 'Test {0}.{1}.{2}.{3}'.format(x, y, z, i)))
+    fake = _Env(stars, cs)
+    env.use = contextlib.contextmanager(lambda *args, **kwargs: (yield fake))
+    return fake
+
+  def _get_step_cost(self, fake, a, b):
+    cost_a = self.router._get_cell_cost(fake, a, _jump_range)
+    cost_b = self.router._get_cell_cost(fake, b, _jump_range)
+    return math.sqrt(sum((a[i] - b[i])**2 for i in range(3))) * (cost_a + cost_b) / 2.0
+
+  # Plain Dijkstra over the same cells, for comparison
+  def _get_best_cost(self, fake, cell_from, cell_to, size):
+    dist = {cell_from: 0.0}
+    queue = [(0.0, cell_from)]
+    while queue:
+      d, cur = heapq.heappop(queue)
+      if cur == cell_to:
+        return d
+      if d > dist[cur]:
+        continue
+      for dx, dy, dz in coarseroute._neighbour_offsets:
+        n = (cur[0] + dx, cur[1] + dy, cur[2] + dz)
+        if not all(0 <= n[i] < size[i] for i in range(3)) or self.router._get_cell_cost(fake, n, _jump_range) is None:
+          continue
+        nd = d + self._get_step_cost(fake, cur, n)
+        if nd < dist.get(n, float('inf')):
+          dist[n] = nd
+          heapq.heappush(queue, (nd, n))
+    return None
+
+  def test_plan_matches_brute_force(self):
+    size = (6, 3, 5)
+    for seed in range(5):
+      self.router = coarseroute.CoarseRouter()
+      fake = self._set_stars(seed, size)
+      cell_from = (0, 0, 0)
+      cell_to = tuple(c - 1 for c in size)
+      expected = self._get_best_cost(fake, cell_from, cell_to, size)
+      cells = self.router.plan_cells(self.router.get_cell_centre(cell_from), self.router.get_cell_centre(cell_to), _jump_range)
+      if expected is None:
+        self.assertIsNone(cells)
+        continue
+      self.assertEqual((cells[0], cells[-1]), (cell_from, cell_to))
+      cost = sum(self._get_step_cost(fake, a, b) for a, b in zip(cells, cells[1:]))
+      self.assertAlmostEqual(cost, expected, places = 6)
+      # The heuristic is a lower bound on the cost
+      distance = (self.router.get_cell_centre(cell_from) - self.router.get_cell_centre(cell_to)).length
+      self.assertLessEqual(distance / _jump_range, cost)
+
+  def test_waypoints_in_cells(self):
+    size = (6, 2, 2)
+    fake = self._set_stars(10, size)
+    sys_from = fake.find_systems_by_aabb(self.router.get_cell_origin((0, 0, 0)), self.router.get_cell_origin((1, 1, 1)))[0]
+    sys_to = fake.find_systems_by_aabb(self.router.get_cell_origin((5, 1, 1)), self.router.get_cell_origin((6, 2, 2)))[0]
+    waypoints = self.router.plan(sys_from, sys_to, _jump_range)
+    self.assertEqual((waypoints[0], waypoints[-1]), (sys_from, sys_to))
+    cells = [self.router.get_cell(w.position) for w in waypoints]
+    for a, b in zip(cells, cells[1:]):
+      self.assertLessEqual(max(abs(a[i] - b[i]) for i in range(3)), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import components
+import system_internal as system
+
+
+class ComponentIndexTest(unittest.TestCase):
+  def test_bridge_without_id64_joins_components(self):
+    left = system.System(0.0, 0.0, 0.0, 'Left', id64 = 1)
+    bridge = system.System(10.0, 0.0, 0.0, 'Bridge')
+    right = system.System(20.0, 0.0, 0.0, 'Right', id64 = 2)
+    far = system.System(100.0, 0.0, 0.0, 'Far', id64 = 3)
+    self.assertIsNone(bridge.id64)
+    index = components.ComponentIndex.build([left, bridge, right, far], [15.0])
+    self.assertEqual(index.system_count, 3)
+    self.assertTrue(index.can_connect(left, right, 15.0))
+    self.assertEqual(index.get_component(left, 15.0), index.get_component(right, 15.0))
+    self.assertFalse(index.can_connect(left, far, 15.0))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import corridor
+import system_internal as system
+import vector3
+
+
+class _Source(object):
+  def __init__(self, stars):
+    self._stars = stars
+
+  def find_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    lo = [min(a, b) - buffer_from for a, b in zip(vec_from, vec_to)]
+    hi = [max(a, b) + buffer_to for a, b in zip(vec_from, vec_to)]
+    return [s for s in self._stars if all(l <= p <= h for l, p, h in zip(lo, s.position, hi))]
+
+
+class CorridorTest(unittest.TestCase):
+  def test_tile_behind_frontier_is_kept(self):
+    stars = [system.System(float(x), 0.0, 0.0, 'Test {0}'.format(x)) for x in range(0, 2000, 20)]
+    c = corridor.Corridor(vector3.Vector3(0, 0, 0), vector3.Vector3(2000, 0, 0), 50.0, source = _Source(stars))
+    c.advance(vector3.Vector3(1500, 0, 0))
+    before = c.fetch_count
+    first = c.get_stars_near(vector3.Vector3(100, 0, 0), 10.0)
+    second = c.get_stars_near(vector3.Vector3(100, 0, 0), 10.0)
+    self.assertEqual(c.fetch_count, before + 1)
+    self.assertEqual([s.name for s in first], [s.name for s in second])
+    self.assertEqual(len(first), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
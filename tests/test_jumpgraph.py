@@ -0,0 +1,74 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calc
+import jumpgraph
+import routing
+import system_internal as system
+
+_max_range = 20.0
+
+
+class JumpGraphTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    rng = random.Random(1)
+    cls.systems = [system.System(rng.uniform(0, 100), rng.uniform(0, 40), rng.uniform(0, 40), 'Test {0}'.format(i), id64 = i + 1) for i in range(200)]
+    cls.graph = jumpgraph.JumpGraph.build(cls.systems, _max_range)
+
+  def _get_expected(self, i, jump_range):
+    return sorted(j for j, s in enumerate(self.systems) if j != i and self.systems[i].distance_to(s) <= jump_range)
+
+  def test_edges_match_brute_force(self):
+    for jump_range in [_max_range, 12.0]:
+      for i in range(self.graph.node_count):
+        edges = list(self.graph.get_edges(i, jump_range))
+        self.assertEqual(sorted(j for j, _ in edges), self._get_expected(i, jump_range))
+        # Shortest first, so shorter ranges can stop reading early
+        self.assertEqual([l for _, l in edges], sorted(l for _, l in edges))
+
+  def test_lookup_by_system(self):
+    for i in [0, 57, 199]:
+      node = self.graph.get_node(i)
+      self.assertEqual((node.name, node.id64), (self.systems[i].name, self.systems[i].id64))
+      self.assertEqual(self.graph.index_of(self.systems[i]), i)
+      self.assertIn(self.systems[i], self.graph)
+    self.assertNotIn(system.System(500.0, 0.0, 0.0, 'Test 0'), self.graph)
+    self.assertTrue(self.graph.can_route(self.systems[0], self.systems[1], _max_range))
+    self.assertFalse(self.graph.can_route(self.systems[0], self.systems[1], _max_range + 1))
+
+  def test_save_and_load(self):
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+      self.graph.save(filename)
+      loaded = jumpgraph.JumpGraph.load(filename)
+    finally:
+      os.remove(filename)
+    self.assertEqual((loaded.node_count, loaded.edge_count, loaded.max_range), (self.graph.node_count, self.graph.edge_count, self.graph.max_range))
+    for i in range(self.graph.node_count):
+      self.assertEqual([j for j, _ in loaded.get_edges(i)], [j for j, _ in self.graph.get_edges(i)])
+      self.assertEqual(loaded.get_node(i).id64, self.systems[i].id64)
+
+  def test_astar_on_graph_matches_search(self):
+    calculator = calc.Calc(jump_range = 15.0)
+    with_graph = routing.Routing(calculator, 40.0, 10.0, 'astar')
+    with_graph.set_jump_graph(self.graph)
+    rng = random.Random(2)
+    for _ in range(10):
+      sys_from, sys_to = rng.sample(self.systems, 2)
+      # The same search over the same stars, just found a different way
+      expected = calc.astar(self.systems, sys_from, sys_to, lambda n, current: n != current and n.distance_to(current) < 15.0, lambda cur, n, path: calculator.astar_cost(cur, n, path, 15.0))
+      route = with_graph.plot(sys_from, sys_to, 15.0)
+      self.assertEqual(route is None, expected is None)
+      if route is not None:
+        self.assertEqual(len(route), len(expected))
+
+
+if __name__ == '__main__':
+  unittest.main()
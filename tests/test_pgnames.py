@@ -0,0 +1,40 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pgnames
+import vector3
+
+
+class BatchNamesTest(unittest.TestCase):
+  def setUp(self):
+    self.old_table = (pgnames._sector_table, pgnames._sector_table_checked)
+    pgnames.set_sector_table(None)
+    pgnames.clear_sector_cache()
+
+  def tearDown(self):
+    pgnames._sector_table, pgnames._sector_table_checked = self.old_table
+    pgnames.clear_sector_cache()
+
+  def test_c2_batch_matches_single(self):
+    offsets = [o for o in range(0, 200000, 37) if pgnames._get_c1_or_c2(o) == 2]
+    names = pgnames._c2_get_names_from_offsets(offsets)
+    self.assertEqual(names, [pgnames._c2_get_name_from_offset(o) for o in offsets])
+    self.assertEqual(pgnames._c2_get_offsets_from_names(names, use_table=False), [pgnames._c2_get_offset_from_name(n, use_table=False) for n in names])
+    self.assertEqual(pgnames._c2_get_offsets_from_names([['Bad', 'Name', 'Xyz', 'Abc']], use_table=False), [None])
+
+  def test_sector_names_match_single(self):
+    rng = random.Random(1)
+    positions = [vector3.Vector3(rng.uniform(-20000, 20000), rng.uniform(-1000, 1000), rng.uniform(-10000, 50000)) for _ in range(300)]
+    names, classes, _ = pgnames.get_sector_names(positions)
+    pgnames.clear_sector_cache()
+    self.assertEqual(names, [pgnames.get_sector_name(p) for p in positions])
+    frags, _, _ = pgnames.get_sector_names(positions[:10], format_output=False)
+    self.assertEqual([pgnames.format_sector_name(f) for f in frags], names[:10])
+
+
+if __name__ == '__main__':
+  unittest.main()
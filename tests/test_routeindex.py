@@ -0,0 +1,112 @@
+import array
+import heapq
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calc
+import jumpgraph
+import routeindex
+import routing
+import system_internal as system
+
+_jump_range = 15.0
+
+
+class RouteIndexTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    rng = random.Random(1)
+    cls.systems = [system.System(rng.uniform(0, 100), rng.uniform(0, 30), rng.uniform(0, 30), 'Test {0}'.format(i)) for i in range(200)]
+    cls.graph = jumpgraph.JumpGraph.build(cls.systems, _jump_range)
+    cls.calc = calc.Calc(jump_range = _jump_range)
+    cls.jump_cost = routeindex.get_jump_cost(cls.calc)
+    cls.index = routeindex.RouteIndex.build(cls.graph, _jump_range, cls.jump_cost)
+    rng = random.Random(2)
+    cls.pairs = [tuple(rng.sample(range(cls.graph.node_count), 2)) for _ in range(50)]
+
+  def _get_weight(self, i, j):
+    return self.jump_cost + self.graph.get_distance(i, j)
+
+  # Plain Dijkstra over the whole graph, to check the index against
+  def _get_best_cost(self, src, dst):
+    dist = {src: 0.0}
+    queue = [(0.0, src)]
+    while queue:
+      d, u = heapq.heappop(queue)
+      if u == dst:
+        return d
+      if d > dist[u]:
+        continue
+      for v, _ in self.graph.get_edges(u, _jump_range):
+        if self.graph.get_distance(u, v) >= _jump_range:
+          continue
+        nd = d + self._get_weight(u, v)
+        if nd < dist.get(v, float('inf')):
+          dist[v] = nd
+          heapq.heappush(queue, (nd, v))
+    return None
+
+  def test_query_matches_dijkstra(self):
+    for src, dst in self.pairs:
+      expected = self._get_best_cost(src, dst)
+      cost, path = self.index.query(src, dst)
+      if expected is None:
+        self.assertIsNone(path)
+        continue
+      self.assertAlmostEqual(cost, expected, places = 6)
+      # Shortcuts should be fully unpacked into real jumps which add up to the cost
+      self.assertEqual((path[0], path[-1]), (src, dst))
+      for i, j in zip(path, path[1:]):
+        self.assertLess(self.graph.get_distance(i, j), _jump_range)
+      self.assertAlmostEqual(sum(self._get_weight(i, j) for i, j in zip(path, path[1:])), expected, places = 6)
+
+  # astar includes a path-dependent variance term, so isn't always optimal on jump count; the index should
+  # find a route whenever it does, and never a longer one
+  def test_routes_match_astar(self):
+    r = routing.Routing(self.calc, 20.0, 10.0, 'astar')
+    r.set_jump_graph(self.graph)
+    for src, dst in self.pairs:
+      sys_from = self.graph.get_node(src)
+      sys_to = self.graph.get_node(dst)
+      route = self.index.get_route(sys_from, sys_to)
+      expected = r.plot(sys_from, sys_to, _jump_range)
+      if expected is None:
+        self.assertIsNone(route)
+        continue
+      self.assertEqual((route[0], route[-1]), (sys_from, sys_to))
+      self.assertLessEqual(len(route), len(expected))
+
+  def test_save_and_load(self):
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+      self.index.save(filename)
+      loaded = routeindex.RouteIndex.load(filename, self.graph)
+    finally:
+      os.remove(filename)
+    self.assertTrue(loaded.matches(self.graph, _jump_range, self.jump_cost))
+    for src, dst in self.pairs:
+      self.assertEqual(loaded.query(src, dst), self.index.query(src, dst))
+
+  def test_plot_ch_falls_back_without_index_path(self):
+    n = self.graph.node_count
+    # An index with no edges at all, as a stand-in for a stale or partial one
+    empty = routeindex.RouteIndex(self.graph, array.array(routeindex._u32, [0] * (n + 1)), array.array(routeindex._u32), array.array('d'), array.array(routeindex._i32), _jump_range, self.jump_cost)
+    r = routing.Routing(self.calc, 20.0, 10.0, 'ch')
+    r.set_jump_graph(self.graph)
+    r.set_route_index(empty)
+    for src, dst in self.pairs:
+      sys_from = self.graph.get_node(src)
+      sys_to = self.graph.get_node(dst)
+      self.assertIsNone(empty.get_route(sys_from, sys_to))
+      if self.index.get_route(sys_from, sys_to) is not None:
+        self.assertIsNotNone(r.plot(sys_from, sys_to, _jump_range))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+import os
+import pickle
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calc
+import jumpgraph
+import routing
+import system_internal as system
+
+
+class _Source(object):
+  tile_size = 100.0
+
+  def __init__(self, stars):
+    self._stars = stars
+    self.fetch_count = 0
+
+  def find_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    self.fetch_count += 1
+    lo = [min(a, b) - buffer_from for a, b in zip(vec_from, vec_to)]
+    hi = [max(a, b) + buffer_to for a, b in zip(vec_from, vec_to)]
+    return [s for s in self._stars if all(l <= p <= h for l, p, h in zip(lo, s.position, hi))]
+
+
+class GroupLegsTest(unittest.TestCase):
+  def setUp(self):
+    self.r = routing.Routing(calc.Calc(jump_range = 30.0), 40.0, 10.0, 'astar')
+    self.origin = system.System(0.0, 0.0, 0.0, 'Origin')
+
+  def _leg(self, x):
+    return (self.origin, system.System(x, 0.0, 0.0, 'Test {0}'.format(x)), 30.0, 30.0)
+
+  def test_short_legs_share_stars(self):
+    legs = [self._leg(100.0), self._leg(200.0)]
+    self.assertEqual(self.r._group_legs(legs), [[0, 1]])
+
+  def test_corridor_legs_are_plotted_alone(self):
+    legs = [self._leg(100.0), self._leg(200.0), self._leg(1500.0), self._leg(1600.0)]
+    self.assertEqual(sorted(self.r._group_legs(legs)), [[0, 1], [2], [3]])
+
+  def test_hierarchical_legs_are_plotted_alone(self):
+    self.r._corridor_min_length = None
+    self.r.set_hierarchical(min_length = 500.0)
+    legs = [self._leg(100.0), self._leg(200.0), self._leg(600.0), self._leg(700.0)]
+    self.assertEqual(sorted(self.r._group_legs(legs)), [[0, 1], [2], [3]])
+
+
+class AnytimeTest(unittest.TestCase):
+  def test_trunkle_fallback_reuses_stars(self):
+    rng = random.Random(1)
+    stars = [system.System(float(x), rng.uniform(-5, 5), rng.uniform(-5, 5), 'Test {0}'.format(x)) for x in range(0, 601, 12)]
+    r = routing.Routing(calc.Calc(jump_range = 30.0), 40.0, 10.0, 'trunkle')
+    source = _Source(stars)
+    r.set_tile_cache(source)
+    route, gap = r.plot_anytime(stars[0], stars[-1], 30.0)
+    self.assertIsNotNone(route)
+    self.assertIsNotNone(gap)
+    # One fetch for the initial greedy route, and one for trunkle; the greedy fallbacks reuse trunkle's stars
+    self.assertEqual(source.fetch_count, 2)
+
+
+class PlotManyTest(unittest.TestCase):
+  def setUp(self):
+    self.stars = [system.System(float(x), 0.0, 0.0, 'Test {0}'.format(x)) for x in range(0, 301, 10)]
+    self.r = routing.Routing(calc.Calc(jump_range = 30.0), 40.0, 10.0, 'astar')
+    self.r.set_tile_cache(_Source(self.stars))
+    self.old_pool = routing.multiprocessing.Pool
+
+  def tearDown(self):
+    routing.multiprocessing.Pool = self.old_pool
+
+  def test_few_legs_are_plotted_serially(self):
+    def no_pool(*args, **kwargs):
+      raise AssertionError("should not start a pool")
+    routing.multiprocessing.Pool = no_pool
+    legs = [(self.stars[0], self.stars[-1], 30.0, 30.0), (self.stars[-1], self.stars[5], 30.0, 30.0)]
+    routes = self.r.plot_many(legs, processes = 8)
+    self.assertEqual([(route[0], route[-1]) for route in routes], [(leg[0], leg[1]) for leg in legs])
+
+  def test_workers_only_get_settings(self):
+    graph = jumpgraph.JumpGraph.build(self.stars, 30.0)
+    graph.get_node(0)
+    self.r.set_jump_graph(graph)
+    # Anytime state may not even be picklable, and isn't needed by workers
+    self.r._anytime_callback = lambda route, gap: None
+    copy = pickle.loads(pickle.dumps(self.r))
+    self.assertIsNone(copy._anytime_callback)
+    self.assertEqual(copy._jump_graph._nodes, {})
+    self.assertEqual(copy._jump_graph.node_count, graph.node_count)
+
+
+class FindReachableTest(unittest.TestCase):
+  def test_layers_stop_when_nothing_new(self):
+    stars = [system.System(float(x), 0.0, 0.0, 'Test {0}'.format(x)) for x in range(0, 41, 10)]
+    r = routing.Routing(calc.Calc(jump_range = 15.0), 40.0, 10.0, 'astar')
+    r.set_tile_cache(_Source(stars))
+    layers = list(r.find_reachable(stars[0], 15.0, 10))
+    self.assertEqual([(jumps, [s.name for s in layer]) for jumps, layer in layers], [(i, [stars[i].name]) for i in range(5)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pgnames
+import sectortable
+
+# Only the bottom few layers of the galaxy, to keep the table quick to build
+_galaxy_size = [128, 128, 3]
+
+
+class SectorTableTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.tempdir = tempfile.mkdtemp()
+    filename = os.path.join(cls.tempdir, sectortable.default_filename)
+    sectortable.SectorTable.build(filename, _galaxy_size)
+    cls.table = sectortable.SectorTable.load(filename, _galaxy_size)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.table.close()
+    shutil.rmtree(cls.tempdir)
+
+  def setUp(self):
+    self.old_table = (pgnames._sector_table, pgnames._sector_table_checked)
+
+  def tearDown(self):
+    pgnames._sector_table, pgnames._sector_table_checked = self.old_table
+
+  def _get_offset(self, frags, sector_class):
+    if sector_class == 1:
+      return pgnames._c1_get_offset_from_name(frags)
+    else:
+      return pgnames._c2_get_offset_from_name(frags)
+
+  def test_lookups_match_calculation(self):
+    rng = random.Random(1)
+    offsets = rng.sample(range(self.table.sector_count), 2000)
+    pgnames.set_sector_table(None)
+    expected = {}
+    for offset in offsets:
+      frags, sector_class = pgnames._get_pg_name_from_offset(offset)
+      self.assertEqual(self.table.get_name(offset), (frags, sector_class))
+      expected[offset] = (frags, sector_class, self._get_offset(frags, sector_class))
+    pgnames.set_sector_table(self.table)
+    for offset in offsets:
+      frags, sector_class, calculated = expected[offset]
+      self.assertIn(self.table.get_offset(frags, sector_class), (None, calculated))
+      self.assertIsNone(self.table.get_offset(frags, 3 - sector_class))
+      self.assertEqual(self._get_offset(frags, sector_class), calculated)
+
+  def test_reverse_index_finds_every_indexed_name(self):
+    found = 0
+    for offset in range(self.table.sector_count):
+      name = self.table.get_name(offset)
+      if name is None:
+        continue
+      result = self.table.get_offset(*name)
+      # Names which don't lead back to the same sector are left out, rather than giving a different one
+      self.assertIn(result, (None, offset))
+      found += (result is not None)
+    self.assertGreater(found, self.table.sector_count * 0.9)
+    # The index is at most half full
+    slots = self.table._slot_mask + 1
+    entries = sum(1 for slot in range(slots) if struct.unpack_from('<I', self.table._mm, self.table._slots_start + slot * sectortable._slot_size)[0])
+    self.assertEqual(entries, found)
+    self.assertLessEqual(entries * 2, slots)
+
+  def test_bad_lookups(self):
+    frags, sector_class = self.table.get_name(0)
+    self.assertIsNone(self.table.get_offset(None, sector_class))
+    self.assertIsNone(self.table.get_offset(frags[:2], sector_class))
+    self.assertIsNone(self.table.get_offset(frags + ['Th', 'Eu'], sector_class))
+    self.assertIsNone(self.table.get_offset(['Notafragment'] + frags[1:], sector_class))
+    self.assertIsNone(self.table.get_name(-1))
+    self.assertIsNone(self.table.get_name(self.table.sector_count))
+
+  def test_load_rejects_mismatched_files(self):
+    filename = os.path.join(self.tempdir, sectortable.default_filename)
+    self.assertIsNone(sectortable.SectorTable.load(os.path.join(self.tempdir, 'missing.bin'), _galaxy_size))
+    self.assertIsNone(sectortable.SectorTable.load(filename, [128, 128, 4]))
+    with open(filename, 'rb') as f:
+      data = f.read()
+    broken = os.path.join(self.tempdir, 'broken.bin')
+    for contents in [data[:len(data) // 2], data[:4] + struct.pack('<I', sectortable._file_version + 1) + data[8:]]:
+      with open(broken, 'wb') as f:
+        f.write(contents)
+      self.assertIsNone(sectortable.SectorTable.load(broken, _galaxy_size))
+
+
+if __name__ == '__main__':
+  unittest.main()
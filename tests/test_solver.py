@@ -0,0 +1,85 @@
+import itertools
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calc
+import solver
+import system_internal as system
+
+
+def _get_systems(count, seed):
+  rng = random.Random(seed)
+  return [system.KnownSystem({'name': 'Test {0}'.format(i), 'x': rng.uniform(-500, 500), 'y': rng.uniform(-100, 100), 'z': rng.uniform(-500, 500), 'id64': None}) for i in range(count)]
+
+
+class BranchBoundTest(unittest.TestCase):
+  def test_completed_search_is_definitive(self):
+    for seed in range(6):
+      systems = _get_systems(15, seed)
+      start, stations = systems[0], systems[1:]
+      s = solver.Solver(calc.Calc(jump_range = 50.0), None, 50.0, 1.5, processes = 1, seed = 1)
+      route, is_definitive = s.solve(stations, start, start, len(stations) + 2, solver.BRANCH_BOUND)
+      self.assertTrue(is_definitive)
+      self.assertEqual(len(route), len(stations) + 2)
+      # With no time limit the search always runs to completion
+      _, cost, gap = s.solve_branch_bound_with_cost(stations, start, start, len(stations) + 2, time_limit = None)
+      self.assertEqual(gap, 0.0)
+      _, hk_cost = s.solve_held_karp_with_cost(stations, start, start, len(stations) + 2)
+      self.assertAlmostEqual(cost, hk_cost, places = 6)
+
+
+class HeldKarpTest(unittest.TestCase):
+  def _get_brute_force_cost(self, s, stations, start, end, count):
+    return min(s._solve_route_cost([start] + list(p) + [end]) for p in itertools.permutations(stations, count))
+
+  def test_matches_brute_force(self):
+    for seed in range(4):
+      systems = _get_systems(8, seed)
+      start, end, stations = systems[0], systems[1], systems[2:]
+      s = solver.Solver(calc.Calc(jump_range = 50.0), None, 50.0, 1.5, processes = 1)
+      for count in [len(stations), 4]:
+        route, cost = s.solve_held_karp_with_cost(stations, start, end, count + 2)
+        self.assertEqual((route[0], route[-1], len(route)), (start, end, count + 2))
+        self.assertEqual(len(set(route[1:-1])), count)
+        self.assertAlmostEqual(cost, s._solve_route_cost(route), places = 6)
+        self.assertAlmostEqual(cost, self._get_brute_force_cost(s, stations, start, end, count), places = 6)
+
+  def test_no_stops(self):
+    systems = _get_systems(3, 0)
+    s = solver.Solver(calc.Calc(jump_range = 50.0), None, 50.0, 1.5, processes = 1)
+    route, _ = s.solve_held_karp_with_cost(systems[2:], systems[0], systems[1], 2)
+    self.assertEqual(route, [systems[0], systems[1]])
+
+
+class _Route(object):
+  def __init__(self):
+    self.legs = []
+
+  def plot_many(self, legs, processes = None, share_stars = False):
+    self.legs += legs
+    return [[s, t] for s, t, _, _ in legs]
+
+
+class RouteLegsTest(unittest.TestCase):
+  def test_each_leg_plotted_once(self):
+    systems = _get_systems(6, 0)
+    route = _Route()
+    s = solver.Solver(calc.Calc(jump_range = 50.0), route, 50.0, 1.5, routed = True, processes = 1)
+    # The start and end are the same, and one station appears twice
+    stations = [systems[0], systems[0]] + systems[1:] + [systems[3]]
+    legs, jumps, _ = s._get_route_legs(stations)
+    self.assertEqual(len(route.legs), 15)
+    self.assertEqual(len(set((a, b) for a, b, _, _ in route.legs)), 15)
+    self.assertEqual(legs[systems[2]][systems[1]], [systems[2], systems[1]])
+    self.assertEqual(jumps[systems[1]][systems[4]], 1)
+    # Everything is cached now, so nothing more is plotted
+    s._get_route_legs(stations)
+    self.assertEqual(len(route.legs), 15)
+
+
+if __name__ == '__main__':
+  unittest.main()
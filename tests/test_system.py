@@ -0,0 +1,44 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import system_internal as system
+import vector3
+
+
+class Id64Test(unittest.TestCase):
+  def setUp(self):
+    rng = random.Random(1)
+    self.positions = [vector3.Vector3(rng.uniform(-40000, 40000), rng.uniform(-3000, 3000), rng.uniform(-20000, 60000)) for _ in range(500)]
+    self.mcodes = [rng.choice('abcdefgh') for _ in self.positions]
+    # Mass code a only leaves room for 11 bits of N2
+    self.n2s = [rng.randrange(0, 2048) for _ in self.positions]
+
+  def test_encode_matches_single(self):
+    id64s = system.calculate_id64s(self.positions, self.mcodes, self.n2s)
+    self.assertEqual(id64s, [system.calculate_id64(p, m, n) for p, m, n in zip(self.positions, self.mcodes, self.n2s)])
+    # A single mass code and N2 apply to every position
+    self.assertEqual(system.calculate_id64s(self.positions, 'c', 7), [system.calculate_id64(p, 'c', 7) for p in self.positions])
+
+  def test_decode_matches_single(self):
+    # Include some body IDs, which only the decoding cares about
+    id64s = [i | (b << 55) for i, b in zip(system.calculate_id64s(self.positions, self.mcodes, self.n2s), range(len(self.positions)))]
+    xs, ys, zs, sizes, n2s, body_ids = system.calculate_from_id64s(id64s)
+    for i, id64 in enumerate(id64s):
+      coords, size, n2, body_id = system.calculate_from_id64(id64)
+      self.assertAlmostEqual(xs[i], coords.x, places = 6)
+      self.assertAlmostEqual(ys[i], coords.y, places = 6)
+      self.assertAlmostEqual(zs[i], coords.z, places = 6)
+      self.assertEqual((sizes[i], n2s[i], body_ids[i]), (size, n2, body_id))
+    self.assertEqual(n2s, self.n2s)
+
+  def test_decode_hex_strings(self):
+    id64s = system.calculate_id64s(self.positions[:20], self.mcodes[:20], self.n2s[:20])
+    self.assertEqual(system.calculate_from_id64s(['{0:016X}'.format(i) for i in id64s]), system.calculate_from_id64s(id64s))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,93 @@
+import contextlib
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import env
+import system_internal as system
+import tilecache
+import vector3
+
+
+class _Env(object):
+  def __init__(self, stars):
+    self._stars = stars
+    self.queries = 0
+
+  def find_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    self.queries += 1
+    lo = [min(vec_from[i], vec_to[i]) - buffer_from for i in range(3)]
+    hi = [max(vec_from[i], vec_to[i]) + buffer_to for i in range(3)]
+    return [s for s in self._stars if all(lo[i] <= s.position[i] < hi[i] for i in range(3))]
+
+
+class TileCacheTest(unittest.TestCase):
+  def setUp(self):
+    rng = random.Random(1)
+    self.stars = [system.System(rng.uniform(0, 500), rng.uniform(0, 100), rng.uniform(0, 100), 'Test {0}'.format(i)) for i in range(2000)]
+    self.env = _Env(self.stars)
+    self.old_use = env.use
+    env.use = contextlib.contextmanager(lambda *args, **kwargs: (yield self.env))
+
+  def tearDown(self):
+    env.use = self.old_use
+
+  def _get_expected(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    lo = [min(vec_from[i], vec_to[i]) - buffer_from for i in range(3)]
+    hi = [max(vec_from[i], vec_to[i]) + buffer_to for i in range(3)]
+    return sorted(s.name for s in self.stars if all(lo[i] <= s.position[i] < hi[i] for i in range(3)))
+
+  def test_results_match_database(self):
+    cache = tilecache.TileCache()
+    rng = random.Random(2)
+    for _ in range(30):
+      a = vector3.Vector3(rng.uniform(0, 500), rng.uniform(0, 100), rng.uniform(0, 100))
+      b = vector3.Vector3(rng.uniform(0, 500), rng.uniform(0, 100), rng.uniform(0, 100))
+      self.assertEqual(sorted(s.name for s in cache.find_systems_by_aabb(a, b, 15.0, 15.0)), self._get_expected(a, b, 15.0, 15.0))
+
+  def test_overlapping_queries_fetch_once(self):
+    cache = tilecache.TileCache()
+    cache.find_systems_by_aabb(vector3.Vector3(0, 0, 0), vector3.Vector3(250, 50, 50))
+    self.assertEqual((cache.fetches, self.env.queries), (1, 1))
+    result = cache.find_systems_by_aabb(vector3.Vector3(10, 10, 10), vector3.Vector3(150, 40, 40))
+    self.assertEqual((cache.fetches, self.env.queries, cache.misses), (1, 1, len(cache)))
+    self.assertEqual(sorted(s.name for s in result), self._get_expected(vector3.Vector3(10, 10, 10), vector3.Vector3(150, 40, 40)))
+
+  def test_evicts_by_bytes(self):
+    one_tile = tilecache.TileCache()
+    one_tile.find_systems_by_aabb(vector3.Vector3(50, 50, 50), vector3.Vector3(50, 50, 50))
+    # Room for about two and a half tiles like the first
+    cache = tilecache.TileCache(max_bytes = int(one_tile.size_bytes * 2.5))
+    centres = [vector3.Vector3(x, 50, 50) for x in [50, 150, 250, 350]]
+    cache.find_systems_by_aabb(centres[0], centres[0])
+    cache.find_systems_by_aabb(centres[1], centres[1])
+    self.assertEqual(len(cache), 2)
+    # Using the first tile again makes the second one the oldest
+    cache.find_systems_by_aabb(centres[0], centres[0])
+    cache.find_systems_by_aabb(centres[2], centres[2])
+    self.assertLessEqual(cache.size_bytes, int(one_tile.size_bytes * 2.5))
+    self.assertEqual(sorted(cache._tiles.keys()), [(0, 0, 0), (2, 0, 0)])
+    fetches = cache.fetches
+    cache.find_systems_by_aabb(centres[0], centres[0])
+    self.assertEqual(cache.fetches, fetches)
+    cache.find_systems_by_aabb(centres[1], centres[1])
+    self.assertEqual(cache.fetches, fetches + 1)
+    cache.clear()
+    self.assertEqual((len(cache), cache.size_bytes), (0, 0))
+
+  def test_large_queries_bypass_cache(self):
+    cache = tilecache.TileCache(max_query_tiles = 4)
+    a = vector3.Vector3(0, 0, 0)
+    b = vector3.Vector3(450, 50, 50)
+    self.assertEqual(sorted(s.name for s in cache.find_systems_by_aabb(a, b)), self._get_expected(a, b))
+    self.assertEqual((len(cache), cache.size_bytes, cache.fetches, self.env.queries), (0, 0, 0, 1))
+    # Small enough to go through the cache
+    cache.find_systems_by_aabb(a, vector3.Vector3(150, 50, 50))
+    self.assertEqual((len(cache), cache.fetches), (2, 1))
+
+
+if __name__ == '__main__':
+  unittest.main()
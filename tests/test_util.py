@@ -0,0 +1,32 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util
+
+
+class InterleaveTest(unittest.TestCase):
+  def test_many_matches_single(self):
+    rng = random.Random(1)
+    vals1 = [rng.getrandbits(17) for _ in range(1000)]
+    vals2 = [rng.getrandbits(17) for _ in range(1000)]
+    packed = util.interleave_many(vals1, vals2, 32)
+    self.assertEqual(packed, [util.interleave(v1, v2, 32) for v1, v2 in zip(vals1, vals2)])
+    self.assertEqual(util.deinterleave_many(packed, 32), tuple(map(list, zip(*[util.deinterleave(v, 32) for v in packed]))))
+
+  def test_many_round_trip(self):
+    rng = random.Random(2)
+    vals1 = [rng.getrandbits(16) for _ in range(1000)]
+    vals2 = [rng.getrandbits(16) for _ in range(1000)]
+    self.assertEqual(util.deinterleave_many(util.interleave_many(vals1, vals2, 32), 32), (vals1, vals2))
+
+  def test_many_empty(self):
+    self.assertEqual(util.interleave_many([], [], 32), [])
+    self.assertEqual(util.deinterleave_many([], 32), ([], []))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,128 @@
+import collections
+import logging
+import math
+import env
+import util
+import vector3
+
+log = logging.getLogger("tilecache")
+
+default_tile_size = 100.0
+default_max_bytes = 256 * 1024 * 1024
+# Requests covering more tiles than this go straight to the database rather than through the cache
+default_max_query_tiles = 4096
+
+# Rough in-memory size of a KnownSystem, not counting its name
+_system_base_size = 700
+_tile_base_size = 200
+
+
+def _estimate_size(stars):
+  return _tile_base_size + sum(_system_base_size + len(s.name or '') for s in stars)
+
+
+# A cache of stars in fixed-size cubic tiles, in front of the environment's find_systems_by_aabb
+# Any AABB can be answered by fetching the tiles it touches, so overlapping queries (such as the legs
+# of a multi-stop route) only read each part of the database once
+# Tiles are evicted least-recently-used first once their estimated size passes max_bytes
+class TileCache(object):
+  def __init__(self, tile_size = default_tile_size, max_bytes = default_max_bytes, max_query_tiles = default_max_query_tiles):
+    self._tile_size = float(tile_size)
+    self._max_bytes = max_bytes
+    self._max_query_tiles = max_query_tiles
+    self._tiles = collections.OrderedDict()
+    self._bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.fetches = 0
+
+  # Tiles are local to a process; don't copy them to worker processes
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_tiles'] = collections.OrderedDict()
+    state['_bytes'] = 0
+    return state
+
+  @property
+  def tile_size(self):
+    return self._tile_size
+
+  @property
+  def size_bytes(self):
+    return self._bytes
+
+  def __len__(self):
+    return len(self._tiles)
+
+  def clear(self):
+    self._tiles.clear()
+    self._bytes = 0
+
+  def _get_tile(self, pos):
+    ts = self._tile_size
+    return (int(math.floor(pos[0] / ts)), int(math.floor(pos[1] / ts)), int(math.floor(pos[2] / ts)))
+
+  # Gets stars with the same semantics as Env.find_systems_by_aabb
+  def find_systems_by_aabb(self, vec_from, vec_to, buffer_from = 0.0, buffer_to = 0.0):
+    vec_from = util.get_as_position(vec_from)
+    vec_to = util.get_as_position(vec_to)
+    if vec_from is None or vec_to is None:
+      raise ValueError("could not get a position from input AABB coords")
+    vmin = [min(vec_from[i], vec_to[i]) - buffer_from for i in range(3)]
+    vmax = [max(vec_from[i], vec_to[i]) + buffer_to for i in range(3)]
+    tmin = self._get_tile(vmin)
+    tmax = self._get_tile(vmax)
+    tile_count = (tmax[0] - tmin[0] + 1) * (tmax[1] - tmin[1] + 1) * (tmax[2] - tmin[2] + 1)
+    if tile_count > self._max_query_tiles:
+      log.debug("AABB covers {} tiles, bypassing cache".format(tile_count))
+      with env.use() as envdata:
+        return envdata.find_systems_by_aabb(vector3.Vector3(vmin), vector3.Vector3(vmax))
+
+    keys = [(x, y, z) for x in range(tmin[0], tmax[0] + 1) for y in range(tmin[1], tmax[1] + 1) for z in range(tmin[2], tmax[2] + 1)]
+    missing = [k for k in keys if k not in self._tiles]
+    self.hits += len(keys) - len(missing)
+    self.misses += len(missing)
+    fetched = self._fetch_tiles(missing) if any(missing) else {}
+
+    result = []
+    for k in keys:
+      if k in fetched:
+        stars = fetched[k]
+      else:
+        # Mark as recently used
+        stars = self._tiles.pop(k)
+        self._tiles[k] = stars
+      # Tiles wholly inside the box don't need checking star by star
+      tile_lo = [k[i] * self._tile_size for i in range(3)]
+      tile_hi = [(k[i] + 1) * self._tile_size for i in range(3)]
+      if all(vmin[i] <= tile_lo[i] and tile_hi[i] <= vmax[i] for i in range(3)):
+        result += stars
+      else:
+        result += [s for s in stars if all(vmin[i] <= s.position[i] < vmax[i] for i in range(3))]
+    self._evict()
+    return result
+
+  # Fetches a set of tiles using a single query over their bounding box
+  def _fetch_tiles(self, keys):
+    kmin = [min(k[i] for k in keys) for i in range(3)]
+    kmax = [max(k[i] for k in keys) for i in range(3)]
+    ts = self._tile_size
+    wanted = set(keys)
+    tiles = dict((k, []) for k in keys)
+    with env.use() as envdata:
+      stars = envdata.find_systems_by_aabb(vector3.Vector3(kmin) * ts, (vector3.Vector3(kmax) + (1, 1, 1)) * ts)
+    self.fetches += 1
+    for s in stars:
+      k = self._get_tile(s.position)
+      if k in wanted:
+        tiles[k].append(s)
+    for k, tile_stars in tiles.items():
+      self._tiles[k] = tile_stars
+      self._bytes += _estimate_size(tile_stars)
+    log.debug("Fetched {} tiles ({} stars), cache now {} tiles / {:.1f}MB".format(len(keys), len(stars), len(self._tiles), self._bytes / 1048576.0))
+    return tiles
+
+  def _evict(self):
+    while self._bytes > self._max_bytes and len(self._tiles) > 0:
+      _, stars = self._tiles.popitem(last=False)
+      self._bytes -= _estimate_size(stars)
@@ -169,25 +169,69 @@ def unpack_and_shift(value, bits):
 def pack_and_shift(value, new_data, bits):
   return (value << bits) + (new_data & (2**bits-1))
 
+# Lookup tables for interleaving a byte at a time
+# _spread_bits[b] has the bits of b spread out to the even bits of a 16-bit value
+# _gather_bits[b] has the even and odd bits of b gathered into two 4-bit values
+_spread_bits = [sum(((b >> i) & 1) << (i*2) for i in range(8)) for b in range(256)]
+_gather_bits = [(sum(((b >> (i*2)) & 1) << i for i in range(4)), sum(((b >> (i*2+1)) & 1) << i for i in range(4))) for b in range(256)]
+
+def _spread(value):
+  output = 0
+  shift = 0
+  while value:
+    output |= _spread_bits[value & 0xFF] << shift
+    value >>= 8
+    shift += 16
+  return output
+
 # Interleaves two values, starting at least significant bit
 # e.g. (0b1111, 0b0000) --> (0b01010101)
+# Only the bottom (maxbits//2 + 1) bits of each value are used, before cutting the result down to maxbits
 def interleave(val1, val2, maxbits):
-  output = 0
-  for i in range(0, maxbits//2 + 1):
-    output |= ((val1 >> i) & 1) << (i*2)
-  for i in range(0, maxbits//2 + 1):
-    output |= ((val2 >> i) & 1) << (i*2 + 1)
-  return output & (2**maxbits - 1)
+  inmask = (1 << (maxbits//2 + 1)) - 1
+  return (_spread(val1 & inmask) | (_spread(val2 & inmask) << 1)) & (2**maxbits - 1)
 
 # Deinterleaves two values, starting at least significant bit
 # e.g. (0b00110010) --> (0b0100, 0b0101)
 def deinterleave(val, maxbits):
+  val &= (1 << maxbits) - 1
   out1 = 0
   out2 = 0
-  for i in range(0, maxbits, 2):
-    out1 |= ((val >> i) & 1) << (i//2)
-  for i in range(1, maxbits, 2):
-    out2 |= ((val >> i) & 1) << (i//2)
+  shift = 0
+  while val:
+    even, odd = _gather_bits[val & 0xFF]
+    out1 |= even << shift
+    out2 |= odd << shift
+    val >>= 8
+    shift += 4
+  return (out1, out2)
+
+# Interleaves each pair of values from two lists, as interleave
+def interleave_many(vals1, vals2, maxbits):
+  inmask = (1 << (maxbits//2 + 1)) - 1
+  outmask = (1 << maxbits) - 1
+  spread = _spread
+  return [(spread(v1 & inmask) | (spread(v2 & inmask) << 1)) & outmask for v1, v2 in zip(vals1, vals2)]
+
+# Deinterleaves each value in a list, as deinterleave, returning a tuple of two lists
+def deinterleave_many(vals, maxbits):
+  mask = (1 << maxbits) - 1
+  gather = _gather_bits
+  out1 = []
+  out2 = []
+  for val in vals:
+    val &= mask
+    v1 = 0
+    v2 = 0
+    shift = 0
+    while val:
+      even, odd = gather[val & 0xFF]
+      v1 |= even << shift
+      v2 |= odd << shift
+      val >>= 8
+      shift += 4
+    out1.append(v1)
+    out2.append(v2)
   return (out1, out2)
 
 